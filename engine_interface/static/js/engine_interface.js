@@ -1,7 +1,8 @@
 /**
  * Document Ready Function
- * - Sets the handler for the input box dropdown (AND/OR)
+ * - Sets the handler for the input box dropdown (AND/OR/RANKED)
  * - Define event handler for input search box
+ * - Loads the next page of results when scrolling to the bottom of the page
  */
 $(function () {
 
@@ -24,15 +25,23 @@ $(function () {
         } else {
             $('#btn-back-to-top').fadeOut();
         }
+
+        if ($(this).scrollTop() + $(this).height() >= $(document).height() - 200) {
+            search_next_page();
+        }
     });
 
 });
 
 
+// Query and option of the results displayed, and true while a page of results is being loaded
+var current_search = null;
+var loading_page = false;
+
 /**
  * Function to process query
  * - Perform validation for the query
- * - AJAX request to search the index
+ * - AJAX request to search the index (first page of results)
  */
 function search_collect(){
 
@@ -43,15 +52,18 @@ function search_collect(){
         return false;
     }
 
+    current_search = {
+        query_string: query,
+        option: $(".input-search-box > button.dropdown-toggle").val()
+    };
+
     var query_time = new Date().getTime();
     var results_contn = $("#results-container");
+    loading_page = true;
     $.ajax({
         url: 'search_query',
         method: 'GET',
-        data: {
-            query_string: query,
-            option: $(".input-search-box > button.dropdown-toggle").val()
-        },
+        data: $.extend({offset: 0}, current_search),
         beforeSend: function(){
             $("#search-btn").hide();
             $("#loading-img").show();
@@ -62,6 +74,7 @@ function search_collect(){
             scroll_to_container("#results-container");
             $("#results-details > span.time").text((new Date().getTime() - query_time)/1000 + "s");
             $("#results-details > span.doc-no-retrieved").text($("#tbl-results tr").length);
+            search_facets(current_search);
         },
         error: function(err){
             results_contn.hide();
@@ -70,6 +83,68 @@ function search_collect(){
         complete: function(){
             $("#loading-img").hide();
             $("#search-btn").show();
+            loading_page = false;
+        }
+    });
+
+}
+
+/**
+ * Function to load the next page of results of the current query, if any
+ * - AJAX request to search the index from the offset of the next page
+ * - Appends the docs of the page to the results table
+ */
+function search_next_page(){
+
+    var results_tbl = $("#tbl-results");
+    var next_offset = results_tbl.attr("data-next-offset");
+
+    if(loading_page || current_search === null || !next_offset){
+        return;
+    }
+
+    loading_page = true;
+    $.ajax({
+        url: 'search_query',
+        method: 'GET',
+        data: $.extend({offset: next_offset}, current_search),
+        beforeSend: function(){
+            $("#loading-img").show();
+        },
+        success: function(results_data){
+            var page_tbl = $("<div>").html(results_data).find("#tbl-results");
+            results_tbl.append(page_tbl.find("tr"));
+            results_tbl.attr("data-next-offset", page_tbl.attr("data-next-offset"));
+            $("#results-details > span.doc-no-retrieved").text($("#tbl-results tr").length);
+        },
+        error: function(){
+            // No more results for the query
+            results_tbl.attr("data-next-offset", "");
+        },
+        complete: function(){
+            $("#loading-img").hide();
+            loading_page = false;
+        }
+    });
+
+}
+
+/**
+ * Function to load the facet counts of the docs matched by a query, once its first page of results is shown
+ * - AJAX request to count the facets of the docs matched
+ * - Shows the counts above the results if the query is still the one displayed
+ * @param search - query and option of the search
+ */
+function search_facets(search){
+
+    $.ajax({
+        url: 'search_facets',
+        method: 'GET',
+        data: search,
+        success: function(facets_data){
+            if(current_search === search){
+                $("#results-container").find("div.container-body").first().prepend($.parseHTML(facets_data));
+            }
         }
     });
 
@@ -4,5 +4,6 @@ from engine_interface.views import *
 
 urlpatterns = [
     url(r'^$', index, name='index'),
-    url(r'^search_query', search_index, name='search_index')
+    url(r'^search_query', search_index, name='search_index'),
+    url(r'^search_facets', search_facets, name='search_facets')
 ]
@@ -2,22 +2,44 @@
 Views.py
 Contains methods to handle HTTP requests for the app
 """
-import json
 import os
 from search_engine.settings import BASE_DIR
 from django.http import HttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
+from reuters_index.cache import LRUCache
+from reuters_index.doc_store import DocStoreReader, doc_store_exists
+from reuters_index.facets import DATE_FROM_FILTER, DATE_TO_FILTER, normalize_filters
 from reuters_index.index_searcher import IndexSearcher
-from reuters_index.reuters_parser import Parser
+from reuters_index.reuters_parser import DocFileMapping, Parser
 
 # Define path to the directories/files of parsed collection
 REUTERS_DIR_PATH = os.path.join(BASE_DIR, "reuters_index")
 COLLECTION_PATH = os.path.join(REUTERS_DIR_PATH, "reuters_parser", "reuters-data")
 INVERTED_INDEX_PATH = os.path.join(REUTERS_DIR_PATH, "parsed_data", "inverted_index.bin")
 
+# Only the lexicon is loaded when the on-disk index was built: postings are memory-mapped and shared between workers
 INVERTED_INDEX = IndexSearcher(INVERTED_INDEX_PATH)
 
+# Docs of the results are read from the doc store when it was built with the index, otherwise the collection
+# files are parsed again
+DOC_STORE = DocStoreReader() if doc_store_exists() else None
+
+# Ranges of doc ids of the collection files, loaded once
+DOC_FILE_MAPPING = DocFileMapping(os.path.join(COLLECTION_PATH, "doc_id_file_mapping.json"))
+
+# Docs read for the latest results, by doc id
+DOC_CACHE = LRUCache(max_entries=4096)
+
+# No. of docs of the results returned per page
+RESULTS_PAGE_SIZE = 20
+
+# GET parameters of the facet filters of a query (each can be repeated, a doc having any of the values passes)
+FACET_FILTER_PARAMS = {"topic": "topics", "place": "places", "org": "orgs", "exchange": "exchanges"}
+
+# No. of values of each facet counted in the results of a query
+FACET_COUNTS_TOP = 10
+
 
 def index(request):
     """
@@ -31,11 +53,87 @@ def index(request):
 @csrf_exempt
 def search_index(request):
     """
-    Method to search the inverted index given a query and the option for querying (AND and OR)
+    Method to search the inverted index given a query and the option for querying (AND, OR and RANKED).
+    A ranked query returns the best docs matching any term, in descending order of BM25 score.
+    Results are returned one page at a time, starting at the offset passed: only the docs of the page are read.
+    The results can be filtered by topic, place, org, exchange and date range (date_from and date_to, YYYY-MM-DD).
     :param request: Request object
     :return: HTTP response with error code if error, otherwise rendered template containing docs retrieved
     """
 
+    search_params = get_search_params(request)
+    if isinstance(search_params, HttpResponse):
+        return search_params
+    query, exact_query, ranked_query, filters = search_params
+
+    # Offset of the page in the results
+    try:
+        offset = int(request.GET.get("offset", 0))
+    except ValueError:
+        offset = -1
+    if offset < 0:
+        return HttpResponse(status=400, content="Invalid results offset.")
+
+    # Get results (doc_ids) from searcher, one more than the page to know if there is a next page
+    results = INVERTED_INDEX.search_index(query=query, exact=exact_query, limit=RESULTS_PAGE_SIZE + 1,
+                                          ranked=ranked_query, offset=offset, filters=filters)
+
+    # Check that results were found
+    if not results or results is None or len(results) == 0:
+        return HttpResponse(status=404, content="Sorry :/ No Results Found!")
+
+    next_offset = offset + RESULTS_PAGE_SIZE if len(results) > RESULTS_PAGE_SIZE else None
+    results = results[:RESULTS_PAGE_SIZE]
+
+    # Get the docs of the page, from the cache if they were read for a previous query
+    docs = {doc_id: DOC_CACHE.get(doc_id) for doc_id in results}
+    missing_doc_ids = [doc_id for doc_id in results if docs[doc_id] is None]
+    if missing_doc_ids:
+        missing_docs = read_docs(missing_doc_ids)
+        if missing_docs is None:
+            return HttpResponse(status=404, content="Sorry :/ Cannot get file nos for doc ids!")
+
+        for doc_data in missing_docs:
+            docs[int(doc_data.get("id"))] = doc_data
+            DOC_CACHE.put(int(doc_data.get("id")), doc_data)
+
+    doc_text_results = [docs[doc_id] for doc_id in results if docs[doc_id] is not None]
+
+    return render(request, "results_display.html", context={"doc_results": doc_text_results,
+                                                            "next_offset": next_offset})
+
+
+@csrf_exempt
+def search_facets(request):
+    """
+    Method to count the docs matched by a query having each value of the facets (topics, places, orgs and
+    exchanges), requested once the first page of results is shown so that the page does not wait for the counts.
+    The docs matched by a ranked query are the docs matching any term. The filters are the ones of search_index.
+    :param request: Request object
+    :return: HTTP response with error code if error, otherwise rendered template containing the facet counts
+    """
+
+    search_params = get_search_params(request)
+    if isinstance(search_params, HttpResponse):
+        return search_params
+    query, exact_query, _, filters = search_params
+
+    facet_counts = INVERTED_INDEX.search_facets(query=query, exact=exact_query, filters=filters,
+                                                top=FACET_COUNTS_TOP)
+    if facet_counts is None:
+        return HttpResponse(status=404, content="No facet counts for the query.")
+
+    return render(request, "facet_counts.html", context={"facet_counts": facet_counts})
+
+
+def get_search_params(request):
+    """
+    Method to read the query, the option for querying and the filters of a search request
+    :param request: Request object
+    :return: tuple with the query, True for AND, True for RANKED and the dict of filters, or an HTTP response
+    with error code if a parameter is invalid
+    """
+
     # Fetch query parameters
     query = request.GET.get("query_string")
     opt = request.GET.get("option")
@@ -44,29 +142,52 @@ def search_index(request):
     if not query:
         return HttpResponse(status=400, content="No Query found.")
 
-    # Check for AND or OR
+    # Filters on the facets and the date range
+    filters = dict((field, request.GET.getlist(param)) for param, field in FACET_FILTER_PARAMS.items())
+    filters[DATE_FROM_FILTER] = request.GET.get(DATE_FROM_FILTER)
+    filters[DATE_TO_FILTER] = request.GET.get(DATE_TO_FILTER)
+    try:
+        normalize_filters(filters)
+    except ValueError as error:
+        return HttpResponse(status=400, content="Invalid filter: %s" % error)
+
+    # Check for AND, OR or RANKED
     exact_query = True
+    ranked_query = False
     if opt and opt.lower() == "or":
         exact_query = False
+    elif opt and opt.lower() == "ranked":
+        exact_query = False
+        ranked_query = True
 
-    # Get results (doc_ids) from searcher
-    results = INVERTED_INDEX.search_index(query=query, exact=exact_query)
+    return query, exact_query, ranked_query, filters
 
-    # Check that results were found
-    if not results or results is None or len(results) == 0:
-        return HttpResponse(status=404, content="Sorry :/ No Results Found!")
+
+def read_docs(doc_id_list):
+    """
+    Method to read the docs in list passed, from the doc store if it was built or from the collection files
+    :param doc_id_list: List of doc ids to read
+    :return: list of docs with all text needed, None if the file nos of the docs cannot be found
+    """
+
+    # One lookup per doc in the doc store
+    if DOC_STORE is not None:
+        # Docs of the files added to the index since the store was opened were appended to it
+        if any(doc_id not in DOC_STORE for doc_id in doc_id_list):
+            DOC_STORE.close()
+            DOC_STORE.open_files()
+        return DOC_STORE.get_docs(doc_id_list)
 
     # Fetch all the file nos to be read
-    file_nos = get_all_file_nos(results)
+    file_nos = get_all_file_nos(doc_id_list)
     if not file_nos or len(file_nos) == 0:
-        return HttpResponse(status=404, content="Sorry :/ Cannot get file nos for doc ids!")
+        return None
 
     # Get the text for each document in a file
     doc_text_results = list()
     for file_no, doc_list in file_nos.items():
-        doc_text_results += get_file_docs_text(file_no, doc_list)
-
-    return render(request, "results_display.html", context={"doc_results": doc_text_results})
+        doc_text_results += get_file_docs_text(file_no, doc_list) or []
+    return doc_text_results
 
 
 def get_all_file_nos(doc_id_list):
@@ -75,24 +196,7 @@ def get_all_file_nos(doc_id_list):
     :param doc_id_list: List of doc ids to retrieve file no
     :return: dict with file no and list of doc id in this file
     """
-    try:
-        with open(os.path.join(COLLECTION_PATH, "doc_id_file_mapping.json"), "r") as mapping_file:
-            doc_map = json.load(mapping_file)
-    except (OSError, IOError):
-        return None
-    else:
-        doc_id_file_no = dict()
-        # Get the file mapping for each doc
-        for mapping in doc_map:
-            range_doc = mapping.get("range")
-            for doc_id in doc_id_list:
-                if range_doc[0] < doc_id < range_doc[len(range_doc) - 1]:
-                    file_no = mapping.get("file_no")
-                    if file_no in doc_id_file_no:
-                        doc_id_file_no[file_no] += [doc_id]
-                    else:
-                        doc_id_file_no[file_no] = [doc_id]
-        return doc_id_file_no
+    return DOC_FILE_MAPPING.group_by_file(doc_id_list)
 
 
 def get_file_docs_text(file_no, doc_list):
@@ -0,0 +1,44 @@
+"""
+Benchmarks for the Reuters index. Each module can be run on its own, e.g.:
+python -m reuters_index.benchmarks.block_accounting
+"""
+
+import os
+import time
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+# Index shipped with the repository, used to rebuild a realistic token stream without re-parsing the collection
+SHIPPED_INDEX_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "..", "parsed_data",
+                                  "inverted_index.bin")
+
+
+def load_token_stream(limit=None, index_path=SHIPPED_INDEX_PATH):
+    """
+    Function to rebuild a token stream of <term, doc_id> pairs ordered by doc id from a pickled inverted index
+    :param limit: Max no. of pairs to return (None for all of them)
+    :param index_path: Path to the pickled inverted index
+    :return: list of (term, doc_id) pairs
+    """
+
+    with open(index_path, "rb") as file_obj:
+        inverted_index = pickle.load(file_obj)
+
+    token_stream = [(term, doc_id) for term, postings in inverted_index.items() for doc_id in postings]
+    token_stream.sort(key=lambda pair: pair[1])
+
+    return token_stream[:limit] if limit is not None else token_stream
+
+
+def time_call(func, *args, **kwargs):
+    """
+    Function to time a call
+    :param func: Function to call
+    :return: tuple with the elapsed time in seconds and the function result
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
@@ -0,0 +1,75 @@
+"""
+Benchmark comparing the incremental block size accounting of the SPIMI inversion against the pickle-based one.
+Block boundaries (no. of postings per block) of the incremental mode must stay within TOLERANCE of the
+pickle-based ones.
+"""
+
+import argparse
+import shutil
+import tempfile
+
+from reuters_index.benchmarks import load_token_stream, time_call
+from reuters_index.index_constructor import IndexConstructor
+
+# Max relative difference allowed between the blocks' boundaries of both modes
+TOLERANCE = 0.01
+
+
+class BoundaryRecorder(IndexConstructor):
+    """
+    Index constructor recording the cumulative no. of postings at each block boundary instead of saving blocks
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(BoundaryRecorder, self).__init__(*args, **kwargs)
+        self.boundaries = []
+        self.no_postings = 0
+
+    def save_block_data(self, sorted_keys, block_dict):
+        self.no_postings += sum(len(postings) for postings in block_dict.values())
+        self.boundaries.append(self.no_postings)
+
+
+def run(limit, block_size):
+    """
+    Function to run the benchmark
+    :param limit: No. of tokens to invert
+    :param block_size: Block size in bytes
+    :return: True if the boundaries are within tolerance, False otherwise
+    """
+
+    token_stream = load_token_stream(limit)
+    print("Inverting %d tokens with blocks of %d bytes" % (len(token_stream), block_size))
+
+    # The SPIMI files of each run are kept in a directory of their own, removed once done
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        recorders = dict()
+        for mode in ("pickle", "incremental"):
+            recorder = BoundaryRecorder(token_stream, block_size=block_size, size_accounting=mode, tmp_dir=tmp_dir)
+            elapsed, _ = time_call(recorder.spimi_invert)
+            recorders[mode] = recorder
+            print("%-12s %8.2fs %6d blocks" % (mode, elapsed, len(recorder.boundaries)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    pickle_bounds, incremental_bounds = recorders["pickle"].boundaries, recorders["incremental"].boundaries
+    if len(pickle_bounds) != len(incremental_bounds):
+        print("Different no. of blocks: %d vs %d" % (len(pickle_bounds), len(incremental_bounds)))
+        return False
+
+    max_deviation = max(abs(inc - pick) / float(pick) for pick, inc in zip(pickle_bounds, incremental_bounds))
+    identical = sum(1 for pick, inc in zip(pickle_bounds, incremental_bounds) if pick == inc)
+    print("Identical boundaries: %d/%d, max deviation: %.4f%% (tolerance %.2f%%)" %
+          (identical, len(pickle_bounds), max_deviation * 100, TOLERANCE * 100))
+
+    return max_deviation <= TOLERANCE
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--limit", type=int, default=200000, help="No. of tokens to invert")
+    arg_parser.add_argument("--block-size", type=int, default=10240, help="Block size in bytes")
+    args = arg_parser.parse_args()
+
+    exit(0 if run(args.limit, args.block_size) else 1)
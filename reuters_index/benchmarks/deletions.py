@@ -0,0 +1,122 @@
+"""
+Benchmark of the deleted docs: time of AND, OR and ranked queries without deletions, with a share of the docs
+marked in the deletion bitmap, and once the deleted docs were compacted away from the postings,
+checking that the bitmap and the compaction return the same docs
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+
+from reuters_index.benchmarks import load_token_stream, time_call
+from reuters_index.benchmarks.ranked_retrieval import sample_queries
+from reuters_index.index_constructor import IndexConstructor
+from reuters_index.index_searcher import IndexSearcher
+from reuters_index.index_storage import DeletionBitmap
+
+# Shares of the docs deleted
+DELETED_SHARES = (0.01, 0.1)
+
+# Query modes measured: (name, exact, ranked, limit)
+QUERY_MODES = (("AND", True, False, None), ("OR", False, False, None), ("OR top 20", False, False, 20),
+               ("RANKED top 10", False, True, 10))
+
+
+def build_index(token_stream, index_dir, deleted_docs=None):
+    """
+    Function to build an index with term frequencies from a token stream
+    :param token_stream: List of <term, doc_id> pairs
+    :param index_dir: Directory of the index
+    :param deleted_docs: DeletionBitmap of the docs to compact away (None to keep all the docs)
+    :return: Path to the index
+    """
+    constructor = IndexConstructor(token_stream, tmp_dir=os.path.join(index_dir, "blocks"), deleted_docs=deleted_docs)
+    constructor.inverted_index_path = os.path.join(index_dir, "inverted_index.bin")
+    return constructor.construct_index()
+
+
+def time_queries(searcher, queries, repeat):
+    """
+    Function to time the queries in every mode, without the query cache
+    :param searcher: IndexSearcher
+    :param queries: List of lists of terms
+    :param repeat: No. of timed runs (the best one is kept)
+    :return: list of (ms per query, results) for each query mode
+    """
+
+    measures = list()
+    for _, exact, ranked, limit in QUERY_MODES:
+        run_queries = lambda: [searcher.match_docs(query, exact=exact, ranked=ranked, limit=limit) for query in queries]
+        timings = [time_call(run_queries) for _ in range(repeat)]
+        measures.append((min(timing[0] for timing in timings) * 1000 / len(queries), timings[0][1]))
+    return measures
+
+
+def run(work_dir, no_queries, repeat, seed):
+    """
+    Function to run the benchmark
+    :param work_dir: Directory of the indexes
+    :param no_queries: No. of queries
+    :param repeat: No. of timed runs per measure
+    :param seed: Seed of the random queries and deleted docs
+    :return: None
+    """
+
+    token_stream = load_token_stream()
+    doc_ids = sorted(set(doc_id for _, doc_id in token_stream))
+
+    index_path = build_index(token_stream, os.path.join(work_dir, "full"))
+    searcher = IndexSearcher(index_path)
+    rng = random.Random(seed)
+    queries = [query for query in sample_queries(searcher, no_queries * 4, 2, seed)
+               if searcher.match_docs(query)][:no_queries]
+
+    print("%d docs, %d queries of 2 terms, times in ms/query" % (len(doc_ids), len(queries)))
+    print("%-22s %s" % ("index", " ".join("%14s" % mode[0] for mode in QUERY_MODES)))
+
+    baseline = time_queries(searcher, queries, repeat)
+    print("%-22s %s" % ("no deletions", " ".join("%14.3f" % elapsed for elapsed, _ in baseline)))
+
+    for share in DELETED_SHARES:
+        deleted_docs = DeletionBitmap()
+        for doc_id in rng.sample(doc_ids, int(len(doc_ids) * share)):
+            deleted_docs.add(doc_id)
+
+        searcher.deleted_docs = deleted_docs
+        filtered = time_queries(searcher, queries, repeat)
+        searcher.deleted_docs = DeletionBitmap()
+
+        compacted_dir = os.path.join(work_dir, "compacted_%d" % (share * 100))
+        compacted_searcher = IndexSearcher(build_index(token_stream, compacted_dir, deleted_docs))
+        compacted = time_queries(compacted_searcher, queries, repeat)
+
+        # Ranked scores differ once compacted (the collection stats change), so only the docs matched are compared
+        for mode_idx, (_, exact, ranked, limit) in enumerate(QUERY_MODES):
+            if ranked:
+                continue
+            for expected, filtered_docs, compacted_docs in zip(baseline[mode_idx][1], filtered[mode_idx][1],
+                                                              compacted[mode_idx][1]):
+                assert filtered_docs == compacted_docs, "Filtered and compacted results differ"
+                if limit is None:
+                    assert filtered_docs == deleted_docs.filter(expected or []), "Deleted docs returned"
+
+        print("%-22s %s" % ("%d%% deleted (bitmap)" % (share * 100),
+                            " ".join("%14.3f" % elapsed for elapsed, _ in filtered)))
+        print("%-22s %s" % ("%d%% deleted (compacted)" % (share * 100),
+                            " ".join("%14.3f" % elapsed for elapsed, _ in compacted)))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--queries", type=int, default=200, help="No. of queries")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="No. of timed runs")
+    arg_parser.add_argument("--seed", type=int, default=42, help="Seed of the random queries and deleted docs")
+    args = arg_parser.parse_args()
+
+    tmp_work_dir = tempfile.mkdtemp()
+    try:
+        run(tmp_work_dir, args.queries, args.repeat, args.seed)
+    finally:
+        shutil.rmtree(tmp_work_dir)
@@ -0,0 +1,153 @@
+"""
+Benchmark of the boolean queries: postings lists walked one doc id at a time (intersect_and and union_postings)
+against doc sets (bitmaps for the frequent terms, sorted arrays for the rare ones) built from the postings lists
+for each query, and against IndexSearcher.match_docs with an empty doc set cache and with the doc sets of the terms
+cached, for queries of rare, frequent and mixed terms, checking that all return the same docs
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+
+from reuters_index.benchmarks import load_token_stream, time_call
+from reuters_index.doc_sets import BitmapDocSet, doc_set, intersect_doc_sets, union_doc_sets
+from reuters_index.index_constructor import IndexConstructor
+from reuters_index.index_searcher import IndexSearcher
+
+# Doc frequency ranges of the terms drawn for each kind of query: (name, min doc freq, max doc freq)
+TERM_BANDS = (("rare", 10, 100), ("mid", 100, 1000), ("frequent", 1000, None))
+
+# Kinds of queries measured: (name, band of each term)
+QUERY_KINDS = (("rare", ("rare", "rare")), ("frequent", ("frequent", "frequent")), ("mixed", ("rare", "frequent")),
+               ("3 terms", ("mid", "frequent", "frequent")))
+
+
+def match_lists(searcher, terms, exact):
+    """
+    Function to match the docs of terms by walking their postings lists, as before the doc sets
+    :param searcher: IndexSearcher
+    :param terms: Terms of the index
+    :param exact: True for AND, False for OR
+    :return: list of doc ids
+    """
+    postings_lists = [searcher.inverted_index[term] for term in terms]
+    if not exact:
+        return list(searcher.union_postings(postings_lists))
+
+    postings_lists.sort(key=len)
+    docs_id_matched = postings_lists[0]
+    for postings in postings_lists[1:]:
+        docs_id_matched = searcher.intersect_and(docs_id_matched, postings)
+    return list(docs_id_matched)
+
+
+def match_doc_sets(searcher, terms, exact):
+    """
+    Function to match the docs of terms with doc sets built from their postings lists
+    :param searcher: IndexSearcher
+    :param terms: Terms of the index
+    :param exact: True for AND, False for OR
+    :return: list of doc ids
+    """
+    doc_sets = [doc_set(searcher.inverted_index[term]) for term in terms]
+    return (intersect_doc_sets(doc_sets) if exact else union_doc_sets(doc_sets)).to_list()
+
+
+def sample_band_queries(searcher, no_queries, bands, seed):
+    """
+    Function to draw random queries with one term from each doc frequency band passed
+    :param searcher: IndexSearcher on the on-disk index
+    :param no_queries: No. of queries
+    :param bands: Name of the band of each term
+    :param seed: Seed of the random terms
+    :return: list of lists of terms
+    """
+    index = searcher.inverted_index
+    band_terms = dict()
+    for name, min_doc_freq, max_doc_freq in TERM_BANDS:
+        band_terms[name] = [term for term_idx, term in enumerate(index.terms)
+                            if min_doc_freq <= index.doc_freqs[term_idx] and
+                            (max_doc_freq is None or index.doc_freqs[term_idx] < max_doc_freq)]
+
+    rng = random.Random(seed)
+    queries = list()
+    while len(queries) < no_queries:
+        query = [rng.choice(band_terms[band]) for band in bands]
+        if len(set(query)) == len(query):
+            queries.append(query)
+    return queries
+
+
+def best_time(repeat, func):
+    """
+    Function to get the best time of many calls
+    :param repeat: No. of calls
+    :param func: Function to call without arguments
+    :return: tuple with the best time in seconds and the result of the function
+    """
+    timings = [time_call(func) for _ in range(repeat)]
+    return min(timing[0] for timing in timings), timings[0][1]
+
+
+def run(work_dir, no_queries, repeat, seed):
+    """
+    Function to run the benchmark
+    :param work_dir: Directory of the index
+    :param no_queries: No. of queries of each kind
+    :param repeat: No. of timed runs per measure
+    :param seed: Seed of the random queries
+    :return: None
+    """
+
+    constructor = IndexConstructor(load_token_stream(), tmp_dir=os.path.join(work_dir, "blocks"))
+    constructor.inverted_index_path = os.path.join(work_dir, "inverted_index.bin")
+    searcher = IndexSearcher(constructor.construct_index())
+    index = searcher.inverted_index
+
+    no_bitmaps = sum(1 for term in index.terms if isinstance(doc_set(index[term]), BitmapDocSet))
+    print("%d terms, %d kept as bitmaps, times in ms/query" % (len(index.terms), no_bitmaps))
+    print("%-10s %-4s %12s %12s %12s %12s %10s" % ("queries", "mode", "lists", "doc sets", "match_docs",
+                                                   "cached sets", "docs"))
+
+    for kind_idx, (kind, bands) in enumerate(QUERY_KINDS):
+        queries = sample_band_queries(searcher, no_queries, bands, seed + kind_idx)
+
+        for mode, exact in (("AND", True), ("OR", False)):
+            def match_uncached():
+                searcher.doc_set_cache.clear()
+                return [searcher.match_docs(query, exact=exact) for query in queries]
+
+            measures = [
+                best_time(repeat, lambda: [match_lists(searcher, query, exact) for query in queries]),
+                best_time(repeat, lambda: [match_doc_sets(searcher, query, exact) for query in queries]),
+                best_time(repeat, match_uncached)
+            ]
+
+            for query in queries:
+                for term in query:
+                    searcher.term_doc_set(term)
+            measures.append(best_time(repeat, lambda: [searcher.match_docs(query, exact=exact) for query in queries]))
+
+            expected = measures[0][1]
+            for _, results in measures[1:]:
+                assert results == expected, "Doc sets and postings lists match different docs"
+
+            print("%-10s %-4s %s %10.1f" % (kind, mode, " ".join("%12.3f" % (elapsed * 1000 / len(queries))
+                                                                 for elapsed, _ in measures),
+                                            sum(len(result) for result in expected) / len(queries)))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--queries", type=int, default=100, help="No. of queries of each kind")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="No. of timed runs")
+    arg_parser.add_argument("--seed", type=int, default=42, help="Seed of the random queries")
+    args = arg_parser.parse_args()
+
+    tmp_work_dir = tempfile.mkdtemp()
+    try:
+        run(tmp_work_dir, args.queries, args.repeat, args.seed)
+    finally:
+        shutil.rmtree(tmp_work_dir)
@@ -0,0 +1,104 @@
+"""
+Microbenchmarks of the AND intersection for varying length ratios of the postings lists:
+linear merge of both lists against cursors advancing with skip pointers (compressed lists)
+or galloping search (lists)
+"""
+
+import argparse
+import random
+
+from reuters_index.benchmarks import time_call
+from reuters_index.index_searcher import IndexSearcher
+from reuters_index.index_storage import PostingsList, build_skips, open_cursor
+
+# No. of docs in the Reuters collection (NEWIDs are 1 to 21578)
+NO_DOCS = 21578
+
+# Length ratios of the long list over the short list
+LENGTH_RATIOS = (1, 2, 4, 16, 64, 256, 1024)
+
+
+def intersect_cursor(shorter_list, longer_list):
+    """
+    Function to intersect by walking the shorter list and advancing a cursor on the longer one
+    :param shorter_list: Shorter postings list
+    :param longer_list: Longer postings list
+    :return: list of doc ids in both lists
+    """
+    longer_cursor = open_cursor(longer_list)
+    matched_items = list()
+    for doc_id in shorter_list:
+        longer_post = longer_cursor.advance(doc_id)
+        if longer_post is None:
+            break
+        if longer_post == doc_id:
+            matched_items.append(doc_id)
+    return matched_items
+
+
+def compress(doc_ids):
+    """
+    Function to compress a list of doc ids with skip pointers, as saved in the on-disk index
+    :param doc_ids: Sorted list of doc ids
+    :return: PostingsList
+    """
+    postings = PostingsList.from_doc_ids(doc_ids)
+    postings.skip_doc_ids, postings.skip_offsets = build_skips(postings.data)
+    return postings
+
+
+def best_time(repeat, func, *args):
+    """
+    Function to get the best time of many calls
+    :param repeat: No. of calls
+    :param func: Function to call
+    :return: tuple with the best time in seconds and the result of the function
+    """
+    timings = [time_call(func, *args) for _ in range(repeat)]
+    return min(timing[0] for timing in timings), timings[0][1]
+
+
+def run(long_length, repeat, seed):
+    """
+    Function to run the benchmark
+    :param long_length: Length of the longer postings list
+    :param repeat: No. of timed runs per measure
+    :param seed: Seed of the random doc ids
+    :return: None
+    """
+
+    rng = random.Random(seed)
+    universe = range(1, max(NO_DOCS, long_length) + 1)
+    longer_list = sorted(rng.sample(universe, long_length))
+
+    print("Long list of %d doc ids, times in ms" % long_length)
+    print("%7s %8s %9s %9s %9s %9s %10s" % ("ratio", "short", "linear", "lin-vbyte", "gallop", "skips", "and-auto"))
+
+    for ratio in LENGTH_RATIOS:
+        shorter_list = sorted(rng.sample(universe, max(1, long_length // ratio)))
+        shorter_compressed, longer_compressed = compress(shorter_list), compress(longer_list)
+
+        expected = sorted(set(shorter_list) & set(longer_list))
+        measures = [
+            best_time(repeat, IndexSearcher.intersect_and_linear, shorter_list, longer_list),
+            best_time(repeat, IndexSearcher.intersect_and_linear, shorter_compressed, longer_compressed),
+            best_time(repeat, intersect_cursor, shorter_list, longer_list),
+            best_time(repeat, intersect_cursor, shorter_compressed, longer_compressed),
+            best_time(repeat, IndexSearcher.intersect_and, shorter_compressed, longer_compressed)
+        ]
+
+        for _, result in measures:
+            assert list(result) == expected, "Wrong intersection"
+
+        print("%7d %8d %s" % (ratio, len(shorter_list), " ".join("%9.3f" % (elapsed * 1000)
+                                                                 for elapsed, _ in measures)))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--long-length", type=int, default=NO_DOCS // 2, help="Length of the longer list")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="No. of timed runs")
+    arg_parser.add_argument("--seed", type=int, default=42, help="Seed of the random doc ids")
+    args = arg_parser.parse_args()
+
+    run(args.long_length, args.repeat, args.seed)
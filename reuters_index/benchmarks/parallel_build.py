@@ -0,0 +1,48 @@
+"""
+Benchmark of the parallel index build on the full collection, from 1 to N worker processes
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+
+from reuters_index.benchmarks import time_call
+from reuters_index.build_index import NO_COLLECTION_FILES, build_index
+
+
+def run(max_workers, no_files):
+    """
+    Function to run the benchmark
+    :param max_workers: Max no. of worker processes
+    :param no_files: No. of collection files to index
+    :return: dict with the no. of workers and the build time in seconds
+    """
+
+    build_times = dict()
+    work_dir = tempfile.mkdtemp()
+    try:
+        for workers in range(1, max_workers + 1):
+            elapsed, _ = time_call(build_index, workers=workers, no_files=no_files,
+                                   index_path=os.path.join(work_dir, "inverted_index.bin"),
+                                   tmp_dir=os.path.join(work_dir, "tmp_block_dir"),
+                                   doc_store_prefix=os.path.join(work_dir, "doc_store"))
+            build_times[workers] = elapsed
+    finally:
+        shutil.rmtree(work_dir)
+
+    print("%8s %10s %8s %10s" % ("workers", "time (s)", "speedup", "efficiency"))
+    for workers, elapsed in sorted(build_times.items()):
+        speedup = build_times[1] / elapsed
+        print("%8d %10.2f %8.2f %9.0f%%" % (workers, elapsed, speedup, 100 * speedup / workers))
+
+    return build_times
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1, help="Max no. of workers")
+    arg_parser.add_argument("--no-files", type=int, default=NO_COLLECTION_FILES, help="No. of collection files")
+    args = arg_parser.parse_args()
+
+    run(args.max_workers, args.no_files)
@@ -0,0 +1,85 @@
+"""
+Benchmark of the compressed postings (delta + variable-byte) against the pickled inverted index:
+size on disk and decode throughput of all the postings of the shipped index
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+from array import array
+
+from reuters_index.benchmarks import SHIPPED_INDEX_PATH, time_call
+from reuters_index.index_storage import DiskIndexReader, DiskIndexWriter, LEXICON_EXT, POSTINGS_EXT
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+
+def decode_all(postings_lists):
+    """
+    Function to iterate over every doc id of the postings lists passed
+    :param postings_lists: Iterable of postings lists
+    :return: No. of doc ids decoded
+    """
+    no_postings = 0
+    for postings in postings_lists:
+        for _ in postings:
+            no_postings += 1
+    return no_postings
+
+
+def run(repeat):
+    """
+    Function to run the benchmark
+    :param repeat: No. of times each decoding is timed (the best time is kept)
+    :return: None
+    """
+
+    with open(SHIPPED_INDEX_PATH, "rb") as index_file:
+        inverted_index = pickle.load(index_file)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        index_prefix = os.path.join(work_dir, "inverted_index")
+        with DiskIndexWriter(index_prefix) as index_writer:
+            for term, postings in inverted_index.items():
+                index_writer.add_term(term, postings)
+
+        no_postings = sum(len(postings) for postings in inverted_index.values())
+        pickle_size = os.path.getsize(SHIPPED_INDEX_PATH)
+        uint32_size = no_postings * array("I").itemsize
+        postings_size = os.path.getsize(index_prefix + POSTINGS_EXT)
+        lexicon_size = os.path.getsize(index_prefix + LEXICON_EXT)
+
+        print("%d terms, %d postings" % (len(inverted_index), no_postings))
+        print("%-32s %10d bytes" % ("pickled index", pickle_size))
+        print("%-32s %10d bytes" % ("uint32 postings", uint32_size))
+        print("%-32s %10d bytes (%.2f bytes/posting)" % ("delta-vbyte postings", postings_size,
+                                                          postings_size / float(no_postings)))
+        print("%-32s %10d bytes (%.1f%% of the pickle)" % ("delta-vbyte postings + lexicon", postings_size + lexicon_size,
+                                                           100.0 * (postings_size + lexicon_size) / pickle_size))
+
+        def load_pickle():
+            with open(SHIPPED_INDEX_PATH, "rb") as pickle_file:
+                return decode_all(pickle.load(pickle_file).values())
+
+        disk_index = DiskIndexReader(index_prefix)
+        decoders = [("pickle.load + iterate", load_pickle),
+                    ("delta-vbyte decode", lambda: decode_all(disk_index.values()))]
+
+        for name, decoder in decoders:
+            elapsed = min(time_call(decoder)[0] for _ in range(repeat))
+            print("%-32s %8.3fs %12.0f postings/s" % (name, elapsed, no_postings / elapsed))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--repeat", type=int, default=3, help="No. of timed runs")
+    args = arg_parser.parse_args()
+
+    run(args.repeat)
@@ -0,0 +1,97 @@
+"""
+Benchmark of ranked (BM25) OR queries: scoring every doc matched against the WAND top k,
+with the no. of docs scored and the time per query
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+
+from reuters_index.benchmarks import load_token_stream, time_call
+from reuters_index.index_constructor import IndexConstructor
+from reuters_index.index_searcher import IndexSearcher
+
+# No. of top docs asked by the WAND queries
+TOP_KS = (10, 100)
+
+
+def build_ranked_index(index_dir):
+    """
+    Function to build an index with term frequencies and doc lengths from the token stream of the shipped index
+    :param index_dir: Directory of the index
+    :return: Path to the index
+    """
+    constructor = IndexConstructor(load_token_stream(), tmp_dir=os.path.join(index_dir, "blocks"))
+    constructor.inverted_index_path = os.path.join(index_dir, "inverted_index.bin")
+    return constructor.construct_index()
+
+
+def sample_queries(searcher, no_queries, no_terms, seed):
+    """
+    Function to draw random queries among the terms of the index found in 10 docs or more
+    :param searcher: IndexSearcher on the on-disk index
+    :param no_queries: No. of queries
+    :param no_terms: No. of terms per query
+    :param seed: Seed of the random terms
+    :return: list of lists of terms
+    """
+    index = searcher.inverted_index
+    terms = [term for term_idx, term in enumerate(index.terms) if index.doc_freqs[term_idx] >= 10]
+    rng = random.Random(seed)
+    return [rng.sample(terms, no_terms) for _ in range(no_queries)]
+
+
+def run(index_path, no_queries, no_terms, seed):
+    """
+    Function to run the benchmark
+    :param index_path: Path to the index
+    :param no_queries: No. of queries
+    :param no_terms: No. of terms per query
+    :param seed: Seed of the random queries
+    :return: None
+    """
+
+    searcher = IndexSearcher(index_path)
+    queries = sample_queries(searcher, no_queries, no_terms, seed)
+
+    print("%d queries of %d terms" % (no_queries, no_terms))
+    print("%12s %12s %12s" % ("top k", "docs scored", "ms/query"))
+
+    exhaustive_results = list()
+    total_time = total_scored = 0
+    for query in queries:
+        elapsed, result = time_call(searcher.search_ranked, query, exact=False)
+        exhaustive_results.append(result)
+        total_time += elapsed
+        total_scored += searcher.no_scored_docs
+    print("%12s %12d %12.3f" % ("all", total_scored, total_time * 1000 / no_queries))
+
+    for top_k in TOP_KS:
+        total_time = total_scored = 0
+        for query, expected in zip(queries, exhaustive_results):
+            elapsed, result = time_call(searcher.search_ranked, query, exact=False, limit=top_k)
+            assert result == expected[:top_k], "WAND top k differs from exhaustive scoring"
+            total_time += elapsed
+            total_scored += searcher.no_scored_docs
+        print("%12d %12d %12.3f" % (top_k, total_scored, total_time * 1000 / no_queries))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--index-path", help="Index built with term frequencies (built from the shipped index "
+                                                 "in a temporary directory if not given)")
+    arg_parser.add_argument("--queries", type=int, default=200, help="No. of queries")
+    arg_parser.add_argument("--terms", type=int, default=3, help="No. of terms per query")
+    arg_parser.add_argument("--seed", type=int, default=42, help="Seed of the random queries")
+    args = arg_parser.parse_args()
+
+    if args.index_path:
+        run(args.index_path, args.queries, args.terms, args.seed)
+    else:
+        tmp_index_dir = tempfile.mkdtemp()
+        try:
+            run(build_ranked_index(tmp_index_dir), args.queries, args.terms, args.seed)
+        finally:
+            shutil.rmtree(tmp_index_dir)
@@ -0,0 +1,63 @@
+"""
+Benchmark of the parsing of the collection files: BeautifulSoup (html.parser) against the streaming SGML reader,
+checking that both give the same docs
+"""
+
+import argparse
+import os
+
+from reuters_index.benchmarks import time_call
+from reuters_index.build_index import NO_COLLECTION_FILES
+from reuters_index.reuters_parser import Parser
+
+COLLECTION_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "..", "reuters_parser", "reuters-data",
+                               "reut2-%03d.sgm")
+
+
+def stream_file(parser, file_no):
+    """
+    Function to parse a collection file with the streaming reader, line by line from the file
+    :param parser: Parser
+    :param file_no: No. of the file
+    :return: list of parsed docs
+    """
+    with open(COLLECTION_PATH % file_no, "rb") as reuters_file:
+        return list(parser.iter_documents(reuters_file))
+
+
+def run(no_files):
+    """
+    Function to run the benchmark
+    :param no_files: No. of collection files to parse
+    :return: None
+    """
+
+    parser = Parser()
+    total_bytes = total_docs = 0
+    soup_time = stream_time = 0.0
+
+    for file_no in range(no_files):
+        with open(COLLECTION_PATH % file_no, "rb") as reuters_file:
+            file_text = reuters_file.read()
+
+        elapsed, soup_docs = time_call(parser.parse_documents_soup, file_text)
+        soup_time += elapsed
+        elapsed, stream_docs = time_call(stream_file, parser, file_no)
+        stream_time += elapsed
+
+        assert soup_docs == stream_docs, "Docs of file %d differ" % file_no
+        total_bytes += len(file_text)
+        total_docs += len(stream_docs)
+
+    print("%d files, %d docs, %.1f MB" % (no_files, total_docs, total_bytes / 1e6))
+    print("%-16s %10s %10s %10s" % ("parser", "time (s)", "MB/s", "docs/s"))
+    for name, elapsed in (("BeautifulSoup", soup_time), ("streaming SGML", stream_time)):
+        print("%-16s %10.2f %10.2f %10.0f" % (name, elapsed, total_bytes / 1e6 / elapsed, total_docs / elapsed))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--no-files", type=int, default=NO_COLLECTION_FILES, help="No. of collection files")
+    args = arg_parser.parse_args()
+
+    run(args.no_files)
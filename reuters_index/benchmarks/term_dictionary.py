@@ -0,0 +1,146 @@
+"""
+Benchmark of the term dictionary of the SPIMI inversion: blocks keyed by term strings with lists of postings
+(as they used to be) against blocks keyed by term ids with arrays of postings.
+Each mode inverts the whole collection and merges its blocks in a fresh process, reporting the total size
+of the blocks and the peak resident memory of the process.
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+from array import array
+
+from reuters_index.benchmarks import load_token_stream, time_call
+from reuters_index.index_constructor import BLOCK_POSTINGS_TYPECODE, BlockSizeEstimator, IndexConstructor
+from reuters_index.token_stream import TokenStreamReader, TokenStreamWriter
+
+# Block sizes in bytes measured
+BLOCK_SIZES = (10240, 1024 * 1024, 64 * 1024 * 1024)
+
+
+class StringKeyedConstructor(IndexConstructor):
+    """
+    Index constructor inverting the blocks as before the term dictionary: each block dict is keyed by the term
+    strings and holds lists of doc ids, and the blocks are saved with their terms
+    """
+
+    def spimi_invert(self):
+        doc_lengths = self.doc_lengths
+        token_pairs = iter(self.token_stream)
+        token_pair = next(token_pairs, None)
+
+        while token_pair is not None:
+            block_dict = dict()
+            size_estimator = BlockSizeEstimator()
+
+            while size_estimator.size < self.block_size and token_pair is not None:
+                term, doc_id = token_pair[0], int(token_pair[1])
+                doc_lengths[doc_id] += 1
+
+                if term not in block_dict:
+                    block_dict[term] = [doc_id]
+                    size_estimator.add_term(term, doc_id)
+                else:
+                    size_estimator.add_posting(len(block_dict[term]), doc_id)
+                    block_dict[term].append(doc_id)
+
+                token_pair = next(token_pairs, None)
+
+            self.save_block_data(sorted(block_dict), block_dict)
+            self.block_no += 1
+
+        self.save_doc_lengths()
+
+
+def peak_rss():
+    """
+    Function to get the peak resident memory of this process. On Linux, it is read from /proc, as ru_maxrss
+    keeps the peak of the parent process across the fork and exec that started this one
+    :return: Peak resident memory in KB
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def invert(mode, token_stream_prefix, work_dir, block_size):
+    """
+    Function run in a fresh process to invert and merge the token stream
+    :param mode: "terms" for blocks keyed by terms, "term ids" for blocks keyed by term ids
+    :param token_stream_prefix: Path of the token stream, without extension
+    :param work_dir: Directory of the blocks and of the index
+    :param block_size: Block size in bytes
+    :return: tuple with the no. of blocks, their total size in bytes, the peak resident memory in KB before
+    the inversion and after the merge, and the time of the inversion and merge in seconds
+    """
+
+    token_stream = TokenStreamReader(token_stream_prefix)
+    constructor_class = StringKeyedConstructor if mode == "terms" else IndexConstructor
+    constructor = constructor_class(token_stream, block_size=block_size, tmp_dir=os.path.join(work_dir, "blocks"))
+    constructor.inverted_index_path = os.path.join(work_dir, "inverted_index.bin")
+    start_rss = peak_rss()
+
+    constructor.reset_tmp_block_dir()
+    invert_time, _ = time_call(constructor.spimi_invert)
+    block_files = os.listdir(constructor.tmp_file_dir_path)
+    no_blocks = sum(1 for block_file in block_files if block_file.startswith("block_"))
+    block_bytes = sum(os.path.getsize(os.path.join(constructor.tmp_file_dir_path, block_file))
+                      for block_file in block_files if block_file.startswith(("block_", "terms_")))
+    merge_time, _ = time_call(constructor.merge_index)
+
+    end_rss = peak_rss()
+    token_stream.close()
+    return no_blocks, block_bytes, start_rss, end_rss, invert_time + merge_time
+
+
+def run(work_dir, block_sizes):
+    """
+    Function to run the benchmark
+    :param work_dir: Directory of the token stream, blocks and indexes
+    :param block_sizes: Block sizes in bytes
+    :return: None
+    """
+
+    # The token stream is read lazily from disk, so that it does not weigh on the memory of the inversion
+    token_stream_prefix = os.path.join(work_dir, "tokens")
+    token_stream = load_token_stream()
+    with TokenStreamWriter(token_stream_prefix) as token_stream_writer:
+        token_stream_writer.add_pairs(token_stream)
+    print("%d tokens, %d bytes per posting in a block array" %
+          (len(token_stream), array(BLOCK_POSTINGS_TYPECODE).itemsize))
+    del token_stream
+
+    print("%-10s %-9s %8s %14s %14s %14s %9s" % ("block size", "keys", "blocks", "block bytes", "start RSS (KB)",
+                                                 "peak RSS (KB)", "time (s)"))
+
+    # Each inversion runs in a new interpreter, so that its peak memory is its own
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=1, maxtasksperchild=1) as pool:
+        for block_size in block_sizes:
+            for mode in ("terms", "term ids"):
+                mode_dir = os.path.join(work_dir, "%s_%d" % (mode.replace(" ", "_"), block_size))
+                no_blocks, block_bytes, start_rss, end_rss, elapsed = \
+                    pool.apply(invert, (mode, token_stream_prefix, mode_dir, block_size))
+                print("%-10d %-9s %8d %14d %14d %14d %9.2f" % (block_size, mode, no_blocks, block_bytes, start_rss,
+                                                               end_rss, elapsed))
+                shutil.rmtree(mode_dir)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--block-sizes", type=int, nargs="+", default=BLOCK_SIZES, help="Block sizes in bytes")
+    args = arg_parser.parse_args()
+
+    tmp_work_dir = tempfile.mkdtemp()
+    try:
+        run(tmp_work_dir, args.block_sizes)
+    finally:
+        shutil.rmtree(tmp_work_dir)
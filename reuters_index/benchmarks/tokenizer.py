@@ -0,0 +1,132 @@
+"""
+Benchmark of the tokenizer and the preprocessing of the tokens:
+- query path: nltk.word_tokenize and the list-based preprocessing against the regex query tokenizer
+  and the single-pass preprocessing
+- indexing path: list-based against single-pass preprocessing of the tokens of whole docs
+"""
+
+import argparse
+import os
+import re
+
+import nltk
+from nltk.tokenize import NLTKWordTokenizer
+
+from reuters_index.benchmarks import time_call
+from reuters_index.reuters_parser import STOP_WORDS_30, STOP_WORDS_30_MORE, Parser
+from reuters_index.reuters_parser.porter_stemmer import PorterStemmer
+
+COLLECTION_FILE_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "..", "reuters_parser",
+                                    "reuters-data", "reut2-000.sgm")
+
+# Preprocessing applied to the queries and to the shipped index
+PROCESS_SETTINGS = {"downcase": True, "no_digits": True, "rule_of_thirty": True, "stop_words_150": True,
+                    "stemming": False}
+
+
+def preprocess_tokens_lists(tokens, downcase=True, no_digits=True, rule_of_thirty=True, stop_words_150=False,
+                            stemming=True, min_no_char=2):
+    """
+    Function preprocessing tokens as Parser.preprocess_tokens used to: one list copy per option, regexes compiled
+    on each call and stop words looked up in lists
+    :param tokens: List of tokens
+    :return: list of tokens
+    """
+
+    final_tokens = tokens
+
+    punctuation_regexp = re.compile(r"^[,.:;+/\\]+$|^(\\u\d*)$|^(<.*>)$")
+    final_tokens = list(filter(lambda token: not punctuation_regexp.match(token), final_tokens))
+
+    if downcase:
+        final_tokens = list(map(lambda token: token.lower(), final_tokens))
+
+    if no_digits:
+        no_digit_regexp = re.compile(r"[a-zA-Z]+")
+        final_tokens = list(filter(lambda token: no_digit_regexp.match(token), final_tokens))
+
+    if rule_of_thirty:
+        final_tokens = [token for token in final_tokens if token not in STOP_WORDS_30]
+
+    if stop_words_150:
+        final_tokens = [token for token in final_tokens if token not in STOP_WORDS_30_MORE]
+
+    if stemming:
+        stemmer = PorterStemmer()
+        final_tokens = list(map(lambda token: stemmer.stem(token, 0, len(token) - 1), final_tokens))
+
+    if min_no_char > 0:
+        final_tokens = list(filter(lambda token: len(token) > min_no_char, final_tokens))
+
+    return final_tokens
+
+
+def load_docs():
+    """
+    Function to parse the docs of the first collection file
+    :return: list of parsed docs
+    """
+    with open(COLLECTION_FILE_PATH, "rb") as reuters_file:
+        return Parser().parse_file(reuters_file.read(), tokenize=False)
+
+
+def query_path_legacy(queries):
+    """
+    Function to get the terms of queries with nltk and the list-based preprocessing
+    :param queries: List of queries
+    :return: list of the terms of each query
+    """
+    return [preprocess_tokens_lists(nltk.word_tokenize(query), **PROCESS_SETTINGS) for query in queries]
+
+
+def query_path_fast(queries):
+    """
+    Function to get the terms of queries with the regex tokenizer and the single-pass preprocessing
+    :param queries: List of queries
+    :return: list of the terms of each query
+    """
+    return [Parser.preprocess_tokens(Parser.tokenize_query(query), **PROCESS_SETTINGS) for query in queries]
+
+
+def run(repeat, stemming):
+    """
+    Function to run the benchmark
+    :param repeat: No. of timed runs per measure (the best one is kept)
+    :param stemming: True to stem the tokens of the indexing path
+    :return: None
+    """
+
+    docs = load_docs()
+
+    # Titles make short queries
+    queries = [doc.get("title") for doc in docs if doc.get("title")]
+    legacy_time = min(time_call(query_path_legacy, queries)[0] for _ in range(repeat))
+    fast_time, fast_terms = min(time_call(query_path_fast, queries) for _ in range(repeat))
+    agreement = sum(sorted(set(legacy)) == sorted(set(fast))
+                    for legacy, fast in zip(query_path_legacy(queries), fast_terms)) / float(len(queries))
+    print("Query path, %d queries: %.1f us/query with nltk, %.1f us/query with the regex tokenizer "
+          "(%.2f%% same terms)" % (len(queries), legacy_time * 1e6 / len(queries), fast_time * 1e6 / len(queries),
+                                   agreement * 100))
+
+    # Tokens of whole docs, as inverted at index time
+    word_tokenizer = NLTKWordTokenizer()
+    docs_tokens = [word_tokenizer.tokenize((doc.get("title") or "") + " " + (doc.get("body") or "")) for doc in docs]
+    no_tokens = sum(len(doc_tokens) for doc_tokens in docs_tokens)
+    settings = dict(PROCESS_SETTINGS, stemming=stemming)
+
+    legacy_time, legacy_tokens = min(time_call(lambda: [preprocess_tokens_lists(doc_tokens, **settings)
+                                                        for doc_tokens in docs_tokens]) for _ in range(repeat))
+    fast_time, fast_tokens = min(time_call(lambda: [Parser.preprocess_tokens(doc_tokens, **settings)
+                                                    for doc_tokens in docs_tokens]) for _ in range(repeat))
+    assert legacy_tokens == fast_tokens, "Preprocessing results differ"
+    print("Indexing path, %d tokens%s: %.0f ktokens/s with lists, %.0f ktokens/s single-pass"
+          % (no_tokens, " stemmed" if stemming else "", no_tokens / legacy_time / 1000, no_tokens / fast_time / 1000))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument("--repeat", type=int, default=3, help="No. of timed runs")
+    arg_parser.add_argument("--stemming", action="store_true", help="Stem the tokens of the indexing path")
+    args = arg_parser.parse_args()
+
+    run(args.repeat, args.stemming)
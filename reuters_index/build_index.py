@@ -0,0 +1,430 @@
+"""
+Script to build the inverted index of the Reuters collection.
+Each reut2-NNN.sgm file is parsed and inverted into its own sorted blocks, by as many worker processes as
+asked, and the blocks are then merged into the inverted index. The parsed docs are saved in the doc store:
+python -m reuters_index.build_index --workers 4
+The token stream of each file can be saved, to build the index again (e.g. with another block size) without
+parsing the collection:
+python -m reuters_index.build_index --token-stream-path /tmp/reuters_tokens
+python -m reuters_index.build_index --token-stream-path /tmp/reuters_tokens --from-token-stream --block-size 65536
+New collection files are added to a built index as a new segment, merged with the other segments in the background:
+python -m reuters_index.build_index --add-files 22 23
+Docs are deleted from the index, and compacted away from the postings when the index is built or its segments merged:
+python -m reuters_index.build_index --delete-docs 12 345
+The position of each token can be saved in the index, for phrase and NEAR queries:
+python -m reuters_index.build_index --positions
+The topics, places, orgs, exchanges and dates of the docs are saved in the facet index next to the inverted index,
+to filter the queries and count the docs of their results by facet value.
+"""
+
+import argparse
+import os
+from multiprocessing import Pool
+
+from reuters_index.doc_store import DOC_STORE_PREFIX, DocStoreWriter
+from reuters_index.facets import FacetIndexWriter
+from reuters_index.index_constructor import PARSED_DATA_DIR, IndexConstructor
+from reuters_index.index_segments import SegmentedIndexWriter, remove_segments
+from reuters_index.index_storage import DeletionBitmap, DiskIndexReader
+from reuters_index.reuters_parser import CollectionParser
+from reuters_index.reuters_parser.porter_stemmer import STEM_CACHE, STEM_TABLE_EXT
+from reuters_index.token_stream import TokenStreamReader, TokenStreamWriter, token_stream_exists
+
+# No. of reut2-NNN.sgm files in the collection
+NO_COLLECTION_FILES = 22
+
+# Default path of the inverted index
+INVERTED_INDEX_PATH = os.path.join(PARSED_DATA_DIR, "inverted_index.bin")
+
+# Preprocessing the shipped inverted index was built with (same as the one applied to queries)
+DEFAULT_PROCESS_SETTINGS = {
+    "downcase": True,
+    "no_digits": True,
+    "rule_of_thirty": True,
+    "stop_words_150": True,
+    "stemming": False,
+    "min_no_char": 2
+}
+
+
+def file_token_stream_prefix(token_stream_prefix, file_no):
+    """
+    Function to get the path of the token stream of a collection file
+    :param token_stream_prefix: Path of the token streams, without extension
+    :param file_no: No. of the file
+    :return: Path of the token stream of the file, without extension
+    """
+    return "%s_%03d" % (token_stream_prefix, file_no)
+
+
+def invert_file(task):
+    """
+    Function run by a worker to parse a collection file and invert its tokens into sorted blocks
+    :param task: tuple with the file no., the blocks' directory, the block size, the preprocessing settings,
+    the path of the token streams to save (None not to save the token stream of the file) and True to save
+    the positions of the tokens
+    :return: tuple with the file no., the no. of docs, the no. of tokens parsed, the parsed docs (with their
+    categories) and the stems learned by the worker (None without stemming)
+    """
+
+    file_no, tmp_dir, block_size, process_settings, token_stream_prefix, store_positions = task
+
+    collection_parser = CollectionParser(process_settings, keep_docs=True, with_categories=True)
+
+    # The pairs are inverted as the file is parsed, without building the token stream of the file first
+    token_stream = collection_parser.iter_token_stream([file_no])
+    block_prefix = "f%03d_" % file_no
+
+    if token_stream_prefix is None:
+        IndexConstructor(token_stream, block_size=block_size, tmp_dir=tmp_dir, block_prefix=block_prefix,
+                         store_positions=store_positions).spimi_invert()
+    else:
+        try:
+            token_stream_writer = TokenStreamWriter(file_token_stream_prefix(token_stream_prefix, file_no),
+                                                    process_settings)
+        except (IOError, OSError):
+            print("Unable to save the token stream of file no. %d" % file_no)
+            exit(1)
+
+        with token_stream_writer:
+            IndexConstructor(token_stream_writer.tee(token_stream), block_size=block_size, tmp_dir=tmp_dir,
+                             block_prefix=block_prefix, store_positions=store_positions).spimi_invert()
+
+    return file_no, collection_parser.doc_count, collection_parser.token_count, collection_parser.collection_docs, \
+        dict(STEM_CACHE.stems) if process_settings.get("stemming") else None
+
+
+def reinvert_file(task):
+    """
+    Function run by a worker to invert the saved token stream of a collection file into sorted blocks
+    :param task: tuple with the file no., the blocks' directory, the block size, the path of the token streams and
+    True to save the positions of the tokens
+    :return: tuple with the file no. and the no. of tokens inverted
+    """
+
+    file_no, tmp_dir, block_size, token_stream_prefix, store_positions = task
+
+    token_stream = TokenStreamReader(file_token_stream_prefix(token_stream_prefix, file_no))
+    IndexConstructor(token_stream, block_size=block_size, tmp_dir=tmp_dir, block_prefix="f%03d_" % file_no,
+                     store_positions=store_positions).spimi_invert()
+
+    no_tokens = len(token_stream)
+    token_stream.close()
+    return file_no, no_tokens
+
+
+def save_doc_store(files_results, doc_store_prefix, append=False, facets_prefix=None):
+    """
+    Function to save the docs parsed by the workers in the doc store, as soon as each file is done, and their
+    categories and dates in the facet index.
+    The stems learned by the workers are added to the stem cache of this process.
+    :param files_results: Iterable of the results of invert_file
+    :param doc_store_prefix: Path of the doc store to write, without extension
+    :param append: True to add the docs to the existing doc store and facet index
+    :param facets_prefix: Path of the inverted index the facet index is saved next to, without extension
+    (None not to save the facet index)
+    :return: list of tuples with the file no., the no. of docs and the no. of tokens parsed
+    """
+
+    files_stats = list()
+    try:
+        facet_writer = FacetIndexWriter(facets_prefix, append) if facets_prefix is not None else None
+        with DocStoreWriter(doc_store_prefix, append) as doc_store_writer:
+            for file_no, doc_count, token_count, file_docs, file_stems in files_results:
+                doc_store_writer.add_docs(file_docs)
+                if facet_writer is not None:
+                    facet_writer.add_docs(file_docs)
+                if file_stems is not None:
+                    STEM_CACHE.update(file_stems)
+                files_stats.append((file_no, doc_count, token_count))
+        if facet_writer is not None:
+            facet_writer.close()
+    except (IOError, OSError):
+        print("Unable to save the doc store")
+        exit(1)
+
+    return files_stats
+
+
+def invert_files(constructor, file_nos, workers, process_settings, doc_store_prefix, token_stream_prefix=None,
+                 append_docs=False, facets_prefix=None):
+    """
+    Function to parse and invert collection files into the blocks' directory of a constructor, with as many worker
+    processes as asked, and to save their docs in the doc store and the facet index
+    :param constructor: IndexConstructor merging the blocks (the positions are saved if it stores them)
+    :param file_nos: Nos. of the files to invert
+    :param workers: No. of worker processes (1 to run in this process)
+    :param process_settings: Settings for preprocessing the tokens
+    :param doc_store_prefix: Path of the doc store to write, without extension
+    :param token_stream_prefix: Path of the token streams of the files to save, without extension (None not to)
+    :param append_docs: True to add the docs to the existing doc store and facet index
+    :param facets_prefix: Path of the inverted index the facet index is saved next to, without extension
+    (None not to save the facet index)
+    :return: None
+    """
+
+    print("Making new directory for blocks' file")
+    constructor.reset_tmp_block_dir()
+
+    print("Inverting %d files with %d worker(s)" % (len(file_nos), workers))
+    tasks = [(file_no, constructor.tmp_file_dir_path, constructor.block_size, process_settings, token_stream_prefix,
+              constructor.store_positions) for file_no in file_nos]
+    if workers > 1:
+        with Pool(processes=workers) as pool:
+            files_stats = save_doc_store(pool.imap_unordered(invert_file, tasks), doc_store_prefix, append_docs,
+                                         facets_prefix)
+    else:
+        files_stats = save_doc_store(map(invert_file, tasks), doc_store_prefix, append_docs, facets_prefix)
+
+    print("Total no. of docs parsed: %d" % sum(file_stats[1] for file_stats in files_stats))
+    print("Total no. of tokens: %d" % sum(file_stats[2] for file_stats in files_stats))
+
+
+def build_index(workers=1, no_files=NO_COLLECTION_FILES, block_size=10240, process_settings=None,
+                index_path=None, tmp_dir=None, get_stats=False, doc_store_prefix=DOC_STORE_PREFIX,
+                token_stream_prefix=None, store_positions=False):
+    """
+    Function to build the inverted index of the collection
+    :param workers: No. of worker processes parsing and inverting the files (1 to run in this process)
+    :param no_files: No. of collection files to index
+    :param block_size: The block size for the SPIMI algorithm to use in bytes
+    :param process_settings: Settings for preprocessing the tokens
+    :param index_path: Path where to save the inverted index (defaults to the one of IndexConstructor)
+    :param tmp_dir: Directory where to save the blocks (defaults to the one of IndexConstructor)
+    :param get_stats: True to print stats on the inverted index
+    :param doc_store_prefix: Path of the doc store to write, without extension
+    :param token_stream_prefix: Path of the token streams of the files to save, without extension
+    (None not to save them)
+    :param store_positions: True to save the position of each token in the index (for phrase and NEAR queries)
+    :return: the path to the complete inverted index
+    """
+
+    process_settings = process_settings if process_settings is not None else DEFAULT_PROCESS_SETTINGS
+
+    # The docs deleted from the index are compacted away while merging the blocks
+    index_path = index_path if index_path is not None else INVERTED_INDEX_PATH
+    constructor = IndexConstructor(None, block_size=block_size, tmp_dir=tmp_dir,
+                                   deleted_docs=DeletionBitmap.load(os.path.splitext(index_path)[0]),
+                                   store_positions=store_positions)
+    constructor.inverted_index_path = index_path
+
+    invert_files(constructor, range(no_files), workers, process_settings, doc_store_prefix, token_stream_prefix,
+                 facets_prefix=os.path.splitext(index_path)[0])
+
+    index_path = constructor.merge_index(get_stats=get_stats)
+
+    # The new index replaces the segments added since the previous build
+    remove_segments(constructor.index_prefix)
+
+    # Stem table of the collection, so that stemming a query term is a lookup (none if the index is not stemmed)
+    save_stem_table(index_path, process_settings.get("stemming"))
+    if token_stream_prefix is not None and process_settings.get("stemming"):
+        save_stems(token_stream_prefix + STEM_TABLE_EXT)
+
+    return index_path
+
+
+def rebuild_index(token_stream_prefix, workers=1, no_files=NO_COLLECTION_FILES, block_size=10240, index_path=None,
+                  tmp_dir=None, get_stats=False, store_positions=False):
+    """
+    Function to build the inverted index again from the token streams saved by build_index, without parsing
+    the collection (the doc store is left as is)
+    :param token_stream_prefix: Path of the token streams of the files, without extension
+    :param workers: No. of worker processes inverting the token streams (1 to run in this process)
+    :param no_files: No. of collection files to index
+    :param block_size: The block size for the SPIMI algorithm to use in bytes
+    :param index_path: Path where to save the inverted index (defaults to the one of IndexConstructor)
+    :param tmp_dir: Directory where to save the blocks (defaults to the one of IndexConstructor)
+    :param get_stats: True to print stats on the inverted index
+    :param store_positions: True to save the position of each token in the index (for phrase and NEAR queries)
+    :return: the path to the complete inverted index
+    """
+
+    missing_file_nos = [file_no for file_no in range(no_files)
+                        if not token_stream_exists(file_token_stream_prefix(token_stream_prefix, file_no))]
+    if missing_file_nos:
+        print("Unable to find the token stream of file no. %d" % missing_file_nos[0])
+        exit(1)
+
+    # The docs deleted from the index are compacted away while merging the blocks
+    index_path = index_path if index_path is not None else INVERTED_INDEX_PATH
+    constructor = IndexConstructor(None, block_size=block_size, tmp_dir=tmp_dir,
+                                   deleted_docs=DeletionBitmap.load(os.path.splitext(index_path)[0]),
+                                   store_positions=store_positions)
+    constructor.inverted_index_path = index_path
+
+    print("Making new directory for blocks' file")
+    constructor.reset_tmp_block_dir()
+
+    print("Inverting the token streams of %d files with %d worker(s)" % (no_files, workers))
+    tasks = [(file_no, constructor.tmp_file_dir_path, block_size, token_stream_prefix, store_positions)
+             for file_no in range(no_files)]
+    if workers > 1:
+        with Pool(processes=workers) as pool:
+            files_stats = pool.map(reinvert_file, tasks)
+    else:
+        files_stats = list(map(reinvert_file, tasks))
+
+    print("Total no. of tokens: %d" % sum(file_stats[1] for file_stats in files_stats))
+
+    index_path = constructor.merge_index(get_stats=get_stats)
+    remove_segments(constructor.index_prefix)
+
+    # The stems learned while parsing were saved next to the token streams
+    token_stream = TokenStreamReader(file_token_stream_prefix(token_stream_prefix, 0))
+    stemming = token_stream.process_settings.get("stemming")
+    token_stream.close()
+    if stemming:
+        STEM_CACHE.load(token_stream_prefix + STEM_TABLE_EXT)
+    save_stem_table(index_path, stemming)
+
+    return index_path
+
+
+def add_files(file_nos, workers=1, block_size=10240, process_settings=None, index_path=None, tmp_dir=None,
+              doc_store_prefix=DOC_STORE_PREFIX, background_merge=True):
+    """
+    Function to add collection files to a built index without building it again: the files are inverted into
+    a new segment, searched as soon as it is written, and the segments are then merged with the tiered merge policy
+    :param file_nos: Nos. of the files to add
+    :param workers: No. of worker processes parsing and inverting the files (1 to run in this process)
+    :param block_size: The block size for the SPIMI algorithm to use in bytes
+    :param process_settings: Settings for preprocessing the tokens (must be the ones the index was built with)
+    :param index_path: Path of the inverted index (defaults to the one of IndexConstructor)
+    :param tmp_dir: Directory where to save the blocks (defaults to a directory next to the segment)
+    :param doc_store_prefix: Path of the doc store to add the docs to, without extension
+    :param background_merge: True to merge the segments in a background thread, False to merge before returning
+    :return: SegmentedIndexWriter of the index (wait_for_merge waits for the background merge and raises its error)
+    """
+
+    process_settings = process_settings if process_settings is not None else DEFAULT_PROCESS_SETTINGS
+
+    index_path = index_path if index_path is not None else INVERTED_INDEX_PATH
+    segment_writer = SegmentedIndexWriter(os.path.splitext(index_path)[0])
+    if not segment_writer.segments:
+        print("The on-disk index must be built before adding files")
+        exit(1)
+
+    # The new segment saves positions if the index does
+    segment_reader = DiskIndexReader(segment_writer.segment_prefix(segment_writer.segments[0]["name"]))
+    store_positions = segment_reader.with_positions
+    segment_reader.close()
+
+    constructor = IndexConstructor(None, block_size=block_size, store_positions=store_positions)
+    constructor.inverted_index_path = index_path
+
+    # The stems of the new files are added to the stem table of the index
+    stem_table_path = os.path.splitext(index_path)[0] + STEM_TABLE_EXT
+    if process_settings.get("stemming"):
+        STEM_CACHE.load(stem_table_path)
+
+    segment_name = segment_writer.new_segment_name()
+    segment_prefix = segment_writer.segment_prefix(segment_name)
+    constructor.inverted_index_path = segment_prefix + ".bin"
+    constructor.tmp_file_dir_path = tmp_dir if tmp_dir is not None else segment_prefix + "_blocks"
+
+    invert_files(constructor, file_nos, workers, process_settings, doc_store_prefix, append_docs=True,
+                 facets_prefix=os.path.splitext(index_path)[0])
+    constructor.merge_index()
+
+    if process_settings.get("stemming"):
+        save_stems(stem_table_path)
+
+    print("Adding segment %s" % segment_name)
+    segment_writer.add_segment(segment_name)
+    segment_writer.merge(background=background_merge)
+
+    return segment_writer
+
+
+def delete_docs(doc_ids, index_path=None):
+    """
+    Function to delete docs from the index: they are marked in the deleted docs bitmap, filtered out of the results
+    right away and removed from the postings the next time the index is built or its segments are merged
+    :param doc_ids: Ids of the docs to delete
+    :param index_path: Path of the inverted index (defaults to the one of IndexConstructor)
+    :return: No. of docs deleted from the index
+    """
+
+    index_prefix = os.path.splitext(index_path if index_path is not None else INVERTED_INDEX_PATH)[0]
+
+    deleted_docs = DeletionBitmap.load(index_prefix)
+    for doc_id in doc_ids:
+        deleted_docs.add(doc_id)
+
+    try:
+        deleted_docs.save(index_prefix)
+    except (IOError, OSError):
+        print("Unable to save the deleted docs")
+        exit(1)
+
+    return len(deleted_docs)
+
+
+def save_stem_table(index_path, stemming):
+    """
+    Function to save the stems of the stem cache next to the index, or to remove a stale stem table
+    :param index_path: Path to the inverted index
+    :param stemming: True if the index is stemmed
+    :return: None
+    """
+    stem_table_path = os.path.splitext(index_path)[0] + STEM_TABLE_EXT
+    if stemming:
+        save_stems(stem_table_path)
+    elif os.path.exists(stem_table_path):
+        os.remove(stem_table_path)
+
+
+def save_stems(stem_table_path):
+    """
+    Function to save the stems of the stem cache
+    :param stem_table_path: Path of the stem table
+    :return: None
+    """
+    if not STEM_CACHE.save(stem_table_path):
+        print("Unable to save the stem table: %s" % stem_table_path)
+        exit(1)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Build the inverted index of the Reuters collection")
+    arg_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="No. of worker processes (default: no. of cores)")
+    arg_parser.add_argument("--no-files", type=int, default=NO_COLLECTION_FILES, help="No. of collection files")
+    arg_parser.add_argument("--block-size", type=int, default=10240, help="SPIMI block size in bytes")
+    arg_parser.add_argument("--index-path", default=None, help="Path of the inverted index to write")
+    arg_parser.add_argument("--doc-store-path", default=DOC_STORE_PREFIX,
+                            help="Path of the doc store to write, without extension")
+    arg_parser.add_argument("--stats", action="store_true", help="Print stats on the inverted index")
+    arg_parser.add_argument("--token-stream-path", default=None,
+                            help="Path of the token streams of the files to save (or to read with "
+                                 "--from-token-stream), without extension")
+    arg_parser.add_argument("--from-token-stream", action="store_true",
+                            help="Build the index from the saved token streams instead of parsing the collection")
+    arg_parser.add_argument("--add-files", type=int, nargs="+", default=None,
+                            help="Nos. of the collection files to add to the built index as a new segment")
+    arg_parser.add_argument("--delete-docs", type=int, nargs="+", default=None,
+                            help="Ids of the docs to delete from the built index")
+    arg_parser.add_argument("--positions", action="store_true",
+                            help="Save the position of each token in the index, for phrase and NEAR queries")
+    args = arg_parser.parse_args()
+
+    if args.delete_docs:
+        print("%d docs deleted from the index" % delete_docs(args.delete_docs, index_path=args.index_path))
+    elif args.add_files:
+        try:
+            add_files(args.add_files, workers=max(1, args.workers), block_size=args.block_size,
+                      index_path=args.index_path, doc_store_prefix=args.doc_store_path).wait_for_merge()
+        except (IOError, OSError):
+            # The segments that could not be merged stay live
+            exit(1)
+    elif args.from_token_stream:
+        if args.token_stream_path is None:
+            arg_parser.error("--from-token-stream needs --token-stream-path")
+        rebuild_index(args.token_stream_path, workers=max(1, args.workers), no_files=args.no_files,
+                      block_size=args.block_size, index_path=args.index_path, get_stats=args.stats,
+                      store_positions=args.positions)
+    else:
+        build_index(workers=max(1, args.workers), no_files=args.no_files, block_size=args.block_size,
+                    index_path=args.index_path, get_stats=args.stats, doc_store_prefix=args.doc_store_path,
+                    token_stream_prefix=args.token_stream_path, store_positions=args.positions)
@@ -0,0 +1,89 @@
+"""
+Script containing the bounded caches of the search engine
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Cache evicting the least recently used entries once it holds more than a max no. of entries,
+    or more than a max total size when a size function is passed
+    """
+
+    def __init__(self, max_entries=1024, max_size=None, size_of=None):
+        """
+        Constructor for an empty cache
+        :param max_entries: Max no. of entries kept (0 to disable the cache)
+        :param max_size: Max total size of the values kept (None for no limit)
+        :param size_of: Function to get the size of a value (each value has a size of 1 if None)
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size_of = size_of if size_of is not None else lambda value: 1
+
+        # Key -> (value, size of the value), from the least to the most recently used
+        self.entries = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """
+        Method to get the value of a key and mark it as the most recently used
+        :param key: Key to look up
+        :param default: Value returned if the key is not in the cache
+        :return: The value of the key, default if not found
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        """
+        Method to add or replace the value of a key, and evict the least recently used entries over the limits.
+        A value larger than the max size is not kept.
+        :param key: Key of the value
+        :param value: Value to cache
+        :return: None
+        """
+
+        value_size = self.size_of(value)
+        if self.max_entries <= 0 or (self.max_size is not None and value_size > self.max_size):
+            return
+
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+
+        self.entries[key] = (value, value_size)
+        self.size += value_size
+
+        while len(self.entries) > self.max_entries or (self.max_size is not None and self.size > self.max_size):
+            self.size -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        """
+        Method to remove all the entries (the hit and miss counters are kept)
+        :return: None
+        """
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        """
+        Method to get the counters of the cache
+        :return: dict with the no. of hits, misses, entries and the total size
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.entries), "size": self.size}
@@ -0,0 +1,419 @@
+"""
+Script containing the doc sets the boolean queries are matched with, instead of walking postings lists one doc id
+at a time. Reuters doc ids are a dense range (NEWIDs 1 to 21578), so the docs of a frequent term are kept as
+a bitmap (a Python int whose bit doc_id is set), and the docs of a rare term as a sorted array of doc ids.
+AND, OR and ANDNOT run on both representations: bitwise operators on the bitmaps, linear merges of the arrays
+(galloping searches of the smaller array's doc ids in the larger one when their sizes are skewed), and a lookup
+of each doc id of an array in the bytes of a bitmap.
+"""
+
+import heapq
+import itertools
+from array import array
+from bisect import bisect_left
+
+# Doc ids of a sorted doc set are saved as native unsigned ints of this type code
+DOC_SET_TYPECODE = "I"
+
+# A bitmap takes 1 bit per doc id up to the last one and an array 32 bits per doc: the docs are kept as a bitmap
+# when the last doc id is below this many times their no. (the bitmap is then the smaller of the two)
+BITMAP_DENSITY_RATIO = 8 * array(DOC_SET_TYPECODE).itemsize
+
+# Arrays are merged by galloping searches of the doc ids of the smaller one in the larger one (instead of a linear
+# merge) when the larger one has at least this many times more doc ids
+GALLOP_LENGTH_RATIO = 16
+
+# Positions of the bits set in each byte value, to list the doc ids of a bitmap a byte at a time
+BYTE_BIT_POSITIONS = tuple(tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256))
+
+
+def doc_set(doc_ids):
+    """
+    Function to get the doc set of sorted doc ids, as a bitmap if they are dense enough and as an array otherwise
+    :param doc_ids: Sorted iterable of distinct doc ids (list, array or PostingsList)
+    :return: BitmapDocSet or SortedDocSet
+    """
+    doc_ids = doc_ids if isinstance(doc_ids, array) else array(DOC_SET_TYPECODE, doc_ids)
+    if doc_ids and doc_ids[-1] < BITMAP_DENSITY_RATIO * len(doc_ids):
+        return BitmapDocSet.from_doc_ids(doc_ids)
+    return SortedDocSet(doc_ids)
+
+
+def is_doc_set(docs):
+    """
+    Function to check if docs are a doc set rather than a postings list or a sequence of doc ids
+    :param docs: Doc set, postings list or sequence of doc ids
+    :return: True for a BitmapDocSet or a SortedDocSet, False otherwise
+    """
+    return isinstance(docs, (BitmapDocSet, SortedDocSet))
+
+
+def intersect_doc_sets(doc_sets):
+    """
+    Function to intersect doc sets (AND), from the smallest one so that the intermediate results stay small
+    :param doc_sets: Iterable of doc sets
+    :return: Doc set of the docs in all of them (empty if none is passed)
+    """
+    doc_sets = sorted(doc_sets, key=len)
+    if not doc_sets:
+        return SortedDocSet()
+
+    docs = doc_sets[0]
+    for other_docs in doc_sets[1:]:
+        if not docs:
+            break
+        docs = docs & other_docs
+    return docs
+
+
+def union_doc_sets(doc_sets):
+    """
+    Function to merge doc sets (OR). Bitmaps are merged first, then the arrays are added to their union at once.
+    :param doc_sets: Iterable of doc sets
+    :return: Doc set of the docs in any of them
+    """
+
+    bits = 0
+    sorted_doc_ids = list()
+    for docs in doc_sets:
+        if isinstance(docs, BitmapDocSet):
+            bits |= docs.bits
+        elif docs:
+            sorted_doc_ids.append(docs.doc_ids)
+
+    # k-way merge of the arrays, dropping the doc ids found in many of them
+    doc_ids = array(DOC_SET_TYPECODE)
+    if len(sorted_doc_ids) == 1:
+        doc_ids = sorted_doc_ids[0]
+    elif sorted_doc_ids:
+        doc_ids.extend(doc_id for doc_id, _ in itertools.groupby(heapq.merge(*sorted_doc_ids)))
+
+    if not bits:
+        return doc_set(doc_ids)
+
+    docs = BitmapDocSet(bits)
+    if doc_ids:
+        docs = docs | SortedDocSet(doc_ids)
+    return docs
+
+
+def gallop(doc_ids, doc_id, lo=0):
+    """
+    Function to find the first doc id of a sorted array not below the doc id passed, from an index on: the step
+    doubles until a larger doc id is reached, then the last step is searched by bisection
+    :param doc_ids: Sorted array of doc ids
+    :param doc_id: Doc id to look for
+    :param lo: Index to search from (the doc ids before it are below doc_id)
+    :return: Index of the first doc id not below doc_id (len(doc_ids) if there is none)
+    """
+    no_doc_ids = len(doc_ids)
+    hi = lo
+    step = 1
+    while hi < no_doc_ids and doc_ids[hi] < doc_id:
+        lo = hi + 1
+        hi += step
+        step <<= 1
+    return bisect_left(doc_ids, doc_id, lo, min(hi, no_doc_ids))
+
+
+def intersect_sorted(doc_ids, other_doc_ids):
+    """
+    Function to intersect two sorted arrays of doc ids, with a linear merge or, when their sizes are skewed,
+    a galloping search of each doc id of the smaller one in the larger one
+    :param doc_ids: Sorted array of distinct doc ids
+    :param other_doc_ids: Sorted array of distinct doc ids
+    :return: Sorted array of the doc ids in both
+    """
+    if len(doc_ids) > len(other_doc_ids):
+        doc_ids, other_doc_ids = other_doc_ids, doc_ids
+
+    result = array(DOC_SET_TYPECODE)
+    no_doc_ids, no_other_doc_ids = len(doc_ids), len(other_doc_ids)
+    if no_doc_ids * GALLOP_LENGTH_RATIO <= no_other_doc_ids:
+        other_idx = 0
+        for doc_id in doc_ids:
+            other_idx = gallop(other_doc_ids, doc_id, other_idx)
+            if other_idx == no_other_doc_ids:
+                break
+            if other_doc_ids[other_idx] == doc_id:
+                result.append(doc_id)
+                other_idx += 1
+        return result
+
+    doc_idx = other_idx = 0
+    while doc_idx < no_doc_ids and other_idx < no_other_doc_ids:
+        doc_id, other_doc_id = doc_ids[doc_idx], other_doc_ids[other_idx]
+        if doc_id == other_doc_id:
+            result.append(doc_id)
+            doc_idx += 1
+            other_idx += 1
+        elif doc_id < other_doc_id:
+            doc_idx += 1
+        else:
+            other_idx += 1
+    return result
+
+
+def union_sorted(doc_ids, other_doc_ids):
+    """
+    Function to merge two sorted arrays of doc ids, with a linear merge or, when their sizes are skewed,
+    by copying the runs of the larger one between the doc ids of the smaller one found by galloping searches
+    :param doc_ids: Sorted array of distinct doc ids
+    :param other_doc_ids: Sorted array of distinct doc ids
+    :return: Sorted array of the doc ids in either
+    """
+    if len(doc_ids) > len(other_doc_ids):
+        doc_ids, other_doc_ids = other_doc_ids, doc_ids
+
+    no_doc_ids, no_other_doc_ids = len(doc_ids), len(other_doc_ids)
+    if no_doc_ids * GALLOP_LENGTH_RATIO <= no_other_doc_ids:
+        return merge_runs(other_doc_ids, doc_ids, keep=True)
+
+    result = array(DOC_SET_TYPECODE)
+    doc_idx = other_idx = 0
+    while doc_idx < no_doc_ids and other_idx < no_other_doc_ids:
+        doc_id, other_doc_id = doc_ids[doc_idx], other_doc_ids[other_idx]
+        if doc_id <= other_doc_id:
+            result.append(doc_id)
+            doc_idx += 1
+            if doc_id == other_doc_id:
+                other_idx += 1
+        else:
+            result.append(other_doc_id)
+            other_idx += 1
+    result.extend(doc_ids[doc_idx:])
+    result.extend(other_doc_ids[other_idx:])
+    return result
+
+
+def subtract_sorted(doc_ids, other_doc_ids):
+    """
+    Function to remove the doc ids of a sorted array from another one, with a linear merge or, when their sizes
+    are skewed, galloping searches of the doc ids of the smaller one in the larger one
+    :param doc_ids: Sorted array of distinct doc ids to keep
+    :param other_doc_ids: Sorted array of distinct doc ids to remove
+    :return: Sorted array of the doc ids of doc_ids not in other_doc_ids
+    """
+    no_doc_ids, no_other_doc_ids = len(doc_ids), len(other_doc_ids)
+    if no_other_doc_ids * GALLOP_LENGTH_RATIO <= no_doc_ids:
+        return merge_runs(doc_ids, other_doc_ids, keep=False)
+
+    result = array(DOC_SET_TYPECODE)
+    if no_doc_ids * GALLOP_LENGTH_RATIO <= no_other_doc_ids:
+        other_idx = 0
+        for doc_id in doc_ids:
+            other_idx = gallop(other_doc_ids, doc_id, other_idx)
+            if other_idx == no_other_doc_ids or other_doc_ids[other_idx] != doc_id:
+                result.append(doc_id)
+        return result
+
+    doc_idx = other_idx = 0
+    while doc_idx < no_doc_ids and other_idx < no_other_doc_ids:
+        doc_id, other_doc_id = doc_ids[doc_idx], other_doc_ids[other_idx]
+        if doc_id == other_doc_id:
+            doc_idx += 1
+            other_idx += 1
+        elif doc_id < other_doc_id:
+            result.append(doc_id)
+            doc_idx += 1
+        else:
+            other_idx += 1
+    result.extend(doc_ids[doc_idx:])
+    return result
+
+
+def merge_runs(doc_ids, few_doc_ids, keep):
+    """
+    Function to copy a large sorted array of doc ids run by run, between the doc ids of a much smaller one found
+    with galloping searches, and to add (union) or skip (difference) the doc ids of the smaller one
+    :param doc_ids: Sorted array of distinct doc ids, copied
+    :param few_doc_ids: Sorted array of distinct doc ids, much smaller than doc_ids
+    :param keep: True to add the doc ids of few_doc_ids, False to remove them from doc_ids
+    :return: Sorted array of the doc ids merged
+    """
+    result = array(DOC_SET_TYPECODE)
+    no_doc_ids = len(doc_ids)
+    doc_idx = 0
+    for doc_id in few_doc_ids:
+        run_end = gallop(doc_ids, doc_id, doc_idx)
+        result.extend(doc_ids[doc_idx:run_end])
+        doc_idx = run_end
+        if run_end < no_doc_ids and doc_ids[run_end] == doc_id:
+            doc_idx += 1
+        if keep:
+            result.append(doc_id)
+    result.extend(doc_ids[doc_idx:])
+    return result
+
+
+class SortedDocSet:
+    """
+    Set of the docs of a rare term, as an array of sorted doc ids
+    """
+
+    __slots__ = ("doc_ids",)
+
+    def __init__(self, doc_ids=None):
+        """
+        Constructor for a doc set
+        :param doc_ids: Sorted array of distinct doc ids (empty if None)
+        """
+        self.doc_ids = doc_ids if doc_ids is not None else array(DOC_SET_TYPECODE)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def __iter__(self):
+        return iter(self.doc_ids)
+
+    def __contains__(self, doc_id):
+        doc_idx = bisect_left(self.doc_ids, doc_id)
+        return doc_idx < len(self.doc_ids) and self.doc_ids[doc_idx] == doc_id
+
+    @property
+    def nbytes(self):
+        """
+        Size of the doc set in bytes
+        :return: int
+        """
+        return len(self.doc_ids) * self.doc_ids.itemsize
+
+    def __and__(self, other):
+        if isinstance(other, BitmapDocSet):
+            return SortedDocSet(array(DOC_SET_TYPECODE, other.filter(self.doc_ids)))
+        return SortedDocSet(intersect_sorted(self.doc_ids, other.doc_ids))
+
+    def __or__(self, other):
+        if isinstance(other, BitmapDocSet):
+            return other | self
+        return doc_set(union_sorted(self.doc_ids, other.doc_ids))
+
+    def __sub__(self, other):
+        if isinstance(other, BitmapDocSet):
+            return SortedDocSet(array(DOC_SET_TYPECODE, other.filter(self.doc_ids, keep=False)))
+        return SortedDocSet(subtract_sorted(self.doc_ids, other.doc_ids))
+
+    def to_list(self, limit=None):
+        """
+        Method to get the doc ids of the set
+        :param limit: Max no. of doc ids to return (None for all)
+        :return: list of doc ids in ascending order
+        """
+        return self.doc_ids[:limit].tolist()
+
+
+class BitmapDocSet:
+    """
+    Set of the docs of a frequent term, as a bitmap: an int whose bit doc_id is set when the doc is in the set
+    """
+
+    __slots__ = ("bits", "no_docs", "bitmap_bytes")
+
+    def __init__(self, bits=0):
+        """
+        Constructor for a doc set
+        :param bits: int of the bitmap
+        """
+        self.bits = bits
+
+        # No. of docs and little-endian bytes of the bitmap, computed on first use
+        self.no_docs = None
+        self.bitmap_bytes = None
+
+    @classmethod
+    def from_doc_ids(cls, doc_ids):
+        """
+        Method to build the bitmap of sorted doc ids
+        :param doc_ids: Sorted array of distinct doc ids
+        :return: BitmapDocSet
+        """
+        if not doc_ids:
+            return cls()
+
+        bitmap_bytes = bytearray((doc_ids[-1] >> 3) + 1)
+        for doc_id in doc_ids:
+            bitmap_bytes[doc_id >> 3] |= 1 << (doc_id & 7)
+
+        docs = cls.from_bytes(bitmap_bytes)
+        docs.no_docs = len(doc_ids)
+        return docs
+
+    @classmethod
+    def from_bytes(cls, bitmap_bytes):
+        """
+        Method to build a doc set from the bytes of a bitmap (bit doc_id % 8 of byte doc_id // 8 is set when
+        the doc is in the set), as saved by DeletionBitmap
+        :param bitmap_bytes: bytes-like object of the bitmap
+        :return: BitmapDocSet
+        """
+        return cls(int.from_bytes(bitmap_bytes, "little"))
+
+    def __len__(self):
+        if self.no_docs is None:
+            self.no_docs = bin(self.bits).count("1")
+        return self.no_docs
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __iter__(self):
+        for byte_idx, byte in enumerate(self.to_bytes()):
+            if byte:
+                doc_id_base = byte_idx << 3
+                for bit in BYTE_BIT_POSITIONS[byte]:
+                    yield doc_id_base | bit
+
+    def __contains__(self, doc_id):
+        return bool(self.filter((doc_id,)))
+
+    @property
+    def nbytes(self):
+        """
+        Size of the bitmap in bytes
+        :return: int
+        """
+        return (self.bits.bit_length() + 7) >> 3
+
+    def __and__(self, other):
+        if isinstance(other, SortedDocSet):
+            return other & self
+        return BitmapDocSet(self.bits & other.bits)
+
+    def __or__(self, other):
+        if isinstance(other, SortedDocSet):
+            other = BitmapDocSet.from_doc_ids(other.doc_ids)
+        return BitmapDocSet(self.bits | other.bits)
+
+    def __sub__(self, other):
+        if isinstance(other, SortedDocSet):
+            other = BitmapDocSet.from_doc_ids(other.doc_ids)
+        return BitmapDocSet(self.bits & ~other.bits)
+
+    def to_bytes(self):
+        """
+        Method to get the little-endian bytes of the bitmap, kept for the next lookups
+        :return: bytes of the bitmap
+        """
+        if self.bitmap_bytes is None:
+            self.bitmap_bytes = self.bits.to_bytes(self.nbytes, "little")
+        return self.bitmap_bytes
+
+    def filter(self, doc_ids, keep=True):
+        """
+        Method to look up doc ids in the bitmap
+        :param doc_ids: Iterable of doc ids
+        :param keep: True to keep the doc ids in the set, False to keep the ones not in the set
+        :return: list of the doc ids kept, in the order passed
+        """
+        bitmap_bytes = self.to_bytes()
+        no_bytes = len(bitmap_bytes)
+        return [doc_id for doc_id in doc_ids
+                if (doc_id >> 3 < no_bytes and bitmap_bytes[doc_id >> 3] >> (doc_id & 7) & 1 == 1) == keep]
+
+    def to_list(self, limit=None):
+        """
+        Method to get the doc ids of the set
+        :param limit: Max no. of doc ids to return (None for all), the bitmap is only scanned up to the last one
+        :return: list of doc ids in ascending order
+        """
+        return list(itertools.islice(self, limit))
@@ -0,0 +1,219 @@
+"""
+Script containing the document store of the Reuters collection, built once at index time so that the docs of
+the results are read without parsing the collection files again.
+The store is saved as files sharing the same prefix:
+- <prefix>.docs: the pickled data (id, title, body, date and categories) of every doc one after the other,
+  memory-mapped
+- <prefix>.doff: the start and end byte offsets of each doc in the data file, indexed by doc id and memory-mapped
+Docs are kept as returned by Parser.parse_documents.
+"""
+
+import mmap
+import os
+from array import array
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+# Extensions of the doc data and doc offsets files
+DOCS_EXT = ".docs"
+DOC_OFFSETS_EXT = ".doff"
+
+# Offsets are saved as native unsigned long longs
+DOC_OFFSET_TYPECODE = "Q"
+
+# Default location of the doc store, next to the inverted index
+DOC_STORE_PREFIX = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "parsed_data", "doc_store"))
+
+
+def doc_store_exists(doc_store_prefix=DOC_STORE_PREFIX):
+    """
+    Function to check if a doc store was saved with the prefix passed
+    :param doc_store_prefix: Path of the doc store without extension
+    :return: True if the data and offsets files exist, False otherwise
+    """
+    return all(os.path.exists(doc_store_prefix + extension) for extension in (DOCS_EXT, DOC_OFFSETS_EXT))
+
+
+class DocStoreWriter:
+    """
+    Class to write the doc store. Docs can be added in any order of doc ids.
+    """
+
+    def __init__(self, doc_store_prefix=DOC_STORE_PREFIX, append=False):
+        """
+        Constructor opening the data file of the doc store
+        :param doc_store_prefix: Path of the doc store without extension
+        :param append: True to add docs to an existing doc store (e.g. the docs of new collection files)
+        """
+        self.doc_store_prefix = doc_store_prefix
+
+        # Doc id -> (start offset, end offset) in the data file
+        self.doc_offsets = dict()
+        self.docs_offset = 0
+
+        # Path of the data file written, replacing the data file of the store on close unless docs are appended
+        self.docs_path = doc_store_prefix + DOCS_EXT
+
+        if append and doc_store_exists(doc_store_prefix):
+            offsets = array(DOC_OFFSET_TYPECODE)
+            with open(doc_store_prefix + DOC_OFFSETS_EXT, "rb") as offsets_file:
+                offsets.frombytes(offsets_file.read())
+            self.doc_offsets = {doc_idx // 2: (offsets[doc_idx], offsets[doc_idx + 1])
+                                for doc_idx in range(0, len(offsets), 2) if offsets[doc_idx + 1]}
+            self.docs_file = open(self.docs_path, "ab")
+            self.docs_offset = self.docs_file.tell()
+        else:
+            # Readers may have the data file mapped, so it is written next to it instead of being truncated
+            self.docs_path += ".tmp"
+            self.docs_file = open(self.docs_path, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # The doc store is only replaced if all its docs were written
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def add_doc(self, doc):
+        """
+        Method to append a parsed doc to the store
+        :param doc: dict with the doc id, title, body, date and categories (as returned by Parser.parse_documents)
+        :return: None
+        """
+
+        doc_data = pickle.dumps(doc, pickle.HIGHEST_PROTOCOL)
+        self.docs_file.write(doc_data)
+
+        self.doc_offsets[int(doc.get("id"))] = (self.docs_offset, self.docs_offset + len(doc_data))
+        self.docs_offset += len(doc_data)
+
+    def add_docs(self, docs):
+        """
+        Method to append many parsed docs to the store
+        :param docs: Iterable of parsed docs
+        :return: None
+        """
+        for doc in docs:
+            self.add_doc(doc)
+
+    def close(self):
+        """
+        Method to close the data file and save the offsets of the docs
+        :return: None
+        """
+
+        if self.docs_file.closed:
+            return
+
+        self.docs_file.close()
+
+        # Missing doc ids keep the (0, 0) offsets of an empty doc
+        offsets = array(DOC_OFFSET_TYPECODE, [0]) * (2 * (max(self.doc_offsets) + 1) if self.doc_offsets else 0)
+        for doc_id, (start_offset, end_offset) in self.doc_offsets.items():
+            offsets[2 * doc_id] = start_offset
+            offsets[2 * doc_id + 1] = end_offset
+
+        # Once both are written, the data file then the offsets file are replaced atomically, readers that mapped
+        # the previous ones keep reading them
+        tmp_offsets_path = self.doc_store_prefix + DOC_OFFSETS_EXT + ".tmp"
+        with open(tmp_offsets_path, "wb") as offsets_file:
+            offsets.tofile(offsets_file)
+        if self.docs_path != self.doc_store_prefix + DOCS_EXT:
+            os.replace(self.docs_path, self.doc_store_prefix + DOCS_EXT)
+        os.replace(tmp_offsets_path, self.doc_store_prefix + DOC_OFFSETS_EXT)
+
+    def abort(self):
+        """
+        Method to close the data file without saving the offsets: the files of the store are left as they were
+        (docs appended to the data file are not referenced by its offsets)
+        :return: None
+        """
+
+        if self.docs_file.closed:
+            return
+
+        self.docs_file.close()
+        if self.docs_path != self.doc_store_prefix + DOCS_EXT and os.path.exists(self.docs_path):
+            os.remove(self.docs_path)
+
+
+class DocStoreReader:
+    """
+    Class to read docs from the doc store: a doc is read with one lookup of its offsets and one slice of the data file
+    """
+
+    def __init__(self, doc_store_prefix=DOC_STORE_PREFIX):
+        """
+        Constructor mapping the data and offsets files of the doc store
+        :param doc_store_prefix: Path of the doc store without extension
+        """
+        self.doc_store_prefix = doc_store_prefix
+        self.open_files()
+
+    def open_files(self):
+        """
+        Method to map the data and offsets files, e.g. again once docs were appended to the store
+        :return: None
+        """
+        self.docs = self.__map_file(self.doc_store_prefix + DOCS_EXT)
+        offsets_file = self.__map_file(self.doc_store_prefix + DOC_OFFSETS_EXT)
+        self.doc_offsets = memoryview(offsets_file).cast(DOC_OFFSET_TYPECODE)
+
+    def __len__(self):
+        return sum(1 for doc_idx in range(1, len(self.doc_offsets), 2) if self.doc_offsets[doc_idx])
+
+    def __contains__(self, doc_id):
+        return 0 <= 2 * doc_id < len(self.doc_offsets) and self.doc_offsets[2 * doc_id + 1] > 0
+
+    def get_doc(self, doc_id):
+        """
+        Method to read a doc
+        :param doc_id: Doc id (NEWID)
+        :return: dict with the doc id, title, body, date and categories, None if the doc is not in the store
+        """
+        if doc_id not in self:
+            return None
+        return pickle.loads(self.docs[self.doc_offsets[2 * doc_id]:self.doc_offsets[2 * doc_id + 1]])
+
+    def get_docs(self, doc_ids):
+        """
+        Method to read many docs, in the order of the doc ids passed
+        :param doc_ids: Doc ids to read
+        :return: list of docs (docs not in the store are left out)
+        """
+        docs = list()
+        for doc_id in doc_ids:
+            doc = self.get_doc(doc_id)
+            if doc is not None:
+                docs.append(doc)
+        return docs
+
+    def close(self):
+        """
+        Method to unmap the data and offsets files
+        :return: None
+        """
+        offsets_file = self.doc_offsets.obj
+        self.doc_offsets.release()
+
+        for mapped_file in (self.docs, offsets_file):
+            if isinstance(mapped_file, mmap.mmap):
+                mapped_file.close()
+
+    @staticmethod
+    def __map_file(path):
+        """
+        Helper method to memory-map a file in read-only mode
+        :param path: Path of the file
+        :return: mmap of the file (empty bytes if the file is empty)
+        """
+        with open(path, "rb") as file_obj:
+            if os.fstat(file_obj.fileno()).st_size > 0:
+                return mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        return b""
@@ -0,0 +1,313 @@
+"""
+Script containing the facet index of the Reuters collection: the docs of each topic, place, org and exchange
+the articles are tagged with, and the dates of the docs as a column sorted by date.
+Queries are filtered by facet values and date ranges with doc sets intersected with the docs of their terms,
+and the docs of the results are counted by facet value without reading them.
+The facet index is saved next to the inverted index as <prefix>.fct, a pickled dict with the doc ids of each
+value of each field and the (date, doc id) column, as native arrays.
+"""
+
+import calendar
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from ..doc_sets import SortedDocSet, doc_set, intersect_doc_sets, union_doc_sets
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+# Extension of the facet index file
+FACETS_EXT = ".fct"
+
+# Version of the facet index format, saved in the file
+FACETS_FORMAT_VERSION = 1
+
+# Category fields of the articles indexed as facets (see CATEGORY_FIELDS of the parser)
+FACET_FIELDS = ("topics", "places", "orgs", "exchanges")
+
+# Doc ids are saved as native unsigned ints, and dates as native signed long longs (seconds since the epoch, UTC)
+FACET_DOC_ID_TYPECODE = "I"
+DATE_TYPECODE = "q"
+
+# Date of an article (e.g. 26-FEB-1987 15:01:01.79), and date bound of a filter (e.g. 1987-02-26 or
+# 1987-02-26 15:01:01)
+REUTERS_DATE_REGEXP = re.compile(r"(\d{1,2})-([a-zA-Z]{3})-(\d{4})\s+(\d{1,2}):(\d{2}):(\d{2})")
+DATE_BOUND_REGEXP = re.compile(r"^\s*(\d{4})-(\d{1,2})-(\d{1,2})(?:[\sT]+(\d{1,2}):(\d{2})(?::(\d{2}))?)?\s*$")
+MONTHS = ("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC")
+
+# Keys of the bounds of a date range in the filters of a query
+DATE_FROM_FILTER = "date_from"
+DATE_TO_FILTER = "date_to"
+
+
+def facets_exist(index_prefix):
+    """
+    Function to check if a facet index was saved with the prefix passed
+    :param index_prefix: Path of the inverted index without extension
+    :return: True if the facet index file exists, False otherwise
+    """
+    return os.path.exists(index_prefix + FACETS_EXT)
+
+
+def parse_reuters_date(text):
+    """
+    Function to read the date of an article
+    :param text: Date of the article, as parsed from its <DATE> tag
+    :return: Seconds since the epoch, None if the date cannot be read
+    """
+    date_match = REUTERS_DATE_REGEXP.search(text or "")
+    if not date_match or date_match.group(2).upper() not in MONTHS:
+        return None
+
+    day, month, year, hour, minute, second = date_match.groups()
+    try:
+        return calendar.timegm((int(year), MONTHS.index(month.upper()) + 1, int(day), int(hour), int(minute),
+                                int(second)))
+    except ValueError:
+        return None
+
+
+def parse_date_bound(text, end=False):
+    """
+    Function to read a bound of a date range
+    :param text: Date as YYYY-MM-DD, or YYYY-MM-DD HH:MM[:SS]
+    :param end: True for the end of the range: a date without a time is then the end of the day
+    :return: Seconds since the epoch
+    :raise ValueError: If the date cannot be read
+    """
+    bound_match = DATE_BOUND_REGEXP.match(text)
+    if not bound_match:
+        raise ValueError("Invalid date: %s" % text)
+
+    year, month, day, hour, minute, second = bound_match.groups()
+    if not 1 <= int(month) <= 12 or not 1 <= int(day) <= calendar.monthrange(int(year), int(month))[1]:
+        raise ValueError("Invalid date: %s" % text)
+
+    seconds = calendar.timegm((int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0)))
+    if end and hour is None:
+        seconds += 24 * 3600 - 1
+    return seconds
+
+
+def normalize_filters(filters):
+    """
+    Function to check the filters of a query and to get them in a canonical form (e.g. to key the query cache)
+    :param filters: dict with the values asked for some facet fields (a value or a list of values, any of which
+    the docs must have) and the date_from and date_to bounds of a date range (see parse_date_bound)
+    :return: tuple of the sorted (field, values) and (date bound key, seconds since the epoch) pairs,
+    empty if no filter is set
+    :raise ValueError: If a field is not a facet field or a date cannot be read
+    """
+
+    normalized = list()
+    for key, value in (filters or dict()).items():
+        if value is None or value == "" or value == [] or value == ():
+            continue
+
+        if key in (DATE_FROM_FILTER, DATE_TO_FILTER):
+            normalized.append((key, parse_date_bound(value, end=key == DATE_TO_FILTER)))
+        elif key in FACET_FIELDS:
+            values = (value,) if isinstance(value, str) else value
+            normalized.append((key, tuple(sorted(set(value.lower() for value in values)))))
+        else:
+            raise ValueError("Unknown filter: %s" % key)
+
+    return tuple(sorted(normalized))
+
+
+class FacetIndexWriter:
+    """
+    Class to write the facet index from the parsed docs (with their categories). Docs can be added in any order.
+    """
+
+    def __init__(self, index_prefix, append=False):
+        """
+        Constructor for an empty facet index, or holding the docs of the existing one
+        :param index_prefix: Path of the inverted index without extension
+        :param append: True to add docs to an existing facet index (e.g. the docs of new collection files)
+        """
+        self.index_prefix = index_prefix
+
+        # Field -> value -> set of doc ids, and doc id -> date
+        self.field_docs = dict((field, defaultdict(set)) for field in FACET_FIELDS)
+        self.doc_dates = dict()
+
+        if append and facets_exist(index_prefix):
+            facet_reader = FacetIndexReader(index_prefix)
+            for field in FACET_FIELDS:
+                for value, doc_ids in facet_reader.field_doc_ids[field].items():
+                    self.field_docs[field][value].update(doc_ids)
+            self.doc_dates.update(zip(facet_reader.date_doc_ids, facet_reader.dates))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # The facet index is only replaced if all its docs were added
+        if exc_type is None:
+            self.close()
+
+    def add_doc(self, doc):
+        """
+        Method to add the categories and date of a parsed doc
+        :param doc: dict with the doc id, date and categories (as returned by Parser.parse_documents
+        with with_categories set)
+        :return: None
+        """
+        doc_id = int(doc.get("id"))
+        for field in FACET_FIELDS:
+            for value in doc.get(field) or ():
+                self.field_docs[field][value.lower()].add(doc_id)
+
+        doc_date = parse_reuters_date(doc.get("date"))
+        if doc_date is not None:
+            self.doc_dates[doc_id] = doc_date
+
+    def add_docs(self, docs):
+        """
+        Method to add many parsed docs
+        :param docs: Iterable of parsed docs
+        :return: None
+        """
+        for doc in docs:
+            self.add_doc(doc)
+
+    def close(self):
+        """
+        Method to save the facet index. The file is replaced atomically, readers that loaded the previous one
+        keep it.
+        :return: None
+        """
+
+        dated_docs = sorted((doc_date, doc_id) for doc_id, doc_date in self.doc_dates.items())
+        facets = {"version": FACETS_FORMAT_VERSION,
+                  "fields": dict((field, dict((value, array(FACET_DOC_ID_TYPECODE, sorted(doc_ids)).tobytes())
+                                              for value, doc_ids in self.field_docs[field].items()))
+                                 for field in FACET_FIELDS),
+                  "dates": array(DATE_TYPECODE, [doc_date for doc_date, _ in dated_docs]).tobytes(),
+                  "date_doc_ids": array(FACET_DOC_ID_TYPECODE, [doc_id for _, doc_id in dated_docs]).tobytes()}
+
+        tmp_facets_path = self.index_prefix + FACETS_EXT + ".tmp"
+        try:
+            with open(tmp_facets_path, "wb") as facets_file:
+                pickle.dump(facets, facets_file, pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            # The previous facet index is kept
+            if os.path.exists(tmp_facets_path):
+                os.remove(tmp_facets_path)
+            raise
+        os.replace(tmp_facets_path, self.index_prefix + FACETS_EXT)
+
+
+class FacetIndexReader:
+    """
+    Class to read the facet index: the doc set of a facet value is built on first use, and a date range is
+    a slice of the sorted date column found with two binary searches
+    """
+
+    def __init__(self, index_prefix):
+        """
+        Constructor loading the facet index
+        :param index_prefix: Path of the inverted index without extension
+        """
+        with open(index_prefix + FACETS_EXT, "rb") as facets_file:
+            facets = pickle.load(facets_file)
+
+        if facets.get("version") != FACETS_FORMAT_VERSION:
+            raise ValueError("Unsupported facet index format version: %s" % facets.get("version"))
+
+        # Field -> value -> sorted array of doc ids
+        self.field_doc_ids = dict()
+        for field in FACET_FIELDS:
+            self.field_doc_ids[field] = dict()
+            for value, doc_ids_bytes in facets["fields"].get(field, dict()).items():
+                doc_ids = array(FACET_DOC_ID_TYPECODE)
+                doc_ids.frombytes(doc_ids_bytes)
+                self.field_doc_ids[field][value] = doc_ids
+
+        # Dates of the docs in ascending order, and the doc id of each date
+        self.dates = array(DATE_TYPECODE)
+        self.dates.frombytes(facets["dates"])
+        self.date_doc_ids = array(FACET_DOC_ID_TYPECODE)
+        self.date_doc_ids.frombytes(facets["date_doc_ids"])
+
+        # (field, value) -> doc set, built on first use
+        self.value_doc_sets = dict()
+
+    def values(self, field):
+        """
+        Method to get the values of a facet field
+        :param field: Facet field
+        :return: Sorted list of values
+        """
+        return sorted(self.field_doc_ids.get(field, ()))
+
+    def value_docs(self, field, value):
+        """
+        Method to get the docs of a facet value
+        :param field: Facet field
+        :param value: Value of the field (in lower case)
+        :return: Doc set (empty if no doc has the value)
+        """
+        docs = self.value_doc_sets.get((field, value))
+        if docs is None:
+            doc_ids = self.field_doc_ids.get(field, dict()).get(value)
+            docs = self.value_doc_sets[(field, value)] = doc_set(doc_ids) if doc_ids is not None else SortedDocSet()
+        return docs
+
+    def date_range_docs(self, start=None, end=None):
+        """
+        Method to get the docs dated within a range
+        :param start: Seconds since the epoch of the start of the range, included (None for no start)
+        :param end: Seconds since the epoch of the end of the range, included (None for no end)
+        :return: Doc set
+        """
+        start_idx = bisect_left(self.dates, start) if start is not None else 0
+        end_idx = bisect_right(self.dates, end) if end is not None else len(self.dates)
+        return doc_set(sorted(self.date_doc_ids[start_idx:end_idx]))
+
+    def filter_docs(self, filters):
+        """
+        Method to get the docs passing the filters of a query: the docs with any of the values asked for each field,
+        and dated within the range asked
+        :param filters: Filters in canonical form (see normalize_filters)
+        :return: Doc set, None if no filter is set
+        """
+
+        if not filters:
+            return None
+
+        doc_sets = list()
+        date_bounds = dict()
+        for key, value in filters:
+            if key in (DATE_FROM_FILTER, DATE_TO_FILTER):
+                date_bounds[key] = value
+            else:
+                doc_sets.append(union_doc_sets([self.value_docs(key, field_value) for field_value in value]))
+
+        if date_bounds:
+            doc_sets.append(self.date_range_docs(date_bounds.get(DATE_FROM_FILTER), date_bounds.get(DATE_TO_FILTER)))
+
+        return intersect_doc_sets(doc_sets)
+
+    def counts(self, docs, fields=FACET_FIELDS, top=None):
+        """
+        Method to count the docs of a doc set having each facet value
+        :param docs: Doc set (e.g. of the results of a query)
+        :param fields: Facet fields to count
+        :param top: Max no. of values returned per field (None for all)
+        :return: dict with the list of (value, no. of docs) of each field, in descending order of no. of docs
+        (values without any doc are left out)
+        """
+        field_counts = dict()
+        for field in fields:
+            value_counts = ((value, len(self.value_docs(field, value) & docs)) for value in self.values(field))
+            value_counts = sorted((value_count for value_count in value_counts if value_count[1]),
+                                  key=lambda value_count: (-value_count[1], value_count[0]))
+            field_counts[field] = value_counts[:top] if top is not None else value_counts
+        return field_counts
@@ -2,11 +2,21 @@
 Script containing the class to construct the index. It uses the SPIMI (Single PAss In-Memory Index) Algorithm
 """
 
+import heapq
+import io
 import json
+import re
 import sys
 import shutil
 import os
-from collections import OrderedDict
+from array import array
+from collections import OrderedDict, defaultdict
+from contextlib import ExitStack
+from itertools import groupby
+from operator import itemgetter
+
+from ..index_storage import DiskIndexReader, DiskIndexWriter, PostingsList, decode_postings_freqs, encode_positions, \
+    encode_postings, iter_doc_positions, iter_records, write_record
 
 try:
     import cPickle as pickle
@@ -14,34 +24,313 @@ except:
     import pickle
 
 
+# Directory where the inverted index is saved
+PARSED_DATA_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "..", "parsed_data")
+
+# Pickle opcodes are written in batches of this many items for lists and dicts
+PICKLE_BATCH_SIZE = 1000
+
+# Largest payload held in one pickle frame (protocol 4+) and the cost in bytes of the FRAME opcode
+PICKLE_FRAME_TARGET = 64 * 1024
+PICKLE_FRAME_OVERHEAD = 9
+
+# Size of the PROTO, EMPTY_LIST/EMPTY_DICT, MEMOIZE and STOP opcodes every pickle starts and ends with
+PICKLE_BASE_OVERHEAD = 5
+
+# Postings (and positions) of a block are kept in memory as arrays of native unsigned ints of this type code
+BLOCK_POSTINGS_TYPECODE = "I"
+
+# Name of the block files written by spimi_invert, with the block prefix of the constructor that wrote them
+BLOCK_FILE_REGEXP = re.compile(r"^block_(.*?)\d{5,}\.bin$")
+
+
+def write_block_record(term, postings, file_obj, with_freqs=False, with_positions=False):
+    """
+    Function to append a term and its compressed postings list to a block file
+    :param term: The term, or its id in the term dictionary of the constructor
+    :param postings: Sorted iterable of doc ids (repeated once per occurrence with term frequencies),
+    or list of (doc_id, position) pairs with positions
+    :param file_obj: Binary file object of the block
+    :param with_freqs: True to save the term frequency of each doc
+    :param with_positions: True to save the position of each occurrence
+    :return: None
+    """
+
+    if not with_positions:
+        write_record((term, encode_postings(postings, with_freqs)), file_obj)
+        return
+
+    doc_ids, positions = split_positions(postings)
+    write_record((term, encode_postings(doc_ids, True), encode_positions(doc_ids, positions)), file_obj)
+
+
+def iter_block_records(file_obj, with_freqs=False, with_positions=False, terms=None):
+    """
+    Generator over the terms of a block file, in sorted order of terms
+    :param file_obj: Binary file object of the block
+    :param with_freqs: True if the block was saved with term frequencies
+    :param with_positions: True if the block was saved with positions
+    :param terms: Term of each term id if the block was saved with term ids (None if it was saved with the terms)
+    :return: generator of (term, postings list), with a doc id repeated once per occurrence with term frequencies,
+    or with one (doc_id, position) pair per occurrence with positions
+    """
+
+    if with_positions:
+        for term, postings_data, positions_data in iter_records(file_obj):
+            yield terms[term] if terms is not None else term, \
+                [(doc_id, position) for doc_id, positions in iter_doc_positions(postings_data, positions_data)
+                 for position in positions]
+        return
+
+    for term, postings_data in iter_records(file_obj):
+        postings = list()
+        for doc_id, term_freq in decode_postings_freqs(postings_data, with_freqs=with_freqs):
+            postings.extend([doc_id] * term_freq)
+        yield terms[term] if terms is not None else term, postings
+
+
+def split_positions(postings):
+    """
+    Function to split a postings list of (doc_id, position) pairs
+    :param postings: Sorted list of (doc_id, position) pairs
+    :return: tuple with the list of doc ids (repeated once per occurrence) and the list of positions
+    """
+    return [doc_id for doc_id, _ in postings], [position for _, position in postings]
+
+
+def count_docs(postings):
+    """
+    Function to count the distinct doc ids of a postings list
+    :param postings: Sorted list of doc ids, possibly repeated
+    :return: No. of docs
+    """
+    return sum(1 for _ in groupby(postings))
+
+
+class BlockSizeEstimator:
+    """
+    Keeps a running estimate of the bytes __get_dump_size would report for a SPIMI block dictionary.
+    The pickle layout of the sorted keys list and of the block dict is accounted for opcode by opcode
+    as terms and postings are added, so the estimate costs O(1) per token instead of pickling the block.
+    The positions of a positional block are accounted for as a second dict of term id to positions list.
+    """
+
+    def __init__(self):
+        """
+        Constructor for an estimator of an empty block
+        """
+        self.no_terms = 0
+
+        # Payload of the keys list pickle and of the block dict pickle, without their framing
+        self.keys_bytes = 0
+        self.dict_bytes = 0
+
+        # Payload of the positions dict pickle, only counted once a position was added
+        self.no_position_terms = 0
+        self.positions_bytes = 0
+
+    @property
+    def size(self):
+        """
+        Estimated size in bytes of the block, as returned by sys.getsizeof on both pickles
+        :return: Size in bytes
+        """
+        size = self.__pickle_size(self.keys_bytes) + self.__pickle_size(self.dict_bytes)
+        if self.no_position_terms:
+            size += self.__pickle_size(self.positions_bytes)
+        return size
+
+    def add_term(self, term, doc_id):
+        """
+        Method to account for a new term added to the block with its first posting
+        :param term: The new term, or its term id
+        :param doc_id: First doc id of the term's postings list
+        :return: None
+        """
+        term_bytes = self.__int_size(term) if isinstance(term, int) else self.__str_size(term)
+        items_delta = self.__batch_overhead(self.no_terms + 1) - self.__batch_overhead(self.no_terms)
+        self.no_terms += 1
+
+        self.keys_bytes += term_bytes + items_delta
+
+        # Key, EMPTY_LIST + MEMOIZE for the postings list and the first posting with its APPEND
+        self.dict_bytes += term_bytes + items_delta + 2 + self.__int_size(doc_id) + 1
+
+    def add_posting(self, postings_len, doc_id):
+        """
+        Method to account for a doc id appended to an existing postings list
+        :param postings_len: Length of the postings list before the doc id is appended
+        :param doc_id: Doc id appended
+        :return: None
+        """
+        self.dict_bytes += self.__int_size(doc_id) + self.__batch_overhead(postings_len + 1) - \
+            self.__batch_overhead(postings_len)
+
+    def add_position(self, term, positions_len, position):
+        """
+        Method to account for a position appended to the positions list of a term
+        :param term: The term, or its term id
+        :param positions_len: Length of the positions list of the term before the position is appended,
+        0 for the first position of the term in the block
+        :param position: Position appended
+        :return: None
+        """
+        if positions_len == 0:
+            term_bytes = self.__int_size(term) if isinstance(term, int) else self.__str_size(term)
+            items_delta = self.__batch_overhead(self.no_position_terms + 1) - \
+                self.__batch_overhead(self.no_position_terms)
+            self.no_position_terms += 1
+
+            # Key, EMPTY_LIST + MEMOIZE for the positions list and the first position with its APPEND
+            self.positions_bytes += term_bytes + items_delta + 2 + self.__int_size(position) + 1
+        else:
+            self.positions_bytes += self.__int_size(position) + self.__batch_overhead(positions_len + 1) - \
+                self.__batch_overhead(positions_len)
+
+    @staticmethod
+    def __pickle_size(payload_bytes):
+        """
+        Helper method to get the sys.getsizeof of a pickle from the size of its opcodes payload
+        :param payload_bytes: Bytes taken by the items of the pickled container
+        :return: Size in bytes
+        """
+        if payload_bytes == 0:
+            # Empty containers are too small to be framed
+            return sys.getsizeof(b"") + PICKLE_BASE_OVERHEAD
+
+        no_frames = payload_bytes // PICKLE_FRAME_TARGET + 1
+        return sys.getsizeof(b"") + PICKLE_BASE_OVERHEAD + payload_bytes + no_frames * PICKLE_FRAME_OVERHEAD
+
+    @staticmethod
+    def __batch_overhead(no_items):
+        """
+        Helper method to get the bytes of the MARK/APPENDS (or SETITEMS) opcodes for a container
+        :param no_items: No. of items in the list or dict
+        :return: Overhead in bytes
+        """
+        full_batches, remaining = divmod(no_items, PICKLE_BATCH_SIZE)
+        overhead = 2 * full_batches
+        if remaining == 1:
+            overhead += 1
+        elif remaining > 1:
+            overhead += 2
+        return overhead
+
+    @staticmethod
+    def __str_size(term):
+        """
+        Helper method to get the size of a pickled and memoized string
+        :param term: String to measure
+        :return: Size in bytes
+        """
+        encoded_len = len(term.encode("utf-8", "surrogatepass"))
+        header = 2 if encoded_len < 256 else 5
+        return header + encoded_len + 1
+
+    @staticmethod
+    def __int_size(value):
+        """
+        Helper method to get the size of a pickled int
+        :param value: Int to measure
+        :return: Size in bytes
+        """
+        if 0 <= value < 256:
+            return 2
+        elif 0 <= value < 65536:
+            return 3
+        elif -2 ** 31 <= value < 2 ** 31:
+            return 5
+        return 3 + (value.bit_length() + 8) // 8
+
+
 class IndexConstructor:
     """
     Index Contructor that gets a token stream and block size in bytes and then creates the index
     based on the SPIMI alogrithm
     """
 
-    def __init__(self, token_stream, block_size=10240):
+    def __init__(self, token_stream, block_size=10240, size_accounting="incremental", tmp_dir=None,
+                 merge_mode="stream", merge_fan_in=256, read_buffer=io.DEFAULT_BUFFER_SIZE, block_prefix="",
+                 store_freqs=True, deleted_docs=None, store_positions=False):
         """
         Constructor receiving a token stream and the block size in bytes
-        :param token_stream: String with pairs of <term and doc_id>
+        :param token_stream: Iterable of <term, doc_id> pairs (a list or a generator), read once
         :param block_size: The block size for the SPIMI algorithm to use in bytes
+        :param size_accounting: "incremental" to keep a running estimate of the block size,
+        "pickle" to pickle the block on every token to measure it
+        :param tmp_dir: Directory where to save the blocks (defaults to tmp_block_dir next to this script)
+        :param merge_mode: "stream" to merge the blocks with a k-way merge written straight to the on-disk
+        index (lexicon and postings files), "memory" to merge all blocks in memory before saving the index
+        :param merge_fan_in: Max no. of blocks opened at once by the k-way merge
+        :param read_buffer: Size in bytes of the read buffer of each block opened by the k-way merge
+        :param block_prefix: Prefix of the block files' no. so that many constructors can share the blocks' directory
+        :param store_freqs: True to keep the term frequency of each doc in the postings (for ranked retrieval),
+        False to only keep distinct doc ids
+        :param deleted_docs: DeletionBitmap of the docs to compact away from the postings when merging the blocks
+        (None to keep all the docs)
+        :param store_positions: True to keep the position of each occurrence of a term in a doc (for phrase queries),
+        the position being the no. of tokens of the doc before it. Needs term frequencies.
         """
         self.token_stream = token_stream
         self.block_size = block_size
 
+        if size_accounting not in ("incremental", "pickle"):
+            raise ValueError("Unknown size accounting mode: %s" % size_accounting)
+        self.size_accounting = size_accounting
+
+        if merge_mode not in ("stream", "memory"):
+            raise ValueError("Unknown merge mode: %s" % merge_mode)
+        self.merge_mode = merge_mode
+        self.merge_fan_in = max(2, merge_fan_in)
+        self.read_buffer = read_buffer
+        self.store_freqs = store_freqs
+
+        if store_positions and not store_freqs:
+            raise ValueError("Positions can only be stored with term frequencies")
+        self.store_positions = store_positions
+
+        # No. of tokens of each doc inverted by this constructor, and of all the docs of the merged index
+        self.doc_lengths = defaultdict(int)
+        self.merged_doc_lengths = dict()
+
+        # Term dictionary of the terms inverted by this constructor: term -> dense term id, and term of each term id.
+        # Blocks are keyed by term id, so that each term string is only kept (and saved) once.
+        self.term_ids = dict()
+        self.terms = list()
+
+        # Total size in bytes of the block files saved by this constructor
+        self.no_block_bytes = 0
+
         # To keep track of the no of blocks and for the file name of the block
         self.block_no = 1
+        self.block_prefix = block_prefix
 
         # Path to save the block file
-        self.tmp_file_dir_path = os.path.join(os.path.abspath(os.path.dirname(os.path.relpath(__file__))),
-                                              "tmp_block_dir")
+        self.tmp_file_dir_path = tmp_dir if tmp_dir is not None else \
+            os.path.join(os.path.abspath(os.path.dirname(os.path.relpath(__file__))), "tmp_block_dir")
 
-        # Path to save the final inverted index
-        self.inverted_index_path = os.path.join(os.path.relpath(__file__), "..", "..", "parsed_data", "inverted_index.bin")
+        # Path to save the final inverted index (the on-disk index uses the same path without extension as prefix)
+        self.inverted_index_path = os.path.join(PARSED_DATA_DIR, "inverted_index.bin")
 
-        # Inverted index will be an ordered dictionary
+        # Inverted index will be an ordered dictionary (only filled when merging in memory)
         self.inverted_index = OrderedDict()
 
+        # Stats of the inverted index when merged straight to disk
+        self.no_terms = 0
+        self.no_postings = 0
+
+        # Deleted docs removed from the postings while merging, and no. of doc ids removed
+        self.deleted_docs = deleted_docs if deleted_docs else None
+        self.no_compacted_postings = 0
+
+    @property
+    def index_prefix(self):
+        """
+        Path without extension of the lexicon and postings files of the on-disk index
+        :return: Prefix of the index files
+        """
+        return os.path.splitext(self.inverted_index_path)[0]
+
     def construct_index(self, clear_tmp=True, get_stats=False, save_json=False):
         """
         Main method to construct the inverted index by a sequence of steps
@@ -52,19 +341,33 @@ class IndexConstructor:
         """
 
         print("Making new directory for blocks' file")
-        self.__clear_tmp_block_dir()
-        self.__make_tmp_block_dir()
+        self.reset_tmp_block_dir()
 
         print("Inverting the block files with SPIMI")
         self.spimi_invert()
 
+        return self.merge_index(clear_tmp=clear_tmp, get_stats=get_stats, save_json=save_json)
+
+    def merge_index(self, clear_tmp=True, get_stats=False, save_json=False):
+        """
+        Method to merge the blocks found in the blocks' directory into the inverted index
+        :param clear_tmp: True to clear the temp blocks, False not to clear
+        :param get_stats: True to get stats on the inverted index, False otherwise
+        :param save_json: True to save the inverted index in JSON
+        :return: the path to the complete inverted index
+        """
+
         print("Merging the blocks to make index")
-        self.merge_blocks()
+        if self.merge_mode == "stream":
+            self.merge_blocks_streaming()
+        else:
+            self.merge_blocks()
 
         if clear_tmp:
             print("Clearing temporary folder for the blocks file")
             self.__clear_tmp_block_dir()
-            self.__dump_inverted_index()
+            if self.merge_mode == "memory":
+                self.__dump_inverted_index()
 
         if save_json:
             self.save_index_json()
@@ -77,42 +380,90 @@ class IndexConstructor:
     def spimi_invert(self):
         """
         SPIMI Algorithm to create the inverted index using blocks.
-        - The algorithm will pass through the token stream
+        - The algorithm will pass once through the token stream, which can be any iterable (e.g. a generator)
+        - Each term gets a term id the first time it is seen, and the blocks are keyed by term id
         - For each term, if it does not exist for a new dict for each block, add it to the dict
-        - If term exists in dict, add doc id to the term's postings list
+        - If term exists in dict, add doc id to the term's postings list (once per occurrence with term frequencies)
+        - Postings lists are arrays of ints
+        - With positions, the position of each occurrence is kept in an array next to the postings list
         - The algorihtm checks that the dictionary does not grow more thatn the block size in bytes
         - If this occurs, the block is saved in memory
+        - The block size is either kept as a running estimate (incremental) or measured by pickling the block
+        - The length of the docs and the term dictionary are saved next to the blocks
         :return: None
         """
 
-        list_idx = 0
+        incremental = self.size_accounting == "incremental"
+        doc_lengths = self.doc_lengths
+        store_positions = self.store_positions
+        term_ids = self.term_ids
+        terms = self.terms
+
+        # Pairs are pulled one at a time, so that a lazy token stream is never held in memory
+        token_pairs = iter(self.token_stream)
+        token_pair = next(token_pairs, None)
 
         # Make sure to go through all tokens
-        while self.__check_idx(list_idx):
+        while token_pair is not None:
 
             block_dict = dict()
+            block_positions = dict()
+            size_estimator = BlockSizeEstimator()
+            block_bytes = size_estimator.size
 
-            # Make sure to respect block size and that list indexing does not overflow
-            while self.__get_dump_size(block_dict) < self.block_size and self.__check_idx(list_idx):
+            # Make sure to respect block size and stop at the end of the token stream
+            while block_bytes < self.block_size and token_pair is not None:
 
-                token_pair = self.token_stream[list_idx]
                 term, doc_id = token_pair[0], int(token_pair[1])
-                term_posting_list = []
-                if term not in block_dict:
-                    block_dict[term] = term_posting_list
+                doc_lengths[doc_id] += 1
+
+                term_id = term_ids.get(term)
+                if term_id is None:
+                    term_id = term_ids[term] = len(terms)
+                    terms.append(term)
+
+                if store_positions:
+                    position = doc_lengths[doc_id] - 1
+                    if term_id in block_positions:
+                        term_positions = block_positions[term_id]
+                        if incremental:
+                            size_estimator.add_position(term_id, len(term_positions), position)
+                        term_positions.append(position)
+                    else:
+                        block_positions[term_id] = array(BLOCK_POSTINGS_TYPECODE, [position])
+                        if incremental:
+                            size_estimator.add_position(term_id, 0, position)
+
+                if term_id not in block_dict:
+                    block_dict[term_id] = array(BLOCK_POSTINGS_TYPECODE, [doc_id])
+                    if incremental:
+                        size_estimator.add_term(term_id, doc_id)
                 else:
-                    term_posting_list = block_dict[term]
+                    term_posting_list = block_dict[term_id]
+                    if self.store_freqs or doc_id not in term_posting_list:
+                        if incremental:
+                            size_estimator.add_posting(len(term_posting_list), doc_id)
+                        term_posting_list.append(doc_id)
 
-                if doc_id not in term_posting_list:
-                    term_posting_list.insert(len(term_posting_list), doc_id)
+                token_pair = next(token_pairs, None)
 
-                list_idx += 1
+                if incremental:
+                    block_bytes = size_estimator.size
+                else:
+                    block_bytes = self.__get_dump_size(block_dict, block_positions)
 
-            sorted_terms = sorted(block_dict)
+            # Term ids in sorted order of their terms
+            sorted_terms = sorted(block_dict, key=terms.__getitem__)
 
-            self.save_block_data(sorted_terms, block_dict)
+            if store_positions:
+                self.save_block_data(sorted_terms, block_dict, block_positions)
+            else:
+                self.save_block_data(sorted_terms, block_dict)
             self.block_no += 1
 
+        self.save_doc_lengths()
+        self.save_term_dictionary()
+
     def merge_blocks(self):
         """
         Method to merge the different blocks generated by the SPIMI Algorithm into the complete inverted index
@@ -122,6 +473,7 @@ class IndexConstructor:
 
         # Get the block files in ascending order of size
         file_list = self.get_sorted_block_files()
+        term_dictionaries = self.load_term_dictionaries()
         tmp_inverted_idx = dict()
 
         for block_file in file_list:
@@ -129,22 +481,128 @@ class IndexConstructor:
             # Open file and merge with in memory inverted index
             try:
                 with open(os.path.join(self.tmp_file_dir_path, block_file[1]), "rb") as file_obj:
-                    sorted_terms = pickle.load(file_obj)
-                    block_dict = pickle.load(file_obj)
+                    for term, postings in iter_block_records(file_obj, self.store_freqs, self.store_positions,
+                                                             self.block_terms(block_file[1], term_dictionaries)):
+                        # If new term in final index, add to it, if not merge the postings list
+                        if term not in tmp_inverted_idx:
+                            tmp_inverted_idx[term] = postings
+                        else:
+                            tmp_inverted_idx[term] = self.merge_postings_list(tmp_inverted_idx[term], postings)
             except (IOError, OSError):
                 print("Unable to load block file")
                 exit(1)
-            else:
-                for term in sorted_terms:
-                    # If new term in final index, add to it, if not merge the postings list
-                    if term not in tmp_inverted_idx:
-                        tmp_inverted_idx[term] = block_dict[term]
-                    else:
-                        tmp_inverted_idx[term] = self.merge_postings_list(tmp_inverted_idx[term], block_dict[term])
 
         # Get sorted tmp index and store
         for term in sorted(tmp_inverted_idx):
-            self.inverted_index[term] = tmp_inverted_idx[term]
+            postings = self.compact_postings(tmp_inverted_idx[term])
+            if postings:
+                self.inverted_index[term] = postings
+
+        self.merged_doc_lengths = self.load_doc_lengths()
+
+    def merge_blocks_streaming(self):
+        """
+        Method to merge the blocks with a heap-based k-way merge written straight to the on-disk inverted index
+        - Each block is read as a stream of terms in sorted order
+        - If there are more blocks than the merge fan-in, groups of blocks are first merged into bigger blocks
+        - Memory is bounded by the no. of blocks opened at once times the read buffer
+        :return: None
+        """
+
+        block_paths = [os.path.join(self.tmp_file_dir_path, block_file[1])
+                       for block_file in self.get_sorted_block_files()]
+        term_dictionaries = self.load_term_dictionaries()
+
+        merge_pass = 1
+        while len(block_paths) > self.merge_fan_in:
+            merged_paths = list()
+            for group_start in range(0, len(block_paths), self.merge_fan_in):
+                group_paths = block_paths[group_start:group_start + self.merge_fan_in]
+                merged_path = os.path.join(self.tmp_file_dir_path, "merged_%02d_%05d.bin" % (merge_pass, len(merged_paths)))
+
+                try:
+                    with open(merged_path, "wb") as merged_file:
+                        for term, postings in self.merge_block_streams(group_paths, term_dictionaries):
+                            write_block_record(term, postings, merged_file, self.store_freqs, self.store_positions)
+                    for group_path in group_paths:
+                        os.remove(group_path)
+                except (IOError, OSError):
+                    print("Unable to merge block files")
+                    exit(1)
+
+                merged_paths.append(merged_path)
+
+            block_paths = merged_paths
+            merge_pass += 1
+
+        self.no_terms = self.no_postings = 0
+        try:
+            with DiskIndexWriter(self.index_prefix, self.store_freqs, self.store_positions) as index_writer:
+                index_writer.set_doc_lengths(self.load_doc_lengths())
+                for term, postings in self.merge_block_streams(block_paths, term_dictionaries):
+                    postings = self.compact_postings(postings)
+                    if not postings:
+                        continue
+
+                    positions = None
+                    if self.store_positions:
+                        postings, positions = split_positions(postings)
+                        positions = encode_positions(postings, positions)
+                    postings = PostingsList.from_doc_ids(postings, self.store_freqs)
+                    index_writer.add_term(term, postings, positions)
+                    self.no_terms += 1
+                    self.no_postings += postings.doc_freq
+        except (IOError, OSError):
+            print("Unable to write inverted index")
+            exit(1)
+
+    def merge_block_streams(self, block_paths, term_dictionaries=None):
+        """
+        Generator doing a k-way merge of sorted block files, merging the postings list of a term found in many blocks
+        :param block_paths: Paths of the blocks to merge
+        :param term_dictionaries: Term dictionaries of the constructors that saved the blocks, by block prefix
+        (None to load them from the blocks' directory)
+        :return: generator of (term, postings) in sorted order of terms
+        """
+
+        if term_dictionaries is None:
+            term_dictionaries = self.load_term_dictionaries()
+
+        with ExitStack() as stack:
+            block_streams = [iter_block_records(stack.enter_context(open(block_path, "rb", buffering=self.read_buffer)),
+                                                self.store_freqs, self.store_positions,
+                                                self.block_terms(os.path.basename(block_path), term_dictionaries))
+                             for block_path in block_paths]
+
+            current_term, current_postings = None, None
+            for term, postings in heapq.merge(*block_streams, key=itemgetter(0)):
+                if term == current_term:
+                    current_postings = self.merge_postings_list(current_postings, postings)
+                    continue
+
+                if current_term is not None:
+                    yield current_term, current_postings
+                current_term, current_postings = term, postings
+
+            if current_term is not None:
+                yield current_term, current_postings
+
+    def compact_postings(self, postings):
+        """
+        Method to remove the deleted docs from a merged postings list
+        :param postings: Sorted list of doc ids (or of (doc_id, position) pairs with positions)
+        :return: list of the doc ids not deleted (the list passed if no doc is deleted)
+        """
+        if self.deleted_docs is None:
+            return postings
+
+        if self.store_positions:
+            deleted_doc_ids = self.deleted_docs.as_set()
+            compacted_postings = [posting for posting in postings if posting[0] not in deleted_doc_ids]
+        else:
+            compacted_postings = self.deleted_docs.filter(postings)
+        self.no_compacted_postings += len(postings) - len(compacted_postings)
+        return compacted_postings
 
     def get_sorted_block_files(self):
         """
@@ -155,6 +613,9 @@ class IndexConstructor:
         files = os.listdir(self.tmp_file_dir_path)
         file_pairs = list()
         for file in files:
+            if not file.startswith("block_"):
+                continue
+
             file_path = os.path.join(self.tmp_file_dir_path, file)
             # Store as a tuple pair
             file_pairs.append((os.path.getsize(file_path), file))
@@ -166,12 +627,16 @@ class IndexConstructor:
 
     def merge_postings_list(self, first_list, second_list):
         """
-        Method to merge two postings lists
+        Method to merge two postings lists. With term frequencies, the occurrences of a doc in both lists are kept
+        (with positions, the (doc_id, position) pairs are merged in order).
         :param first_list: First list to merge
         :param second_list: Second list to merge
         :return:
         """
 
+        if self.store_freqs:
+            return list(heapq.merge(first_list, second_list))
+
         iter_first_list = iter(first_list)
         iter_scnd_list = iter(second_list)
 
@@ -203,33 +668,139 @@ class IndexConstructor:
 
         return merged_list
 
-    def save_block_data(self, sorted_keys, block_dict):
+    def save_block_data(self, sorted_keys, block_dict, block_positions=None):
         """
-        Method to save datas in a block file
-        :param sorted_keys: Sorted terms
-        :param block_dict: The entire block dict with the postings list
+        Method to save datas in a block file, as a stream of (term id, compressed postings) records in sorted order
+        of terms
+        :param sorted_keys: Term ids in sorted order of their terms
+        :param block_dict: The entire block dict with the postings list of each term id
+        :param block_positions: dict with the positions of the occurrences in the postings list of each term id
+        (None without positions)
         :return: None
         """
 
-        block_path = os.path.join(self.tmp_file_dir_path, "block_%05d.bin" % self.block_no)
+        block_path = os.path.join(self.tmp_file_dir_path, "block_%s%05d.bin" % (self.block_prefix, self.block_no))
 
         try:
             with open(block_path, "wb") as tmp_file:
-                self.__dump_pickle(sorted_keys, tmp_file)
-                self.__dump_pickle(block_dict, tmp_file)
+                for term in sorted_keys:
+                    if block_positions is not None:
+                        write_block_record(term, list(zip(block_dict[term], block_positions[term])), tmp_file,
+                                           self.store_freqs, True)
+                    else:
+                        write_block_record(term, block_dict[term], tmp_file, self.store_freqs)
+                self.no_block_bytes += tmp_file.tell()
         except (IOError, OSError):
             print("Error saving block file")
             exit(1)
 
+    def save_doc_lengths(self):
+        """
+        Method to save the length of the docs inverted by this constructor in the blocks' directory
+        :return: None
+        """
+
+        doc_lengths_path = os.path.join(self.tmp_file_dir_path, "doc_lengths_%s.bin" % self.block_prefix)
+
+        try:
+            with open(doc_lengths_path, "wb") as tmp_file:
+                write_record(dict(self.doc_lengths), tmp_file)
+        except (IOError, OSError):
+            print("Error saving doc lengths file")
+            exit(1)
+
+    def save_term_dictionary(self):
+        """
+        Method to save the term dictionary of the blocks saved by this constructor in the blocks' directory
+        :return: None
+        """
+
+        term_dictionary_path = os.path.join(self.tmp_file_dir_path, "terms_%s.bin" % self.block_prefix)
+
+        try:
+            with open(term_dictionary_path, "wb") as tmp_file:
+                write_record(self.terms, tmp_file)
+                self.no_block_bytes += tmp_file.tell()
+        except (IOError, OSError):
+            print("Error saving term dictionary file")
+            exit(1)
+
+    def load_term_dictionaries(self):
+        """
+        Method to load the term dictionaries saved in the blocks' directory by all constructors
+        :return: dict of block prefix -> term of each term id
+        """
+
+        # The term dictionary of this constructor is already in memory
+        term_dictionaries = {self.block_prefix: self.terms} if self.terms else dict()
+        for file in os.listdir(self.tmp_file_dir_path):
+            if not file.startswith("terms_") or file[len("terms_"):-len(".bin")] in term_dictionaries:
+                continue
+
+            try:
+                with open(os.path.join(self.tmp_file_dir_path, file), "rb") as tmp_file:
+                    term_dictionaries[file[len("terms_"):-len(".bin")]] = pickle.load(tmp_file)
+            except (IOError, OSError):
+                print("Unable to load term dictionary file")
+                exit(1)
+
+        return term_dictionaries
+
+    @staticmethod
+    def block_terms(block_file, term_dictionaries):
+        """
+        Method to get the term dictionary a block file was saved with
+        :param block_file: Name of the block file
+        :param term_dictionaries: Term dictionaries by block prefix
+        :return: Term of each term id, None if the block was saved with the terms (blocks of a merge pass)
+        """
+        block_match = BLOCK_FILE_REGEXP.match(block_file)
+        return term_dictionaries.get(block_match.group(1)) if block_match else None
+
+    def load_doc_lengths(self):
+        """
+        Method to load the length of the docs saved in the blocks' directory by all constructors
+        :return: dict of doc id -> no. of tokens (deleted docs are left out)
+        """
+
+        doc_lengths = defaultdict(int)
+        for file in os.listdir(self.tmp_file_dir_path):
+            if not file.startswith("doc_lengths_"):
+                continue
+
+            try:
+                with open(os.path.join(self.tmp_file_dir_path, file), "rb") as tmp_file:
+                    for doc_id, doc_length in pickle.load(tmp_file).items():
+                        if self.deleted_docs is None or doc_id not in self.deleted_docs:
+                            doc_lengths[doc_id] += doc_length
+            except (IOError, OSError):
+                print("Unable to load doc lengths file")
+                exit(1)
+
+        return dict(doc_lengths)
+
     def get_stats(self):
         """
         Method to print stats on the inverted index
         :return: None
         """
 
+        if self.no_block_bytes:
+            print("Total size of the blocks: %d bytes (%d terms in the term dictionary)"
+                  % (self.no_block_bytes, len(self.terms)))
+
+        if self.deleted_docs is not None:
+            print("No. of deleted doc ids compacted: %d" % self.no_compacted_postings)
+
+        if self.merge_mode == "stream":
+            print("No. of distinct terms: %d" % self.no_terms)
+            print("No. of nonpositional postings: %d" % self.no_postings)
+            return
+
         print("No. of distinct terms: %d" % len(self.inverted_index))
 
-        postings_count = sum(len(post_list) for post_list in self.inverted_index.values())
+        postings_count = sum(count_docs(split_positions(post_list)[0] if self.store_positions else post_list)
+                             for post_list in self.inverted_index.values())
         print("No. of nonpositional postings: %d" % postings_count)
 
     def save_index_json(self):
@@ -238,12 +809,27 @@ class IndexConstructor:
         :return: None
         """
         try:
-            with open(os.path.join(os.path.relpath(__file__), "..", "..", "parsed_data", "inverted_index.json"), "w") as dump_file:
-                json.dump(self.inverted_index, dump_file)
+            with open(os.path.join(PARSED_DATA_DIR, "inverted_index.json"), "w") as dump_file:
+                if self.merge_mode == "memory":
+                    json.dump(self.inverted_index, dump_file)
+                else:
+                    # Stream the index from disk one term at a time
+                    dump_file.write("{")
+                    for term_no, (term, postings) in enumerate(DiskIndexReader(self.index_prefix).items()):
+                        dump_file.write("%s%s: %s" % (", " if term_no else "", json.dumps(term), json.dumps(list(postings))))
+                    dump_file.write("}")
         except (IOError, OSError):
             print("Unable to dump inverted index (JSON)")
             exit(1)
 
+    def reset_tmp_block_dir(self):
+        """
+        Method to start from an empty directory for the blocks
+        :return: None
+        """
+        self.__clear_tmp_block_dir()
+        self.__make_tmp_block_dir()
+
     def __clear_tmp_block_dir(self):
         """
         Helper method to clear the temporary directory to save blocks
@@ -260,41 +846,35 @@ class IndexConstructor:
         """
         os.makedirs(self.tmp_file_dir_path)
 
-    def __dump_pickle(self, obj, file_obj):
-        """
-        Method to save two objs toa binary file
-        :param obj: first object to save (will be the sorted terms for the invered index)
-        :param file_obj: second obj (will be the whole inverted index)
-        :return: None
-        """
-        pickle.dump(obj=obj, file=file_obj, protocol=pickle.HIGHEST_PROTOCOL)
-
-    def __get_dump_size(self, dict_obj):
+    def __get_dump_size(self, dict_obj, positions=None):
         """
         Method to get calculate size of dictionary if dumped to disk (n bytes)
         :param dict_obj:  Dictionary to calculate size
-        :return: Size in bytes of dictionary if saved to disk
+        :param positions: Dictionary of the positions arrays of the block's terms, None or empty if not stored
+        :return: Size in bytes of dictionary (and positions) if saved to disk
         """
+        # The postings arrays are measured as lists, as accounted for by the incremental estimate
+        dict_obj = {term_id: postings.tolist() for term_id, postings in dict_obj.items()}
         terms_size = sys.getsizeof(pickle.dumps(list(dict_obj.keys())))
         whole_dict_size = sys.getsizeof(pickle.dumps(dict_obj, pickle.HIGHEST_PROTOCOL))
+        if positions:
+            positions = {term_id: term_positions.tolist() for term_id, term_positions in positions.items()}
+            whole_dict_size += sys.getsizeof(pickle.dumps(positions, pickle.HIGHEST_PROTOCOL))
         return terms_size + whole_dict_size
 
-    def __check_idx(self, list_idx):
-        """
-        Method to check the index of list compared to len of the token stream
-        :param list_idx: List index to check
-        :return: True if index is less than len of token stream, False otherwise
-        """
-        return list_idx < len(self.token_stream)
-
     def __dump_inverted_index(self):
         """
-        Helper method to dump the complete inverted index
+        Helper method to dump the complete inverted index to the on-disk index
         :return: None
         """
         try:
-            with open(self.inverted_index_path, "wb") as dump_file:
-                self.__dump_pickle(self.inverted_index, dump_file)
+            with DiskIndexWriter(self.index_prefix, self.store_freqs, self.store_positions) as index_writer:
+                index_writer.set_doc_lengths(self.merged_doc_lengths)
+                for term, postings in self.inverted_index.items():
+                    if self.store_positions:
+                        index_writer.add_term(term, *split_positions(postings))
+                    else:
+                        index_writer.add_term(term, postings)
         except (IOError, OSError):
             print("Unable to dump inverted index")
             exit(1)
@@ -2,94 +2,977 @@
 Script for index searcher
 """
 
-import nltk
+import heapq
+import math
+import os
 import pickle
+import re
 
+from ..cache import LRUCache
+from ..doc_sets import BitmapDocSet, SortedDocSet, doc_set, is_doc_set, union_doc_sets
+from ..facets import FACET_FIELDS, FACETS_EXT, FacetIndexReader, facets_exist, normalize_filters
+from ..index_segments import SEGMENTS_EXT, SegmentedIndexReader, segments_exist
+from ..index_storage import DELETIONS_EXT, LEXICON_EXT, DeletionBitmap, DiskIndexReader, index_exists, open_cursor
+from ..query_parser import BooleanQueryParser, QueryPlanner, QuerySyntaxError, is_boolean_query
 from ..reuters_parser import Parser
+from ..reuters_parser.porter_stemmer import STEM_CACHE, STEM_TABLE_EXT
+from ..wildcards import wildcard_regexp
+
+
+# Length ratio of two postings lists above which the AND intersection walks the shorter list and advances
+# a cursor on the longer one instead of merging both linearly (below it, decoding from the skip pointers costs
+# more than decoding the whole compressed list, see benchmarks/intersection.py)
+SKIP_LENGTH_RATIO = 64
+
+# Max no. of queries and total no. of doc ids kept in the query cache
+QUERY_CACHE_ENTRIES = 1024
+QUERY_CACHE_SIZE = 1000000
+
+# Max no. of terms and total size in bytes of their doc sets kept for the boolean queries
+DOC_SET_CACHE_ENTRIES = 4096
+DOC_SET_CACHE_SIZE = 32 * 1024 * 1024
+
+# Max no. of queries and total size in bytes of the doc sets of all the docs they match (without ranking or limit),
+# kept to page through the results and count their facets
+MATCH_CACHE_ENTRIES = 64
+MATCH_CACHE_SIZE = 16 * 1024 * 1024
+
+# BM25 saturation of the term frequency and normalization of the doc length
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Positional clauses of a query: quoted phrases and proximity of two words without wildcard (word NEAR/k word)
+PHRASE_REGEXP = re.compile(r'"([^"]*)"')
+NEAR_REGEXP = re.compile(r"([^\s*]+)\s+NEAR/(\d+)\s+([^\s*]+)")
+
+# NEAR/k operator left without a word on each side (e.g. next to a phrase), dropped from the keywords
+NEAR_OPERATOR_REGEXP = re.compile(r"\bNEAR/\d+\b")
+
+# Query words holding a wildcard (petro*, *ation), and the characters dropped from them
+WILDCARD_WORD_REGEXP = re.compile(r"[^\s\"]*\*[^\s\"]*")
+WILDCARD_STRIPPED_REGEXP = re.compile(r"[^\w*]")
+
+
+class TermScorer:
+    """
+    BM25 scorer of the docs of one query term, with a cursor on its postings list and an upper bound of its score
+    """
+
+    __slots__ = ("term", "cursor", "idf", "avg_doc_length", "upper_bound")
+
+    def __init__(self, term, postings, doc_freq, max_freq, no_docs, avg_doc_length, min_doc_length):
+        """
+        Constructor for the scorer of a term
+        :param term: The term
+        :param postings: PostingsList of the term, with term frequencies
+        :param doc_freq: No. of docs the term appears in
+        :param max_freq: Highest term frequency of the term in a doc
+        :param no_docs: No. of docs in the index
+        :param avg_doc_length: Average no. of tokens of the docs
+        :param min_doc_length: No. of tokens of the shortest doc
+        """
+        self.term = term
+        self.cursor = open_cursor(postings)
+        self.idf = math.log(1 + (no_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        self.avg_doc_length = avg_doc_length
+
+        # The score grows with the term frequency and shrinks with the doc length
+        self.upper_bound = self.score(max_freq, min_doc_length)
+
+    def score(self, term_freq, doc_length):
+        """
+        Method to get the BM25 score of the term in a doc
+        :param term_freq: Frequency of the term in the doc
+        :param doc_length: No. of tokens of the doc
+        :return: Score of the term
+        """
+        length_norm = 1 - BM25_B + BM25_B * doc_length / self.avg_doc_length
+        return self.idf * term_freq * (BM25_K1 + 1) / (term_freq + BM25_K1 * length_norm)
 
 
 class IndexSearcher:
     """
     Class to search the inverted index passed.
-    The search makes use of a linear postings list intersection
+    Boolean searches intersect and merge the doc sets of the terms (bitmaps for the frequent terms, sorted arrays
+    for the rare ones), while ranked searches walk the postings lists and score the docs with BM25.
+    Deleted docs are filtered out of the matched docs (not out of the postings lists being intersected).
+    Quoted phrases and NEAR/k clauses are matched on an index built with positions: the docs holding all the terms
+    of a clause are intersected first, then only the positions of these docs are decoded and merge-joined.
+    Words with a wildcard are expanded to the terms of the lexicon they match, whose docs are merged (OR).
+    Filters on the facets (topics, places, orgs, exchanges and date range) are intersected with the docs matched.
     """
 
-    def __init__(self, inverted_index_path):
+    def __init__(self, inverted_index_path, cache_entries=QUERY_CACHE_ENTRIES, cache_size=QUERY_CACHE_SIZE):
         """
         Constructor to initialize searcher obj with path to inverted index
-        :param inverted_index_path: Invered index path on disk
+        :param inverted_index_path: Invered index path on disk. If lexicon and postings files exist with the same
+        path without extension, the memory-mapped index is used instead of the pickled one, and if the index
+        has segments, all its live segments are searched
+        :param cache_entries: Max no. of queries whose results are cached (0 to disable the cache)
+        :param cache_size: Max total no. of doc ids cached
         """
         self.inverted_index_path = inverted_index_path
         self.inverted_index = None
+        self.index_signature = None
+
+        # Query terms are stemmed if a stem table was saved with the index
+        self.stemming = False
+
+        # Docs deleted from the index but still in its postings lists
+        self.deleted_docs = DeletionBitmap()
+
+        # Facet index of the docs (None if it was not built with the index)
+        self.facets = None
+
+        # Results of the latest queries, keyed by their preprocessed terms and mode
+        self.query_cache = LRUCache(cache_entries, cache_size, len)
+
+        # Doc sets of the latest terms of the boolean queries, keyed by term
+        self.doc_set_cache = LRUCache(DOC_SET_CACHE_ENTRIES, DOC_SET_CACHE_SIZE, lambda docs: docs.nbytes)
+
+        # Doc sets of all the docs matched by the latest queries, keyed by their match and filters
+        self.match_cache = LRUCache(MATCH_CACHE_ENTRIES, MATCH_CACHE_SIZE, lambda docs: docs.nbytes)
+
         self.open_index()
 
+        # No. of docs fully scored by the last ranked search
+        self.no_scored_docs = 0
+
     def open_index(self):
         """
-        Method to load the inverted index
+        Method to load the inverted index. The readers of the previous index are kept until the new ones are
+        opened, then closed. If the index cannot be opened, the previous one is kept and the next reload retries.
         :return: None
         """
 
+        index_signature = self.get_index_signature()
+
         try:
-            with open(self.inverted_index_path, "rb") as file_obj:
-                self.inverted_index = pickle.load(file_obj)
+            index_prefix = os.path.splitext(self.inverted_index_path)[0]
+            stemming = os.path.exists(index_prefix + STEM_TABLE_EXT) and \
+                STEM_CACHE.load(index_prefix + STEM_TABLE_EXT)
+            deleted_docs = DeletionBitmap.load(index_prefix)
+            facets = FacetIndexReader(index_prefix) if facets_exist(index_prefix) else None
+            if segments_exist(index_prefix):
+                inverted_index = SegmentedIndexReader(index_prefix)
+            elif index_exists(index_prefix):
+                inverted_index = DiskIndexReader(index_prefix)
+            else:
+                with open(self.inverted_index_path, "rb") as file_obj:
+                    inverted_index = pickle.load(file_obj)
         except (OSError, IOError):
             print("Error Open index")
+            return
+
+        previous_index = self.inverted_index
+        self.index_signature = index_signature
+        self.inverted_index = inverted_index
+        self.stemming = stemming
+        self.deleted_docs = deleted_docs
+        self.facets = facets
+
+        self.query_cache.clear()
+        self.doc_set_cache.clear()
+        self.match_cache.clear()
+
+        # Unmap the files of the previous index (a pickled index has nothing to close)
+        if hasattr(previous_index, "close"):
+            previous_index.close()
+
+    def get_index_signature(self):
+        """
+        Method to get the modification time and size of the index file (the manifest of the segments or the lexicon
+        of the on-disk index), of the deleted docs bitmap and of the facet index, which change whenever the index is
+        rebuilt, its segments change, docs are deleted or files are added
+        :return: tuple with the path, modification time and size of the files (None for a file that does not exist)
+        """
+        index_prefix = os.path.splitext(self.inverted_index_path)[0]
+        if segments_exist(index_prefix):
+            index_file_path = index_prefix + SEGMENTS_EXT
+        elif index_exists(index_prefix):
+            index_file_path = index_prefix + LEXICON_EXT
+        else:
+            index_file_path = self.inverted_index_path
+
+        signature = list()
+        for file_path in (index_file_path, index_prefix + DELETIONS_EXT, index_prefix + FACETS_EXT):
+            try:
+                file_stat = os.stat(file_path)
+            except (OSError, IOError):
+                signature.append(None)
+            else:
+                signature.append((file_path, file_stat.st_mtime_ns, file_stat.st_size))
+        return tuple(signature)
+
+    def reload_if_changed(self):
+        """
+        Method to reload the index and clear the query cache if the index file changed since it was opened
+        :return: True if the index was reloaded, False otherwise
+        """
+        if self.get_index_signature() == self.index_signature:
+            return False
 
-    def search_index(self, query, exact=True):
+        self.open_index()
+        return True
+
+    def search_index(self, query, exact=True, limit=None, ranked=False, offset=0, filters=None):
         """
         Method to search the index. It will preprocess the query terms as inverted index was built
         and retrieve the postings list for each terms
         :param query: The query to perform the search on the index
-        :param exact: If using AND or OR for query
-        :return: list of doc ids based on query
+        :param exact: If using AND or OR for query (a boolean expression with AND, OR, NOT or parentheses
+        is matched as written, two operands one after the other being joined by AND)
+        :param limit: Max no. of doc ids to return (None for all)
+        :param ranked: True to rank the docs matched with BM25. Only the top limit docs are scored in full (WAND)
+        :param offset: No. of matching doc ids to skip before the ones returned (to get a page of the results)
+        :param filters: dict with the facet values and date range the docs must have (see normalize_filters),
+        None for no filter
+        :return: list of doc ids based on query, in ascending order (descending order of score if ranked)
         """
 
         if query is None or query == "":
             print("Enter a correct query!")
             return False
 
-        # Tokenize and preprocess the query terms
-        keywords = nltk.word_tokenize(query)
+        try:
+            filters = normalize_filters(filters)
+        except ValueError as error:
+            print("Invalid filter: %s" % error)
+            return None
+
+        parsed_query = self.__parse_query(query, exact)
+        if not parsed_query:
+            return parsed_query
+        match_key, match_doc_set, match_ranked = parsed_query
+
+        # Doc ids up to the end of the page asked
+        end_limit = offset + limit if limit is not None else None
+
+        self.reload_if_changed()
+        cache_key = (match_key, filters, ranked, end_limit)
+        docs_id_matched = self.query_cache.get(cache_key)
+        if docs_id_matched is None:
+            if ranked:
+                try:
+                    filter_docs = self.__filter_docs(filters)
+                except ValueError as error:
+                    print(error)
+                    return None
+                docs_id_matched = match_ranked(end_limit, filter_docs)
+            else:
+                # All the docs matched are kept as a doc set, for the next pages and the facet counts
+                docs_matched = self.__matched_doc_set(match_key, filters, match_doc_set)
+                docs_id_matched = docs_matched.to_list(end_limit) if docs_matched is not None else None
+
+            if docs_id_matched is None:
+                return None
+            self.query_cache.put(cache_key, docs_id_matched)
+
+        return docs_id_matched[offset:]
+
+    def search_facets(self, query, exact=True, filters=None, fields=FACET_FIELDS, top=None):
+        """
+        Method to count the docs matched by a query having each facet value, from the facet index only.
+        The docs are counted on the doc set of all the docs the query matches without ranking, shared with
+        search_index: counting the facets of a query whose results were just paged through matches nothing again.
+        :param query: The query (see search_index)
+        :param exact: If using AND or OR for query (OR for the docs matched by a ranked query)
+        :param filters: dict with the facet values and date range the docs must have (see normalize_filters),
+        None for no filter
+        :param fields: Facet fields to count
+        :param top: Max no. of values returned per field (None for all)
+        :return: dict with the list of (value, no. of docs) of each field, in descending order of no. of docs,
+        None if the query is invalid or if the index has no facet index
+        """
+
+        if query is None or query == "":
+            print("Enter a correct query!")
+            return None
+
+        try:
+            filters = normalize_filters(filters)
+        except ValueError as error:
+            print("Invalid filter: %s" % error)
+            return None
+
+        parsed_query = self.__parse_query(query, exact)
+        if not parsed_query:
+            return None
+        match_key, match_doc_set, _ = parsed_query
+
+        self.reload_if_changed()
+        if self.facets is None:
+            print("Facet counts need a facet index built with the index")
+            return None
+
+        docs_matched = self.__matched_doc_set(match_key, filters, match_doc_set)
+        if docs_matched is None:
+            return None
+        return self.facets.counts(docs_matched, fields=fields, top=top)
+
+    def __parse_query(self, query, exact):
+        """
+        Helper method to parse a query into the functions matching its docs
+        :param query: The query (see search_index)
+        :param exact: If using AND or OR for query
+        :return: tuple of the key of the match (the same for the same terms in the same mode, whatever their order
+        in the query), a function of the filter docs returning the doc set of all the docs matched, and a function
+        of the limit and the filter docs returning the ranked doc ids; None if the query is invalid, False if no
+        word is left once preprocessed
+        """
+
+        if is_boolean_query(query):
+            # Queries with AND, OR, NOT or parentheses are parsed into an expression tree
+            try:
+                expression = BooleanQueryParser(self).parse(query)
+            except QuerySyntaxError as error:
+                print("Invalid boolean query: %s" % error)
+                return None
 
-        keywords_processed = Parser.preprocess_tokens(tokens=keywords, downcase=True, no_digits=True, rule_of_thirty=True,
-                                                      stop_words_150=True, stemming=False)
+            if expression is None:
+                print("No words found in query. Stop words are removed!")
+                return False
+
+            return ("expression", expression), \
+                lambda filter_docs: self.expression_doc_set(expression, filter_docs=filter_docs), \
+                lambda limit, filter_docs: self.match_expression(expression, ranked=True, limit=limit,
+                                                                 filter_docs=filter_docs)
+
+        # Phrases, NEAR clauses and wildcards are taken out of the query, the rest of it are keywords
+        clauses, query = self.parse_positional_clauses(query)
+        wildcard_clauses, query = self.parse_wildcards(query)
+        clauses += wildcard_clauses
+
+        # Tokenize and preprocess the query terms
+        keywords_processed = self.preprocess_query(query)
 
         # Check that keywords found after preprocessing
-        if keywords_processed is None or len(keywords_processed) == 0 and all([not keyword.isalpha() for keyword in keywords_processed]):
+        if not clauses and (keywords_processed is None or len(keywords_processed) == 0 and
+                            all([not keyword.isalpha() for keyword in keywords_processed])):
             print("No words found in query. Stop words are removed!")
             return False
 
         # Remove duplicates
         keywords_processed = list(set(keywords_processed))
 
-        # For each term try to get the matching term in the inverted index
-        keywords_postings = list()
-        for keyword in keywords_processed:
-            if keyword in self.inverted_index:
-                keywords_postings.append(self.inverted_index[keyword])
-            elif exact:
-                # if using AND for query return error if one term was not found in dictionary
-                print("One keyword in the query was not found in the index: %s" % keyword)
+        return (frozenset(keywords_processed), frozenset(clauses), exact), \
+            lambda filter_docs: self.match_doc_set(keywords_processed, exact=exact, clauses=clauses,
+                                                   filter_docs=filter_docs), \
+            lambda limit, filter_docs: self.match_docs(keywords_processed, exact=exact, ranked=True, limit=limit,
+                                                       clauses=clauses, filter_docs=filter_docs)
+
+    def __matched_doc_set(self, match_key, filters, match_doc_set):
+        """
+        Helper method to get the doc set of all the docs matched by a query, from the match cache if it was
+        matched with the same filters since the index was opened
+        :param match_key: Key of the match (see __parse_query)
+        :param filters: Filters in canonical form (see normalize_filters)
+        :param match_doc_set: Function of the filter docs returning the doc set of the docs matched
+        :return: Doc set, None if the query cannot be matched
+        """
+
+        docs_matched = self.match_cache.get((match_key, filters))
+        if docs_matched is None:
+            try:
+                filter_docs = self.__filter_docs(filters)
+            except ValueError as error:
+                print(error)
+                return None
+
+            docs_matched = match_doc_set(filter_docs)
+            if docs_matched is None:
+                return None
+            self.match_cache.put((match_key, filters), docs_matched)
+        return docs_matched
+
+    def __filter_docs(self, filters):
+        """
+        Helper method to get the docs passing the filters of a query
+        :param filters: Filters in canonical form (see normalize_filters)
+        :return: Doc set, None if no filter is set
+        :raise ValueError: If filters are set and the index has no facet index
+        """
+        if not filters:
+            return None
+        if self.facets is None:
+            raise ValueError("Filters need a facet index built with the index")
+        return self.facets.filter_docs(filters)
+
+    def preprocess_query(self, query):
+        """
+        Method to tokenize and preprocess query text as the inverted index was built
+        :param query: Query text
+        :return: list of preprocessed terms, in query order
+        """
+        return Parser.preprocess_tokens(tokens=Parser.tokenize_query(query), downcase=True, no_digits=True,
+                                        rule_of_thirty=True, stop_words_150=True, stemming=self.stemming)
+
+    def parse_positional_clauses(self, query):
+        """
+        Method to take the quoted phrases and the NEAR/k clauses out of a query, with their terms preprocessed
+        :param query: The query text
+        :return: tuple of the list of clauses and of the rest of the query. A phrase is ("phrase", terms)
+        and a NEAR clause is ("near", (first term, second term), k). Clauses left with no term are dropped.
+        """
+
+        clauses = list()
+
+        def add_phrase(phrase_match):
+            terms = self.preprocess_query(phrase_match.group(1))
+            if terms:
+                clauses.append(("phrase", tuple(terms)))
+            return " "
+
+        def add_near(near_match):
+            first_terms = self.preprocess_query(near_match.group(1))
+            second_terms = self.preprocess_query(near_match.group(3))
+            if first_terms and second_terms:
+                clauses.append(("near", (first_terms[-1], second_terms[0]), int(near_match.group(2))))
+            return " "
+
+        query = PHRASE_REGEXP.sub(add_phrase, query)
+        query = NEAR_REGEXP.sub(add_near, query)
+        return clauses, NEAR_OPERATOR_REGEXP.sub(" ", query)
+
+    @staticmethod
+    def parse_wildcards(query):
+        """
+        Method to take the words with a wildcard out of a query. They are downcased and only keep their letters,
+        digits and wildcards, as the terms of the index they are matched against.
+        :param query: The query text
+        :return: tuple of the list of ("wildcard", pattern) clauses and of the rest of the query
+        """
+
+        clauses = list()
+        for word in WILDCARD_WORD_REGEXP.findall(query):
+            pattern = WILDCARD_STRIPPED_REGEXP.sub("", word.lower())
+            if pattern.strip("*"):
+                clauses.append(("wildcard", pattern))
+
+        return clauses, WILDCARD_WORD_REGEXP.sub(" ", query)
+
+    def expand_wildcard(self, pattern):
+        """
+        Method to get the terms of the index matching a wildcard pattern
+        :param pattern: Wildcard pattern
+        :return: Sorted list of terms
+        """
+        index = self.inverted_index
+        if hasattr(index, "expand_wildcard"):
+            return index.expand_wildcard(pattern)
+
+        # The pickled index has no lexicon to look the pattern up, all its terms are matched
+        regexp = wildcard_regexp(pattern)
+        return sorted(term for term in index if regexp.fullmatch(term))
+
+    def match_docs(self, keywords, exact=True, ranked=False, limit=None, clauses=None, filter_docs=None):
+        """
+        Method to get the docs matching preprocessed query terms
+        :param keywords: Distinct preprocessed query terms
+        :param exact: If using AND or OR for query
+        :param ranked: True to rank the docs matched with BM25
+        :param limit: Max no. of doc ids to return (None for all)
+        :param clauses: Phrase, NEAR and wildcard clauses of the query (see parse_positional_clauses and
+        parse_wildcards), combined with the keywords with AND or OR like the keywords
+        :param filter_docs: Doc set of the docs passing the filters of the query (None for no filter)
+        :return: list of doc ids, None if a term of an AND query is missing from the index or if the query has
+        phrase or NEAR clauses and the index has no positions
+        """
+
+        if not ranked:
+            docs_matched = self.match_doc_set(keywords, exact=exact, clauses=clauses, filter_docs=filter_docs)
+            return docs_matched.to_list(limit) if docs_matched is not None else None
+
+        # Wildcards are replaced by the terms they match
+        clauses = [("any", tuple(self.expand_wildcard(clause[1]))) if clause[0] == "wildcard" else clause
+                   for clause in clauses or ()]
+
+        # Docs matching each clause, as sorted lists of doc ids
+        clauses_docs = list()
+        for clause in clauses:
+            clause_docs = self.match_clause(clause)
+            if clause_docs is None:
+                return None
+            clauses_docs.append(clause_docs)
+
+        return self.search_ranked(keywords, exact=exact, limit=limit, clauses=clauses, clauses_docs=clauses_docs,
+                                  filter_docs=filter_docs)
+
+    def match_doc_set(self, keywords, exact=True, clauses=None, filter_docs=None):
+        """
+        Method to get all the docs matching preprocessed query terms as a doc set
+        :param keywords: Distinct preprocessed query terms
+        :param exact: If using AND or OR for query
+        :param clauses: Phrase, NEAR and wildcard clauses of the query (see match_docs)
+        :param filter_docs: Doc set of the docs passing the filters of the query (None for no filter)
+        :return: Doc set, None if a term of an AND query is missing from the index or if the query has
+        phrase or NEAR clauses and the index has no positions
+        """
+
+        # Wildcards are replaced by the terms they match
+        clauses = [("any", tuple(self.expand_wildcard(clause[1]))) if clause[0] == "wildcard" else clause
+                   for clause in clauses or ()]
+
+        # Docs matching each clause, as sorted lists of doc ids
+        clauses_docs = list()
+        expanded_terms = list()
+        for clause in clauses:
+            if clause[0] == "any" and not exact:
+                # The terms a wildcard matches go straight into the OR union of the query
+                expanded_terms.extend(clause[1])
+                continue
+
+            clause_docs = self.match_clause(clause)
+            if clause_docs is None:
                 return None
+            clauses_docs.append(clause_docs)
+
+        if exact:
+            # For each term try to get its cached doc set or its postings list from the inverted index
+            operands = list(clauses_docs)
+            for keyword in keywords:
+                if keyword not in self.inverted_index:
+                    # if using AND for query return error if one term was not found in dictionary
+                    print("One keyword in the query was not found in the index: %s" % keyword)
+                    return None
+                operands.append(self.term_docs(keyword))
+            if filter_docs is not None:
+                operands.append(filter_docs)
+
+            # Intersect the operands from the one with the fewest docs, the filters are one more operand
+            operands.sort(key=len)
+            docs_matched = operands[0] if operands else SortedDocSet()
+            for operand in operands[1:]:
+                if len(docs_matched) == 0:
+                    break
+                docs_matched = self.intersect_docs(docs_matched, operand)
+            docs_matched = docs_matched if is_doc_set(docs_matched) else doc_set(docs_matched)
+        else:
+            # Merge the doc sets of all terms at once
+            keywords_docs = [doc_set(clause_docs) for clause_docs in clauses_docs]
+            keywords_docs.extend(self.term_doc_set(term) for term in expanded_terms + list(keywords)
+                                 if term in self.inverted_index)
+            docs_matched = union_doc_sets(keywords_docs)
+            if filter_docs is not None:
+                docs_matched = docs_matched & filter_docs
+
+        # Deleted docs are taken out of the result (ANDNOT with the deletion bitmap)
+        if self.deleted_docs:
+            docs_matched = docs_matched - BitmapDocSet.from_bytes(self.deleted_docs.bits)
+
+        return docs_matched
+
+    def match_expression(self, expression, ranked=False, limit=None, filter_docs=None):
+        """
+        Method to get the docs matching the expression tree of a boolean query, planned from the doc frequencies
+        of its terms and executed on their doc sets
+        :param expression: Root node of the tree (see BooleanQueryParser)
+        :param ranked: True to rank the docs matched with BM25, scored with the terms that are not negated
+        :param limit: Max no. of doc ids to return (None for all)
+        :param filter_docs: Doc set of the docs passing the filters of the query (None for no filter)
+        :return: list of doc ids, None if the query cannot be planned, if it has phrase or NEAR clauses and
+        the index has no positions, or if it is ranked and the index has no term frequencies
+        """
+
+        planner = QueryPlanner(self)
+        docs_matched, plan = self.__execute_expression(planner, expression, filter_docs)
+        if docs_matched is None:
+            return None
+
+        if not ranked:
+            return docs_matched.to_list(limit)
+
+        scored_terms = tuple(sorted(planner.scored_terms(plan)))
+        return self.search_ranked([], exact=True, limit=limit, clauses=[("any", scored_terms)],
+                                  clauses_docs=[docs_matched.to_list()])
+
+    def expression_doc_set(self, expression, filter_docs=None):
+        """
+        Method to get all the docs matching the expression tree of a boolean query as a doc set
+        :param expression: Root node of the tree (see BooleanQueryParser)
+        :param filter_docs: Doc set of the docs passing the filters of the query (None for no filter)
+        :return: Doc set, None if the query cannot be planned or if it has phrase or NEAR clauses and the index
+        has no positions
+        """
+        return self.__execute_expression(QueryPlanner(self), expression, filter_docs)[0]
+
+    def __execute_expression(self, planner, expression, filter_docs):
+        """
+        Helper method to plan and execute the expression tree of a boolean query
+        :param planner: QueryPlanner
+        :param expression: Root node of the tree (see BooleanQueryParser)
+        :param filter_docs: Doc set of the docs passing the filters of the query (None for no filter)
+        :return: tuple of the doc set of the docs matched and the plan, (None, None) if the query cannot be matched
+        """
+
+        try:
+            plan, _ = planner.plan(expression)
+        except QuerySyntaxError as error:
+            print("Invalid boolean query: %s" % error)
+            return None, None
+
+        docs_matched = planner.execute(plan)
+        if docs_matched is None:
+            return None, None
+
+        if filter_docs is not None:
+            docs_matched = docs_matched & filter_docs
+
+        if self.deleted_docs:
+            docs_matched = docs_matched - BitmapDocSet.from_bytes(self.deleted_docs.bits)
+
+        return docs_matched, plan
+
+    def facet_counts(self, doc_ids, fields=FACET_FIELDS, top=None):
+        """
+        Method to count the docs of the results of a query having each facet value, from the facet index only
+        :param doc_ids: Doc ids of the results
+        :param fields: Facet fields to count
+        :param top: Max no. of values returned per field (None for all)
+        :return: dict with the list of (value, no. of docs) of each field, in descending order of no. of docs,
+        None if the index has no facet index
+        """
+        if self.facets is None:
+            print("Facet counts need a facet index built with the index")
+            return None
+        return self.facets.counts(doc_set(sorted(set(doc_ids))), fields=fields, top=top)
+
+    def doc_freq(self, term):
+        """
+        Method to get the no. of docs a term appears in
+        :param term: Preprocessed term
+        :return: Document frequency of the term (0 if not in the index)
+        """
+        index = self.inverted_index
+        if hasattr(index, "doc_freq"):
+            return index.doc_freq(term)
+        return len(index[term]) if term in index else 0
+
+    def term_docs(self, term):
+        """
+        Method to get the docs of a term of the index for an AND: its doc set if it is in the doc set cache,
+        its postings list otherwise, so that the list is intersected with a cursor and its skip pointers
+        instead of being decoded in full
+        :param term: Term of the index
+        :return: Doc set or postings list
+        """
+        docs = self.doc_set_cache.get(term)
+        return docs if docs is not None else self.inverted_index[term]
+
+    def intersect_docs(self, docs, operand):
+        """
+        Method to intersect (AND) the docs matched so far with the docs of an operand. Two doc sets are intersected
+        in C, otherwise the docs matched are walked with a cursor advancing on the operand (see intersect_and).
+        :param docs: Doc set, postings list or sorted list of doc ids
+        :param operand: Doc set, postings list or sorted list of doc ids
+        :return: Doc set if both are doc sets, sorted list of doc ids otherwise
+        """
+        if is_doc_set(docs) and is_doc_set(operand):
+            return docs & operand
+        if is_doc_set(operand):
+            return operand.filter(docs) if isinstance(operand, BitmapDocSet) else \
+                self.intersect_and(docs, operand.doc_ids)
+        return self.intersect_and(docs.to_list() if is_doc_set(docs) else docs, operand)
+
+    def term_doc_set(self, term):
+        """
+        Method to get the docs of a term of the index as a doc set: a bitmap for a frequent term and a sorted array
+        for a rare one. Its postings list is decoded once, then the doc set is kept in the doc set cache.
+        Doc sets are built for OR and ANDNOT, AND walks the postings lists of the terms not cached (see term_docs).
+        :param term: Term of the index
+        :return: BitmapDocSet or SortedDocSet
+        """
+        docs = self.doc_set_cache.get(term)
+        if docs is None:
+            docs = doc_set(self.inverted_index[term])
+            self.doc_set_cache.put(term, docs)
+        return docs
+
+    def match_clause(self, clause):
+        """
+        Method to get the docs matching a clause. The docs of the terms of an ("any", terms) clause are merged.
+        For a phrase or a NEAR clause, the postings lists of its terms are intersected first, then the positions of
+        the terms are only decoded for the docs of the intersection.
+        :param clause: ("any", terms), ("phrase", terms) or ("near", (first term, second term), k)
+        :return: sorted list of doc ids, None if the clause needs positions and the index has none
+        """
+
+        index = self.inverted_index
+        if clause[0] == "any":
+            return list(self.union_postings([index[term] for term in clause[1]]))
+
+        if not getattr(index, "with_positions", False):
+            print("Phrase and NEAR queries need an on-disk index built with positions")
+            return None
+
+        terms = clause[1]
+        candidates = None
+        for postings in sorted((index.get(term, list()) for term in set(terms)), key=len):
+            candidates = postings if candidates is None else self.intersect_and(candidates, postings)
+            if len(candidates) == 0:
+                return list()
+
+        candidates = list(candidates)
+        if clause[0] == "phrase" and len(terms) == 1:
+            return candidates
+
+        docs_id_matched = list()
+        for terms_positions in zip(*(index.iter_positions(term, candidates) for term in terms)):
+            positions_lists = [positions for _, positions in terms_positions]
+            if clause[0] == "phrase":
+                matched = self.match_phrase(positions_lists)
+            else:
+                matched = self.match_near(positions_lists[0], positions_lists[1], clause[2])
+            if matched:
+                docs_id_matched.append(terms_positions[0][0])
+
+        return docs_id_matched
+
+    @staticmethod
+    def match_phrase(positions_lists):
+        """
+        Method to check if terms appear one after the other in a doc, with a merge-join of their positions:
+        the start positions left after each term are those followed by the term at the right offset
+        :param positions_lists: Sorted positions of each term of the phrase in the doc, in phrase order
+        :return: True if the phrase is in the doc, False otherwise
+        """
+
+        starts = positions_lists[0]
+        for term_offset, positions in enumerate(positions_lists[1:], 1):
+            iter_positions = iter(positions)
+            position = next(iter_positions, None)
+
+            matched_starts = list()
+            for start in starts:
+                while position is not None and position < start + term_offset:
+                    position = next(iter_positions, None)
+                if position is None:
+                    break
+                if position == start + term_offset:
+                    matched_starts.append(start)
+
+            starts = matched_starts
+            if not starts:
+                return False
+
+        return True
+
+    @staticmethod
+    def match_near(first_positions, second_positions, k):
+        """
+        Method to check if two terms appear at most k positions apart in a doc (in any order), with a merge-join
+        of their positions: the lowest position is moved forward until both are within k of each other
+        :param first_positions: Sorted positions of the first term in the doc
+        :param second_positions: Sorted positions of the second term in the doc
+        :param k: Max distance between the terms
+        :return: True if the terms are near each other in the doc, False otherwise
+        """
+
+        first_idx = second_idx = 0
+        while first_idx < len(first_positions) and second_idx < len(second_positions):
+            first_position, second_position = first_positions[first_idx], second_positions[second_idx]
+            if abs(first_position - second_position) <= k and first_position != second_position:
+                return True
+            if first_position <= second_position:
+                first_idx += 1
+            else:
+                second_idx += 1
+
+        return False
+
+    def search_ranked(self, keywords, exact=True, limit=None, clauses=None, clauses_docs=None, filter_docs=None):
+        """
+        Method to get the docs matching preprocessed query terms in descending order of BM25 score.
+        OR queries are evaluated with WAND: the terms' score upper bounds skip the docs that cannot enter the top limit.
+        AND queries score the docs of the intersection.
+        Queries with clauses score the docs matched with the terms of the clauses as extra terms.
+        Queries with filters score the docs matched that pass the filters.
+        :param keywords: Distinct preprocessed query terms
+        :param exact: If using AND or OR for query
+        :param limit: No. of top docs to return (None for all)
+        :param clauses: Clauses of the query, with their terms
+        :param clauses_docs: Sorted doc ids matching each clause
+        :param filter_docs: Doc set of the docs passing the filters of the query (None for no filter)
+        :return: list of doc ids, None if the index has no term frequencies or a term is missing from an AND query
+        """
 
-        # Sort the terms by the length of the postings list to get the smallest one first
-        keywords_postings = sorted(keywords_postings, key=lambda p_list: len(p_list))
+        index = self.inverted_index
+        if not isinstance(index, (DiskIndexReader, SegmentedIndexReader)) or not index.with_freqs or \
+                not index.header.get("doc_lengths"):
+            print("Ranked search needs an on-disk index built with term frequencies and doc lengths")
+            return None
 
-        iter_postings = iter(keywords_postings)
-        docs_id_matched = next(iter_postings)
+        # The terms of the clauses are scored too, but their docs are matched by the clauses
+        clauses_terms = set(term for clause in clauses or () for term in clause[1]) - set(keywords)
 
-        # Intersect the postings list for each term
-        for postings in iter_postings:
+        header = index.header
+        scorers = list()
+        for keyword in sorted(set(keywords) | clauses_terms):
+            postings = index.get(keyword)
+            if postings is None:
+                if exact and keyword not in clauses_terms:
+                    print("One keyword in the query was not found in the index: %s" % keyword)
+                    return None
+                continue
+
+            scorers.append(TermScorer(keyword, postings, index.doc_freq(keyword), index.max_freq(keyword),
+                                      header["no_docs"], header["avg_doc_length"], header["min_doc_length"]))
+
+        keywords_postings = [scorer.cursor.postings for scorer in scorers if scorer.term not in clauses_terms]
+        if clauses_docs or filter_docs is not None:
+            # The docs matched by the clauses and the keywords (and passing the filters) are all scored
+            matched_lists = keywords_postings + list(clauses_docs or ())
             if exact:
+                if filter_docs is not None:
+                    matched_lists.append(filter_docs.to_list())
+                candidates = sorted(matched_lists, key=len)
+                docs_id_matched = candidates[0]
+                for postings in candidates[1:]:
+                    docs_id_matched = self.intersect_and(docs_id_matched, postings)
+                docs_id_matched = self.deleted_docs.filter(docs_id_matched) if self.deleted_docs else docs_id_matched
+            else:
+                docs_id_matched = self.union_postings(matched_lists, deleted_docs=self.deleted_docs)
+                if filter_docs is not None:
+                    docs_id_matched = (doc_set(docs_id_matched) & filter_docs).to_list()
+            scored_docs = self.score_docs(scorers, docs_id_matched, index.doc_length)
+            top_docs = heapq.nsmallest(limit, scored_docs) if limit is not None else sorted(scored_docs)
+        elif exact:
+            candidates = sorted((scorer.cursor.postings for scorer in scorers), key=len)
+            docs_id_matched = candidates[0]
+            for postings in candidates[1:]:
                 docs_id_matched = self.intersect_and(docs_id_matched, postings)
+            if self.deleted_docs:
+                docs_id_matched = self.deleted_docs.filter(docs_id_matched)
+            scored_docs = self.score_docs(scorers, docs_id_matched, index.doc_length)
+            top_docs = heapq.nsmallest(limit, scored_docs) if limit is not None else sorted(scored_docs)
+        else:
+            top_docs = self.wand_top_k(scorers, limit, index.doc_length, self.deleted_docs)
+
+        return [doc_id for _, doc_id in top_docs]
+
+    def score_docs(self, scorers, doc_ids, doc_length):
+        """
+        Method to score every doc of a list with BM25
+        :param scorers: TermScorer of each query term
+        :param doc_ids: Sorted doc ids to score
+        :param doc_length: Function to get the no. of tokens of a doc
+        :return: list of (negated score, doc id), so that the best docs sort first
+        """
+
+        scored_docs = list()
+        for doc_id in doc_ids:
+            length = doc_length(doc_id)
+            score = 0.0
+            for scorer in scorers:
+                if scorer.cursor.advance(doc_id) == doc_id:
+                    score += scorer.score(scorer.cursor.freq, length)
+            scored_docs.append((-score, doc_id))
+
+        self.no_scored_docs = len(scored_docs)
+        return scored_docs
+
+    def wand_top_k(self, scorers, k, doc_length, deleted_docs=None):
+        """
+        Method to get the top k docs of an OR query with the WAND algorithm.
+        The cursors are kept sorted by doc id and the pivot is the first cursor where the sum of the score upper bounds
+        of the cursors up to it beats the score of the k-th best doc so far. No doc before the pivot doc can enter
+        the top k, so the cursors behind it advance to it (with skip pointers) and only the pivot doc gets scored.
+        :param scorers: TermScorer of each query term
+        :param k: No. of top docs to return (None for all, every doc matched gets scored)
+        :param doc_length: Function to get the no. of tokens of a doc
+        :param deleted_docs: DeletionBitmap of the docs to skip without scoring them (None if no doc is deleted)
+        :return: list of (negated score, doc id) in descending order of score
+        """
+
+        self.no_scored_docs = 0
+        if k is not None and k <= 0:
+            return list()
+
+        deleted_doc_ids = deleted_docs.as_set() if deleted_docs else None
+
+        # Min heap of the (score, negated doc id) of the best docs so far, the lowest doc ids win ties
+        top_docs = list()
+        threshold = -1.0
+
+        active_scorers = [scorer for scorer in scorers if scorer.cursor.doc_id is not None]
+        while active_scorers:
+            active_scorers.sort(key=lambda term_scorer: term_scorer.cursor.doc_id)
+
+            # Find the pivot
+            pivot_doc_id = None
+            bound_sum = 0.0
+            for pivot_idx, scorer in enumerate(active_scorers):
+                bound_sum += scorer.upper_bound
+                if bound_sum > threshold:
+                    pivot_doc_id = scorer.cursor.doc_id
+                    break
+
+            # No remaining doc can beat the k-th best one
+            if pivot_doc_id is None:
+                break
+
+            if active_scorers[0].cursor.doc_id == pivot_doc_id and deleted_doc_ids is not None and \
+                    pivot_doc_id in deleted_doc_ids:
+                # A deleted doc is skipped without being scored
+                for scorer in active_scorers:
+                    if scorer.cursor.doc_id == pivot_doc_id:
+                        scorer.cursor.next()
+            elif active_scorers[0].cursor.doc_id == pivot_doc_id:
+                # Score the pivot doc with the scorers in query order and move them past it
+                length = doc_length(pivot_doc_id)
+                score = 0.0
+                for scorer in scorers:
+                    if scorer.cursor.doc_id == pivot_doc_id:
+                        score += scorer.score(scorer.cursor.freq, length)
+                        scorer.cursor.next()
+                self.no_scored_docs += 1
+
+                if k is None or len(top_docs) < k:
+                    heapq.heappush(top_docs, (score, -pivot_doc_id))
+                elif score > top_docs[0][0]:
+                    heapq.heapreplace(top_docs, (score, -pivot_doc_id))
+                if k is not None and len(top_docs) == k:
+                    threshold = top_docs[0][0]
             else:
-                docs_id_matched = self.intersect_or(docs_id_matched, postings)
+                for scorer in active_scorers[:pivot_idx]:
+                    scorer.cursor.advance(pivot_doc_id)
 
-        return docs_id_matched
+            active_scorers = [scorer for scorer in active_scorers if scorer.cursor.doc_id is not None]
+
+        return sorted((-score, -negated_doc_id) for score, negated_doc_id in top_docs)
+
+    @staticmethod
+    def intersect_and(first_list, second_list):
+        """
+        Method to make a strict intersection (AND).
+        If a list is much longer than the other one, the shorter list is walked and a cursor on the longer one
+        advances to each of its doc ids with skip pointers (or a galloping search), so that the cost grows
+        with the shorter list. Otherwise both lists are merged linearly.
+        :param first_list: First postings list
+        :param second_list: Second postings list
+        :return: Intersection of the two lists passed
+        """
 
-    def intersect_and(self, first_list, second_list):
+        shorter_list, longer_list = sorted((first_list, second_list), key=len)
+        if len(longer_list) < SKIP_LENGTH_RATIO * len(shorter_list):
+            return IndexSearcher.intersect_and_linear(shorter_list, longer_list)
+
+        longer_cursor = open_cursor(longer_list)
+
+        matched_items = list()
+        for doc_id in shorter_list:
+            longer_post = longer_cursor.advance(doc_id)
+            if longer_post is None:
+                break
+            if longer_post == doc_id:
+                matched_items.append(doc_id)
+
+        return matched_items
+
+    @staticmethod
+    def intersect_and_linear(first_list, second_list):
         """
-        Method to make a strict intersection (AND)
+        Method to make a strict intersection (AND) by walking both lists element by element
         :param first_list: First postings list
         :param second_list: Second postings list
         :return: Intersection of the two lists passed
@@ -117,13 +1000,44 @@ class IndexSearcher:
 
         return matched_items
 
-    def intersect_or(self, first_list, second_list):
+    @staticmethod
+    def intersect_or(first_list, second_list):
         """
         Method to merge two postings list (intersect OR) and remove duplicates
         :param first_list: First list to intersect
         :param second_list: Second list to intersect
-        :return: Merged list
+        :return: Merged list, in ascending order
+        """
+        return list(IndexSearcher.union_postings([first_list, second_list]))
+
+    @staticmethod
+    def union_postings(postings_lists, limit=None, deleted_docs=None):
+        """
+        Generator merging any no. of postings lists (OR) with a heap-based k-way merge.
+        Duplicates are removed while streaming, so doc ids are yielded once and in ascending order.
+        :param postings_lists: Sorted postings lists to merge
+        :param limit: Max no. of doc ids to yield (None for all), the merge stops as soon as it is reached
+        :param deleted_docs: DeletionBitmap of the docs not to yield (None if no doc is deleted)
+        :return: generator of doc ids
         """
 
-        combined_list = sorted(first_list + second_list)
-        return set(combined_list)
+        if limit is not None and limit <= 0:
+            return
+
+        deleted_doc_ids = deleted_docs.as_set() if deleted_docs else None
+
+        no_yielded = 0
+        previous_doc_id = None
+        for doc_id in heapq.merge(*postings_lists):
+            if doc_id == previous_doc_id:
+                continue
+            previous_doc_id = doc_id
+
+            if deleted_doc_ids is not None and doc_id in deleted_doc_ids:
+                continue
+
+            yield doc_id
+
+            no_yielded += 1
+            if no_yielded == limit:
+                return
@@ -0,0 +1,513 @@
+"""
+Script containing the segments of an incrementally updated inverted index.
+New collection files are inverted into a new on-disk index (a segment) instead of rebuilding the whole index,
+and segments are merged in the background with a tiered (logarithmic) merge policy, so that the no. of segments
+a query reads stays logarithmic in the no. of docs.
+The live segments are listed in a manifest saved next to the index:
+- <prefix>.segs: JSON with the generation of the manifest and the name and no. of docs of each live segment,
+  replaced atomically whenever a segment is added or segments are merged
+- <prefix>_segNNNNNN.*: the files of each segment, in the format of DiskIndexWriter (the index built
+  by build_index, at <prefix>.*, is the first segment)
+Only one process should update the segments of an index at a time; any no. of processes can search them.
+"""
+
+import json
+import math
+import os
+import threading
+from heapq import merge
+from operator import itemgetter
+
+from ..cache import LRUCache
+from ..index_storage import DeletionBitmap, DiskIndexReader, DiskIndexWriter, index_exists, iter_doc_positions, \
+    merge_postings_lists, remove_index
+
+# Extension of the manifest listing the live segments
+SEGMENTS_EXT = ".segs"
+
+# No. of segments of the same tier merged together
+SEGMENT_MERGE_FACTOR = 4
+
+# No. of docs of the segments of the first tier (about one collection file)
+SEGMENT_TIER_DOCS = 1000
+
+# No. of terms whose postings merged across segments are kept by the reader
+MERGED_POSTINGS_CACHE_ENTRIES = 256
+
+
+def segments_exist(index_prefix):
+    """
+    Function to check if the index saved with the prefix passed has segments
+    :param index_prefix: Path of the index without extension
+    :return: True if the manifest of the segments exists, False otherwise
+    """
+    return os.path.exists(index_prefix + SEGMENTS_EXT)
+
+
+def load_manifest(index_prefix):
+    """
+    Function to load the manifest of the segments of an index
+    :param index_prefix: Path of the index without extension
+    :return: dict with the generation and the list of live segments (name and no. of docs)
+    """
+    with open(index_prefix + SEGMENTS_EXT, "r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(index_prefix, manifest):
+    """
+    Function to save the manifest of the segments of an index, replacing the previous one atomically
+    so that readers see either the old or the new list of segments
+    :param index_prefix: Path of the index without extension
+    :param manifest: dict with the generation and the list of live segments
+    :return: None
+    """
+    tmp_manifest_path = index_prefix + SEGMENTS_EXT + ".tmp"
+    with open(tmp_manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(tmp_manifest_path, index_prefix + SEGMENTS_EXT)
+
+
+def segment_tier(no_docs):
+    """
+    Function to get the tier of a segment: segments of tier n have about SEGMENT_MERGE_FACTOR ** n times
+    the docs of the first tier
+    :param no_docs: No. of docs of the segment
+    :return: Tier of the segment
+    """
+    if no_docs <= SEGMENT_TIER_DOCS:
+        return 0
+    return int(math.log(no_docs / float(SEGMENT_TIER_DOCS), SEGMENT_MERGE_FACTOR))
+
+
+def plan_merge(segments):
+    """
+    Function to pick the segments to merge next: the smallest SEGMENT_MERGE_FACTOR segments of the lowest tier
+    holding that many segments
+    :param segments: List of live segments (dict with name and no. of docs)
+    :return: list of the names of the segments to merge (empty if no tier is full)
+    """
+
+    tiers = dict()
+    for segment in sorted(segments, key=lambda live_segment: live_segment["no_docs"]):
+        tiers.setdefault(segment_tier(segment["no_docs"]), []).append(segment["name"])
+
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= SEGMENT_MERGE_FACTOR:
+            return tiers[tier][:SEGMENT_MERGE_FACTOR]
+    return []
+
+
+def remove_segments(index_prefix):
+    """
+    Function to remove the manifest and the files of the segments of an index (the index at the prefix is kept),
+    e.g. when the index is built again from scratch
+    :param index_prefix: Path of the index without extension
+    :return: None
+    """
+
+    if not segments_exist(index_prefix):
+        return
+
+    index_dir = os.path.dirname(index_prefix)
+    for segment in load_manifest(index_prefix).get("segments"):
+        if segment["name"] != os.path.basename(index_prefix):
+            remove_index(os.path.join(index_dir, segment["name"]))
+    os.remove(index_prefix + SEGMENTS_EXT)
+
+
+class SegmentedIndexWriter:
+    """
+    Class to add segments to an index and merge them.
+    Merges run in a background thread: the merged segment is written while the live segments keep being searched,
+    then the manifest is swapped and the merged segments are removed.
+    """
+
+    def __init__(self, index_prefix):
+        """
+        Constructor loading the manifest of the segments, or starting it with the index at the prefix
+        :param index_prefix: Path of the index without extension
+        """
+        self.index_prefix = index_prefix
+        self.index_dir = os.path.dirname(index_prefix)
+
+        # Updates of the manifest by the thread adding segments and the merge thread are serialized
+        self.lock = threading.Lock()
+        self.merge_thread = None
+
+        # Error of the last background merge, raised by wait_for_merge and the next merge
+        self.merge_error = None
+
+        if segments_exist(index_prefix):
+            self.manifest = load_manifest(index_prefix)
+        else:
+            segments = list()
+            if index_exists(index_prefix):
+                base_index = DiskIndexReader(index_prefix)
+                segments.append({"name": os.path.basename(index_prefix),
+                                 "no_docs": base_index.header.get("no_docs", 0)})
+                base_index.close()
+            self.manifest = {"generation": 0, "segments": segments}
+
+    @property
+    def segments(self):
+        """
+        Live segments of the index
+        :return: list of dict with the name and no. of docs of each segment
+        """
+        return self.manifest["segments"]
+
+    def segment_prefix(self, segment_name):
+        """
+        Method to get the path of a segment
+        :param segment_name: Name of the segment
+        :return: Path of the segment without extension
+        """
+        return os.path.join(self.index_dir, segment_name)
+
+    def new_segment_name(self):
+        """
+        Method to reserve the name of a new segment
+        :return: Name of the segment
+        """
+        with self.lock:
+            self.manifest["generation"] += 1
+            return "%s_seg%06d" % (os.path.basename(self.index_prefix), self.manifest["generation"])
+
+    def add_segment(self, segment_name):
+        """
+        Method to make a segment written with DiskIndexWriter live
+        :param segment_name: Name of the segment (from new_segment_name)
+        :return: None
+        """
+        segment = DiskIndexReader(self.segment_prefix(segment_name))
+        no_docs = segment.header.get("no_docs", 0)
+        segment.close()
+
+        with self.lock:
+            self.manifest["segments"].append({"name": segment_name, "no_docs": no_docs})
+            save_manifest(self.index_prefix, self.manifest)
+
+    def merge(self, background=True):
+        """
+        Method to merge the segments until no tier holds SEGMENT_MERGE_FACTOR segments
+        :param background: True to merge in a background thread (one at a time), False to merge in this thread
+        :return: The merge thread (None if merged in this thread or if a merge is already running)
+        :raise IOError: If the previous background merge failed (the segments it merged are left live)
+        """
+
+        self.raise_merge_error()
+
+        if not background:
+            self.merge_tiers()
+            return None
+
+        if self.merge_thread is not None and self.merge_thread.is_alive():
+            return None
+
+        self.merge_thread = threading.Thread(target=self.__merge_in_background, name="segment-merge")
+        self.merge_thread.start()
+        return self.merge_thread
+
+    def wait_for_merge(self):
+        """
+        Method to wait for the background merge to finish
+        :return: None
+        :raise IOError: If the background merge failed (the segments it merged are left live)
+        """
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+        self.raise_merge_error()
+
+    def raise_merge_error(self):
+        """
+        Method to raise the error of the last background merge, once
+        :return: None
+        """
+        merge_error, self.merge_error = self.merge_error, None
+        if merge_error is not None:
+            raise merge_error
+
+    def __merge_in_background(self):
+        """
+        Helper method run by the merge thread: an error is kept for the thread waiting for the merge,
+        as it cannot be raised to it from this thread
+        :return: None
+        """
+        try:
+            self.merge_tiers()
+        except Exception as error:
+            self.merge_error = error
+
+    def merge_tiers(self):
+        """
+        Method to merge the segments picked by the merge policy, one group at a time
+        :return: None
+        """
+        while True:
+            with self.lock:
+                segment_names = plan_merge(self.segments)
+            if not segment_names:
+                return
+            self.merge_segments(segment_names)
+
+    def merge_segments(self, segment_names):
+        """
+        Method to merge live segments into a new segment, swapped in place of the merged ones once written.
+        The docs deleted from the index are compacted away from the merged segment.
+        :param segment_names: Names of the segments to merge
+        :return: Name of the merged segment
+        :raise IOError: If the merged segment cannot be written (it is removed and the manifest is left unchanged)
+        """
+
+        merged_name = self.new_segment_name()
+        segments = [DiskIndexReader(self.segment_prefix(segment_name)) for segment_name in segment_names]
+        with_freqs = all(segment.with_freqs for segment in segments)
+        with_positions = all(segment.with_positions for segment in segments)
+        deleted_docs = DeletionBitmap.load(self.index_prefix)
+
+        doc_lengths = dict()
+        for segment in segments:
+            if segment.doc_lengths is not None:
+                doc_lengths.update((doc_id, doc_length) for doc_id, doc_length in enumerate(segment.doc_lengths)
+                                   if doc_length and doc_id not in deleted_docs)
+
+        no_docs = len(doc_lengths) if doc_lengths else max(segment.header.get("no_docs", 0) for segment in segments)
+        try:
+            self.__write_merged_segment(segments, self.segment_prefix(merged_name), with_freqs, with_positions,
+                                        doc_lengths, deleted_docs)
+        except (IOError, OSError):
+            # The merge may run in a background thread, so the error is raised instead of exiting
+            print("Unable to write merged segment %s" % merged_name)
+            remove_index(self.segment_prefix(merged_name))
+            raise
+        finally:
+            for segment in segments:
+                segment.close()
+
+        with self.lock:
+            live_segments = [segment for segment in self.manifest["segments"] if segment["name"] not in segment_names]
+            live_segments.append({"name": merged_name, "no_docs": no_docs})
+            self.manifest["segments"] = live_segments
+            save_manifest(self.index_prefix, self.manifest)
+
+        # Searchers that opened the merged segments keep their mapped files until they reload
+        for segment_name in segment_names:
+            remove_index(self.segment_prefix(segment_name))
+
+        return merged_name
+
+    @staticmethod
+    def __write_merged_segment(segments, segment_prefix, with_freqs, with_positions, doc_lengths, deleted_docs):
+        """
+        Helper method to write the terms of segments in sorted order, with their postings merged across the segments
+        :param segments: DiskIndexReader of each segment to merge
+        :param segment_prefix: Path of the merged segment without extension
+        :param with_freqs: True to save the term frequency of each doc
+        :param with_positions: True to save the positions of each term in each doc
+        :param doc_lengths: dict of doc id -> no. of tokens of the docs of the segments
+        :param deleted_docs: DeletionBitmap of the docs to leave out of the postings
+        :return: None
+        """
+        with DiskIndexWriter(segment_prefix, with_freqs, with_positions) as index_writer:
+            index_writer.set_doc_lengths(doc_lengths)
+
+            # Terms of each segment with their postings and positions
+            segments_terms = [SegmentedIndexWriter.__iter_segment_terms(segment) for segment in segments]
+
+            current_term, current_postings = None, list()
+            for term, postings, positions in merge(*segments_terms, key=itemgetter(0)):
+                if term != current_term and current_postings:
+                    SegmentedIndexWriter.__add_merged_term(index_writer, current_term, current_postings, deleted_docs)
+                    current_postings = list()
+                current_term = term
+                current_postings.append((postings, positions))
+
+            if current_postings:
+                SegmentedIndexWriter.__add_merged_term(index_writer, current_term, current_postings, deleted_docs)
+
+    @staticmethod
+    def __iter_segment_terms(segment):
+        """
+        Helper generator over the terms of a segment in sorted order
+        :param segment: DiskIndexReader of the segment
+        :return: generator of (term, PostingsList, compressed positions or None without positions)
+        """
+        for term_idx, (term, postings) in enumerate(segment.items()):
+            yield term, postings, segment.get_positions(term_idx)
+
+    @staticmethod
+    def __add_merged_term(index_writer, term, segments_postings, deleted_docs):
+        """
+        Helper method to write a term with its postings merged across segments, unless all its docs were deleted
+        :param index_writer: DiskIndexWriter of the merged segment
+        :param term: The term
+        :param segments_postings: PostingsList and compressed positions (None without positions) of the term
+        in each segment holding it
+        :param deleted_docs: DeletionBitmap of the docs to leave out of the postings
+        :return: None
+        """
+
+        if not index_writer.with_positions:
+            postings = merge_postings_lists([postings for postings, _ in segments_postings], index_writer.with_freqs,
+                                            deleted_docs)
+            if postings.doc_freq > 0:
+                index_writer.add_term(term, postings)
+            return
+
+        # The docs of the segments are merged with their positions (a doc is only held by one segment)
+        deleted_doc_ids = deleted_docs.as_set()
+        doc_ids, positions = list(), list()
+        for doc_id, doc_positions in merge(*(iter_doc_positions(postings.data, positions_data)
+                                             for postings, positions_data in segments_postings), key=itemgetter(0)):
+            if doc_id not in deleted_doc_ids:
+                doc_ids.extend([doc_id] * len(doc_positions))
+                positions.extend(doc_positions)
+
+        if doc_ids:
+            index_writer.add_term(term, doc_ids, positions)
+
+
+class SegmentedIndexReader:
+    """
+    Class to search all the live segments of an index as one index.
+    It behaves like DiskIndexReader: the postings of a term found in many segments are merged (and cached),
+    and the stats used by BM25 (no. of docs, doc lengths, doc and term frequencies) are combined across segments.
+    """
+
+    def __init__(self, index_prefix):
+        """
+        Constructor opening the live segments listed in the manifest
+        :param index_prefix: Path of the index without extension
+        """
+        self.index_prefix = index_prefix
+
+        manifest = load_manifest(index_prefix)
+        self.generation = manifest.get("generation")
+        self.segments = [DiskIndexReader(os.path.join(os.path.dirname(index_prefix), segment["name"]))
+                         for segment in manifest.get("segments")]
+
+        self.with_freqs = bool(self.segments) and all(segment.with_freqs for segment in self.segments)
+        self.with_positions = bool(self.segments) and all(segment.with_positions for segment in self.segments)
+
+        # Stats of the docs of all the segments
+        segment_headers = [segment.header for segment in self.segments if segment.header.get("doc_lengths")]
+        self.header = {"segments": len(self.segments), "with_freqs": self.with_freqs,
+                       "with_positions": self.with_positions,
+                       "doc_lengths": bool(segment_headers) and len(segment_headers) == len(self.segments)}
+        if self.header["doc_lengths"]:
+            no_docs = sum(header["no_docs"] for header in segment_headers)
+            self.header["no_docs"] = no_docs
+            self.header["avg_doc_length"] = sum(header["no_docs"] * header["avg_doc_length"]
+                                                for header in segment_headers) / float(no_docs)
+            self.header["min_doc_length"] = min(header["min_doc_length"] for header in segment_headers)
+
+        self.merged_postings = LRUCache(MERGED_POSTINGS_CACHE_ENTRIES)
+        self.sorted_terms = None
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return any(term in segment for segment in self.segments)
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __getitem__(self, term):
+        postings = self.get(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings
+
+    @property
+    def terms(self):
+        """
+        Sorted terms of all the segments, merged on first use
+        :return: list of terms
+        """
+        if self.sorted_terms is None:
+            self.sorted_terms = sorted(set().union(*(segment.terms for segment in self.segments)))
+        return self.sorted_terms
+
+    def get(self, term, default=None):
+        """
+        Method to get the postings list of a term across the segments
+        :param term: Term to look up
+        :param default: Value returned if the term is not in the index
+        :return: Postings list of the term
+        """
+
+        postings = self.merged_postings.get(term)
+        if postings is not None:
+            return postings
+
+        segments_postings = [segment_postings for segment_postings in (segment.get(term) for segment in self.segments)
+                             if segment_postings is not None]
+        if not segments_postings:
+            return default
+        if len(segments_postings) == 1:
+            return segments_postings[0]
+
+        postings = merge_postings_lists(segments_postings, self.with_freqs)
+        self.merged_postings.put(term, postings)
+        return postings
+
+    def keys(self):
+        return iter(self.terms)
+
+    def items(self):
+        return ((term, self.get(term)) for term in self.terms)
+
+    def expand_wildcard(self, pattern):
+        """
+        Method to get the terms of all the segments matching a wildcard pattern
+        :param pattern: Wildcard pattern (e.g. petro*, *ation)
+        :return: Sorted list of the terms matching the pattern
+        """
+        return sorted(set().union(*(segment.expand_wildcard(pattern) for segment in self.segments)))
+
+    def doc_freq(self, term):
+        """
+        Method to get the no. of docs a term appears in, in all the segments
+        :param term: Term to look up
+        :return: Document frequency of the term (0 if not in the index)
+        """
+        return sum(segment.doc_freq(term) for segment in self.segments)
+
+    def max_freq(self, term):
+        """
+        Method to get the highest term frequency of a term in a doc of any segment
+        :param term: Term to look up
+        :return: Highest term frequency of the term (0 if not in the index)
+        """
+        return max([segment.max_freq(term) for segment in self.segments] or [0])
+
+    def iter_positions(self, term, doc_ids=None):
+        """
+        Method to decode the positions of a term in some of its docs only, in all the segments
+        :param term: Term to look up
+        :param doc_ids: Sorted doc ids whose positions are decoded (None for all the docs of the term)
+        :return: generator of (doc_id, list of positions) for the docs asked that hold the term
+        """
+        return merge(*(segment.iter_positions(term, doc_ids) for segment in self.segments), key=itemgetter(0))
+
+    def doc_length(self, doc_id):
+        """
+        Method to get the length of a doc, from the segment holding it
+        :param doc_id: Doc id
+        :return: No. of tokens of the doc (0 if unknown)
+        """
+        for segment in self.segments:
+            doc_length = segment.doc_length(doc_id)
+            if doc_length:
+                return doc_length
+        return 0
+
+    def close(self):
+        """
+        Method to unmap the files of the segments
+        :return: None
+        """
+        for segment in self.segments:
+            segment.close()
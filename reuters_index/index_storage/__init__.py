@@ -0,0 +1,1260 @@
+"""
+Script containing the on-disk format of the inverted index.
+The index is saved as files sharing the same prefix:
+- <prefix>.lex: the sorted term lexicon (front-coded), with the offset and document frequency of each term's postings
+- <prefix>.post: the postings of every term one after the other, memory-mapped and decoded lazily per term
+- <prefix>.skip: the skip pointers of the long postings lists, memory-mapped
+- <prefix>.dl: the length in tokens of each doc, indexed by doc id and memory-mapped (if saved)
+- <prefix>.pos: the positions of each term in each doc, memory-mapped (if saved)
+- <prefix>.del: the bitmap of the deleted doc ids (if docs were deleted), until they are compacted away
+Postings lists are compressed: doc ids are gap-encoded and each gap is saved as a variable-byte integer
+(7 bits per byte, the high bit set on every byte but the last one).
+With term frequencies, each doc is saved as (gap << 1 | 1 if tf == 1), followed by the tf when it is not 1.
+Every SKIP_INTERVAL postings, a skip pointer saves the doc id preceding the next posting and the byte offset
+of that posting, so that a cursor can jump over the postings lower than a target without decoding them.
+Positions are saved per term in the order of its postings, as one group per doc: the byte length of the group,
+then the gaps between the sorted positions of the term in the doc, all as variable-byte integers. A doc's group
+is skipped with its length, so that only the positions of the docs asked for are decoded.
+The terms of the lexicon are front-coded in blocks of LEXICON_BLOCK_TERMS terms: each term is saved as the length
+of the prefix it shares with the previous term, followed by the byte length and the UTF-8 bytes of the rest of the term.
+The first term of a block (its head) is saved in full, so that a term is found with a binary search over the block
+heads followed by a scan of one block, and the terms sharing a prefix are a range of the lexicon.
+"""
+
+import heapq
+import mmap
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+
+from ..wildcards import KGramIndex, expand_wildcard
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+# Extensions of the lexicon, postings, skip pointers and doc lengths files
+LEXICON_EXT = ".lex"
+POSTINGS_EXT = ".post"
+SKIPS_EXT = ".skip"
+DOC_LENGTHS_EXT = ".dl"
+POSITIONS_EXT = ".pos"
+DELETIONS_EXT = ".del"
+
+# Suffix of the files being written, until they replace the files of the index
+TMP_EXT = ".tmp"
+
+# Version of the on-disk format, saved in the lexicon header
+INDEX_FORMAT_VERSION = 6
+
+# No. of terms of the front-coded blocks of the lexicon
+LEXICON_BLOCK_TERMS = 16
+
+# No. of postings between two skip pointers (shorter lists have no skip pointers)
+SKIP_INTERVAL = 64
+
+# Skip pointers and doc lengths are saved as native unsigned ints of this type code
+SKIP_TYPECODE = "I"
+DOC_LENGTH_TYPECODE = "I"
+
+# Name of the postings codec, saved in the lexicon header
+POSTINGS_CODEC = "delta-vbyte"
+
+
+def append_vbyte(encoded, value):
+    """
+    Function to append a variable-byte integer
+    :param encoded: bytearray to append to
+    :param value: Positive int
+    :return: None
+    """
+    while value >= 0x80:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+
+
+def read_vbyte(data, offset):
+    """
+    Function to read a variable-byte integer
+    :param data: bytes-like object
+    :param offset: Offset of the first byte of the integer
+    :return: tuple with the integer and the offset following it
+    """
+    value = shift = 0
+    byte = data[offset]
+    while byte & 0x80:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        offset += 1
+        byte = data[offset]
+    return value | (byte << shift), offset + 1
+
+
+def encode_positions(doc_ids, positions):
+    """
+    Function to compress the positions of a term: one group per doc, with the byte length of the group followed by
+    the gaps between the positions of the term in the doc
+    :param doc_ids: Sorted doc ids, repeated once per occurrence of the term in the doc
+    :param positions: Position of each occurrence, sorted within a doc
+    :return: bytes of the compressed positions
+    """
+
+    encoded = bytearray()
+    doc_positions = iter(positions)
+    for _, occurrences in groupby(doc_ids):
+        group = bytearray()
+        previous_position = 0
+        for _ in occurrences:
+            position = next(doc_positions)
+            append_vbyte(group, position - previous_position)
+            previous_position = position
+
+        append_vbyte(encoded, len(group))
+        encoded += group
+
+    return bytes(encoded)
+
+
+def decode_position_group(data, offset, end):
+    """
+    Function to decode the positions of a term in one doc
+    :param data: bytes-like object of the compressed positions of the term
+    :param offset: Offset of the first gap of the group
+    :param end: Offset following the group
+    :return: list of positions in ascending order
+    """
+    positions = list()
+    position = 0
+    while offset < end:
+        gap, offset = read_vbyte(data, offset)
+        position += gap
+        positions.append(position)
+    return positions
+
+
+def iter_doc_positions(postings_data, positions_data, doc_ids=None, with_freqs=True):
+    """
+    Generator over the positions of a term in its docs, walking its postings to skip the groups of the other docs
+    :param postings_data: bytes-like object of the compressed postings of the term
+    :param positions_data: bytes-like object of the compressed positions of the term
+    :param doc_ids: Sorted doc ids whose positions are decoded (None for all the docs of the postings)
+    :param with_freqs: True if the postings were saved with term frequencies
+    :return: generator of (doc_id, list of positions) for the docs asked that hold the term
+    """
+
+    wanted_doc_ids = iter(doc_ids) if doc_ids is not None else None
+    target = next(wanted_doc_ids, None) if wanted_doc_ids is not None else -1
+
+    offset = 0
+    for doc_id in decode_postings(postings_data, with_freqs=with_freqs):
+        while target is not None and target < doc_id and wanted_doc_ids is not None:
+            target = next(wanted_doc_ids, None)
+        if target is None:
+            return
+
+        group_length, offset = read_vbyte(positions_data, offset)
+        if wanted_doc_ids is None or doc_id == target:
+            yield doc_id, decode_position_group(positions_data, offset, offset + group_length)
+        offset += group_length
+
+
+def encode_front_coded(terms, block_terms=LEXICON_BLOCK_TERMS):
+    """
+    Function to front-code sorted terms: each term only saves what follows the prefix shared with the previous one,
+    except the first term of each block of terms, saved in full
+    :param terms: Sorted list of terms
+    :param block_terms: No. of terms per block
+    :return: tuple with the bytes of the front-coded terms and the offset of each block
+    """
+
+    encoded = bytearray()
+    block_offsets = array("Q")
+    previous_term = b""
+    for term_idx, term in enumerate(terms):
+        term = term.encode("utf-8", "surrogatepass")
+        if term_idx % block_terms == 0:
+            block_offsets.append(len(encoded))
+            previous_term = b""
+
+        prefix_length = 0
+        max_prefix_length = min(len(term), len(previous_term))
+        while prefix_length < max_prefix_length and term[prefix_length] == previous_term[prefix_length]:
+            prefix_length += 1
+
+        append_vbyte(encoded, prefix_length)
+        append_vbyte(encoded, len(term) - prefix_length)
+        encoded += term[prefix_length:]
+        previous_term = term
+
+    return bytes(encoded), block_offsets
+
+
+def decode_front_coded(data):
+    """
+    Function to decode terms front-coded by encode_front_coded
+    :param data: bytes-like object of the front-coded terms
+    :return: list of terms
+    """
+
+    terms = list()
+    term = b""
+    offset = 0
+    while offset < len(data):
+        prefix_length, offset = read_vbyte(data, offset)
+        suffix_length, offset = read_vbyte(data, offset)
+        term = term[:prefix_length] + bytes(data[offset:offset + suffix_length])
+        offset += suffix_length
+        terms.append(term.decode("utf-8", "surrogatepass"))
+
+    return terms
+
+
+class FrontCodedLexicon:
+    """
+    Sorted terms front-coded in blocks by encode_front_coded, looked up without decoding the whole lexicon:
+    only the heads of the blocks are kept decoded, for the binary search.
+    Terms are compared as UTF-8 bytes, which sort in the same order as the strings.
+    It behaves like a read-only sorted list of terms.
+    """
+
+    def __init__(self, data, block_offsets, no_terms, block_terms=LEXICON_BLOCK_TERMS):
+        """
+        Constructor for the lexicon
+        :param data: bytes of the front-coded terms
+        :param block_offsets: Offset of each block of terms in data
+        :param no_terms: No. of terms
+        :param block_terms: No. of terms per block
+        """
+        self.data = data
+        self.block_offsets = block_offsets
+        self.no_terms = no_terms
+        self.block_terms = block_terms
+
+        # First term of each block, as UTF-8 bytes
+        self.block_heads = [self.block_head(block_no) for block_no in range(len(block_offsets))]
+
+    def __len__(self):
+        return self.no_terms
+
+    def __iter__(self):
+        return (term.decode("utf-8", "surrogatepass") for term in self.iter_block_terms(0))
+
+    def __getitem__(self, term_idx):
+        if term_idx < 0:
+            term_idx += self.no_terms
+        if not 0 <= term_idx < self.no_terms:
+            raise IndexError("Lexicon index out of range")
+
+        block_no, term_no = divmod(term_idx, self.block_terms)
+        for block_term_no, term in enumerate(self.iter_block_terms(block_no, single_block=True)):
+            if block_term_no == term_no:
+                return term.decode("utf-8", "surrogatepass")
+
+    def __contains__(self, term):
+        return self.index(term) is not None
+
+    def iter_block_terms(self, block_no, single_block=False):
+        """
+        Generator decoding the terms from the start of a block
+        :param block_no: No. of the block
+        :param single_block: True to stop at the end of the block, False to go on to the end of the lexicon
+        :return: generator of terms as UTF-8 bytes
+        """
+
+        data = self.data
+        offset = self.block_offsets[block_no] if block_no < len(self.block_offsets) else len(data)
+        end = self.block_offsets[block_no + 1] if single_block and block_no + 1 < len(self.block_offsets) \
+            else len(data)
+
+        term = b""
+        while offset < end:
+            # Lengths below 128 take one byte (nearly all of them)
+            prefix_length = data[offset]
+            if prefix_length < 0x80:
+                offset += 1
+            else:
+                prefix_length, offset = read_vbyte(data, offset)
+            suffix_length = data[offset]
+            if suffix_length < 0x80:
+                offset += 1
+            else:
+                suffix_length, offset = read_vbyte(data, offset)
+
+            term = term[:prefix_length] + data[offset:offset + suffix_length]
+            offset += suffix_length
+            yield term
+
+    def block_head(self, block_no):
+        """
+        Method to get the first term of a block, saved in full
+        :param block_no: No. of the block
+        :return: Term as UTF-8 bytes
+        """
+        _, offset = read_vbyte(self.data, self.block_offsets[block_no])
+        term_length, offset = read_vbyte(self.data, offset)
+        return self.data[offset:offset + term_length]
+
+    def bisect_left(self, term):
+        """
+        Method to find where a term is or would be in the lexicon: a binary search finds the last block whose head
+        is not greater than the term, then the block is scanned
+        :param term: Term (string or UTF-8 bytes)
+        :return: Position of the first term of the lexicon not lower than the term
+        """
+
+        if isinstance(term, str):
+            term = term.encode("utf-8", "surrogatepass")
+
+        # All the heads are greater than the term
+        block_no = self.__find_block(term)
+        if block_no < 0:
+            return 0
+
+        term_idx = block_no * self.block_terms
+        for block_term in self.iter_block_terms(block_no, single_block=True):
+            if block_term >= term:
+                break
+            term_idx += 1
+        return term_idx
+
+    def index(self, term):
+        """
+        Method to find the position of a term in the lexicon
+        :param term: Term to look up
+        :return: Position of the term in the lexicon, None if not found
+        """
+
+        term = term.encode("utf-8", "surrogatepass")
+        block_no = self.__find_block(term)
+        if block_no < 0:
+            return None
+
+        for block_term_no, block_term in enumerate(self.iter_block_terms(block_no, single_block=True)):
+            if block_term >= term:
+                return block_no * self.block_terms + block_term_no if block_term == term else None
+        return None
+
+    def prefix_range(self, prefix):
+        """
+        Method to get the range of the terms starting with a prefix
+        :param prefix: Prefix of the terms
+        :return: tuple with the position of the first term with the prefix and the position following the last one
+        """
+        prefix = prefix.encode("utf-8", "surrogatepass")
+
+        # 0xFF is never part of UTF-8, so every term with the prefix is lower than the prefix followed by it
+        return self.bisect_left(prefix), self.bisect_left(prefix + b"\xff")
+
+    def __find_block(self, term):
+        """
+        Helper method to find the block a term belongs to with a binary search over the block heads
+        :param term: Term as UTF-8 bytes
+        :return: No. of the last block whose head is not greater than the term (-1 if all the heads are greater)
+        """
+        return bisect_right(self.block_heads, term) - 1
+
+    def iter_terms(self, term_idxs):
+        """
+        Generator over the terms at some positions of the lexicon, decoding each block holding them once
+        :param term_idxs: Sorted positions of the terms
+        :return: generator of terms
+        """
+
+        block_no, block_terms = None, None
+        for term_idx in term_idxs:
+            term_block_no, term_no = divmod(term_idx, self.block_terms)
+            if term_block_no != block_no:
+                block_no = term_block_no
+                block_terms = list(self.iter_block_terms(block_no, single_block=True))
+            yield block_terms[term_no].decode("utf-8", "surrogatepass")
+
+    def iter_range(self, start, end):
+        """
+        Generator over a range of terms of the lexicon, decoding them from the block of the first one
+        :param start: Position of the first term
+        :param end: Position following the last term
+        :return: generator of (position, term)
+        """
+
+        if start >= end:
+            return
+
+        block_no = start // self.block_terms
+        term_idx = block_no * self.block_terms
+        for term in self.iter_block_terms(block_no):
+            if term_idx >= end:
+                return
+            if term_idx >= start:
+                yield term_idx, term.decode("utf-8", "surrogatepass")
+            term_idx += 1
+
+
+def encode_postings(doc_ids, with_freqs=False):
+    """
+    Function to compress a sorted postings list: doc ids are gap-encoded and the gaps saved as variable-byte ints
+    :param doc_ids: Sorted iterable of distinct doc ids. With term frequencies, a doc id is repeated once
+    per occurrence of the term in the doc
+    :param with_freqs: True to save the term frequency of each doc
+    :return: bytes of the compressed postings list
+    """
+
+    encoded = bytearray()
+    previous_doc_id = 0
+
+    if not with_freqs:
+        for doc_id in doc_ids:
+            append_vbyte(encoded, doc_id - previous_doc_id)
+            previous_doc_id = doc_id
+        return bytes(encoded)
+
+    for doc_id, occurrences in groupby(doc_ids):
+        term_freq = sum(1 for _ in occurrences)
+        gap = doc_id - previous_doc_id
+        previous_doc_id = doc_id
+
+        if term_freq == 1:
+            append_vbyte(encoded, gap << 1 | 1)
+        else:
+            append_vbyte(encoded, gap << 1)
+            append_vbyte(encoded, term_freq)
+
+    return bytes(encoded)
+
+
+def decode_postings(data, doc_id=0, with_freqs=False):
+    """
+    Generator decoding a postings list compressed by encode_postings, one doc id at a time
+    :param data: bytes-like object of the compressed postings list
+    :param doc_id: Doc id preceding the first gap of data (to decode from a skip pointer)
+    :param with_freqs: True if the postings list was saved with term frequencies (they are skipped)
+    :return: generator of doc ids in ascending order
+    """
+
+    value = shift = 0
+
+    if not with_freqs:
+        for byte in data:
+            if byte & 0x80:
+                value |= (byte & 0x7F) << shift
+                shift += 7
+            else:
+                doc_id += value | (byte << shift)
+                yield doc_id
+                value = shift = 0
+        return
+
+    reading_freq = False
+    for byte in data:
+        if byte & 0x80:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            continue
+
+        value |= byte << shift
+        if reading_freq:
+            reading_freq = False
+        else:
+            doc_id += value >> 1
+            yield doc_id
+            reading_freq = not value & 1
+        value = shift = 0
+
+
+def decode_postings_freqs(data, doc_id=0, with_freqs=True):
+    """
+    Generator decoding a postings list compressed by encode_postings with the term frequency of each doc
+    :param data: bytes-like object of the compressed postings list
+    :param doc_id: Doc id preceding the first gap of data (to decode from a skip pointer)
+    :param with_freqs: True if the postings list was saved with term frequencies (otherwise every tf is 1)
+    :return: generator of (doc_id, tf) in ascending order of doc ids
+    """
+
+    if not with_freqs:
+        for doc_id in decode_postings(data, doc_id):
+            yield doc_id, 1
+        return
+
+    value = shift = 0
+    reading_freq = False
+    for byte in data:
+        if byte & 0x80:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            continue
+
+        value |= byte << shift
+        if reading_freq:
+            yield doc_id, value
+            reading_freq = False
+        else:
+            doc_id += value >> 1
+            if value & 1:
+                yield doc_id, 1
+            else:
+                reading_freq = True
+        value = shift = 0
+
+
+def build_skips(data, interval=SKIP_INTERVAL, with_freqs=False):
+    """
+    Function to get the skip pointers of a postings list compressed by encode_postings
+    :param data: bytes-like object of the compressed postings list
+    :param interval: No. of postings between two skip pointers
+    :param with_freqs: True if the postings list was saved with term frequencies
+    :return: tuple with the array of doc ids preceding each skip and the array of the byte offsets of each skip
+    """
+
+    skip_doc_ids, skip_offsets = array(SKIP_TYPECODE), array(SKIP_TYPECODE)
+
+    doc_id = value = shift = no_postings = 0
+    reading_freq = False
+    for byte_offset, byte in enumerate(data):
+        if byte & 0x80:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            continue
+
+        value |= byte << shift
+        if reading_freq:
+            reading_freq = False
+        elif with_freqs:
+            doc_id += value >> 1
+            reading_freq = not value & 1
+        else:
+            doc_id += value
+        value = shift = 0
+
+        # Skip pointers are placed at the start of a posting only
+        if reading_freq:
+            continue
+
+        no_postings += 1
+        if no_postings % interval == 0 and byte_offset + 1 < len(data):
+            skip_doc_ids.append(doc_id)
+            skip_offsets.append(byte_offset + 1)
+
+    return skip_doc_ids, skip_offsets
+
+
+class PostingsCursor:
+    """
+    Cursor moving forward on a compressed postings list, using its skip pointers to advance to a target doc id
+    """
+
+    __slots__ = ("postings", "doc_id", "freq", "decoder", "next_skip")
+
+    def __init__(self, postings):
+        """
+        Constructor for a cursor positioned on the first doc id of a postings list
+        :param postings: PostingsList
+        """
+        self.postings = postings
+        self.decoder = decode_postings_freqs(postings.data, with_freqs=postings.with_freqs)
+        self.next_skip = 0
+        self.doc_id, self.freq = next(self.decoder, (None, 0))
+
+    def next(self):
+        """
+        Method to move to the next doc id
+        :return: The new current doc id, None when the list is exhausted
+        """
+        self.doc_id, self.freq = next(self.decoder, (None, 0))
+        return self.doc_id
+
+    def advance(self, target):
+        """
+        Method to move to the first doc id greater or equal to a target
+        :param target: Doc id to reach
+        :return: The new current doc id, None when the list is exhausted
+        """
+
+        if self.doc_id is None or self.doc_id >= target:
+            return self.doc_id
+
+        # Jump to the last skip pointer preceding the target if it is ahead of the cursor
+        skip_doc_ids = self.postings.skip_doc_ids
+        if skip_doc_ids is not None:
+            skip_idx = bisect_left(skip_doc_ids, target, self.next_skip) - 1
+            if skip_idx >= self.next_skip and skip_doc_ids[skip_idx] >= self.doc_id:
+                # The rest of the list is decoded from a view of its bytes, without copying them
+                skip_data = memoryview(self.postings.data)[self.postings.skip_offsets[skip_idx]:]
+                self.decoder = decode_postings_freqs(skip_data, skip_doc_ids[skip_idx], self.postings.with_freqs)
+                self.next_skip = skip_idx + 1
+
+        doc_id, freq = self.doc_id, self.freq
+        decoder = self.decoder
+        while doc_id is not None and doc_id < target:
+            doc_id, freq = next(decoder, (None, 0))
+        self.doc_id, self.freq = doc_id, freq
+        return doc_id
+
+
+class SequenceCursor:
+    """
+    Cursor moving forward on a sorted sequence of doc ids (e.g. a list), with galloping search to advance
+    """
+
+    __slots__ = ("postings", "doc_id", "position")
+
+    # Sequences of doc ids have no term frequencies
+    freq = 1
+
+    def __init__(self, postings):
+        """
+        Constructor for a cursor positioned on the first doc id of a sequence
+        :param postings: Sorted sequence of doc ids supporting random access
+        """
+        self.postings = postings
+        self.position = 0
+        self.doc_id = postings[0] if len(postings) > 0 else None
+
+    def next(self):
+        """
+        Method to move to the next doc id
+        :return: The new current doc id, None when the sequence is exhausted
+        """
+        self.position += 1
+        self.doc_id = self.postings[self.position] if self.position < len(self.postings) else None
+        return self.doc_id
+
+    def advance(self, target):
+        """
+        Method to move to the first doc id greater or equal to a target, with an exponential search
+        followed by a binary search
+        :param target: Doc id to reach
+        :return: The new current doc id, None when the sequence is exhausted
+        """
+
+        if self.doc_id is None or self.doc_id >= target:
+            return self.doc_id
+
+        postings, low = self.postings, self.position
+        step = 1
+        high = low + step
+        while high < len(postings) and postings[high] < target:
+            low = high
+            step *= 2
+            high = low + step
+
+        self.position = bisect_left(postings, target, low + 1, min(high + 1, len(postings)))
+        self.doc_id = postings[self.position] if self.position < len(postings) else None
+        return self.doc_id
+
+
+def open_cursor(postings):
+    """
+    Function to open a cursor on a postings list of any supported type
+    :param postings: PostingsList or sorted sequence of doc ids
+    :return: PostingsCursor or SequenceCursor
+    """
+    if isinstance(postings, PostingsList):
+        return PostingsCursor(postings)
+    if not hasattr(postings, "__getitem__"):
+        postings = list(postings)
+    return SequenceCursor(postings)
+
+
+class PostingsList:
+    """
+    Compressed postings list, decoded on demand when iterated
+    """
+
+    __slots__ = ("data", "doc_freq", "skip_doc_ids", "skip_offsets", "with_freqs")
+
+    def __init__(self, data, doc_freq, skip_doc_ids=None, skip_offsets=None, with_freqs=False):
+        """
+        Constructor for a compressed postings list
+        :param data: bytes-like object of the postings compressed by encode_postings
+        :param doc_freq: No. of doc ids in the list
+        :param skip_doc_ids: Sequence of the doc ids preceding each skip pointer (None if no skip pointers)
+        :param skip_offsets: Sequence of the byte offsets in data of each skip pointer
+        :param with_freqs: True if the postings list was saved with term frequencies
+        """
+        self.data = data
+        self.doc_freq = doc_freq
+        self.skip_doc_ids = skip_doc_ids
+        self.skip_offsets = skip_offsets
+        self.with_freqs = with_freqs
+
+    @classmethod
+    def from_doc_ids(cls, doc_ids, with_freqs=False):
+        """
+        Method to compress a list of doc ids
+        :param doc_ids: Sorted list of distinct doc ids. With term frequencies, a doc id is repeated once
+        per occurrence of the term in the doc
+        :param with_freqs: True to save the term frequency of each doc
+        :return: PostingsList
+        """
+        doc_freq = sum(1 for _ in groupby(doc_ids)) if with_freqs else len(doc_ids)
+        return cls(encode_postings(doc_ids, with_freqs), doc_freq, with_freqs=with_freqs)
+
+    def __len__(self):
+        return self.doc_freq
+
+    def __iter__(self):
+        return decode_postings(self.data, with_freqs=self.with_freqs)
+
+    def iter_freqs(self):
+        """
+        Method to decode the postings list with the term frequency of each doc
+        :return: generator of (doc_id, tf)
+        """
+        return decode_postings_freqs(self.data, with_freqs=self.with_freqs)
+
+    def cursor(self):
+        """
+        Method to open a cursor on the postings list
+        :return: PostingsCursor
+        """
+        return PostingsCursor(self)
+
+    def __reduce__(self):
+        # Pickle the compressed bytes, even when mapped on a file
+        return self.__class__, (bytes(self.data), self.doc_freq, None, None, self.with_freqs)
+
+
+def merge_postings_lists(postings_lists, with_freqs=False, deleted_docs=None):
+    """
+    Function to merge the postings lists of a term saved in different indexes (e.g. segments) into one
+    compressed postings list, with skip pointers if it is long enough
+    :param postings_lists: PostingsList of the term in each index (the same doc id in many lists has its
+    term frequencies added)
+    :param with_freqs: True to save the term frequency of each doc
+    :param deleted_docs: DeletionBitmap of the docs to leave out (None to keep all the docs)
+    :return: PostingsList (with a doc freq of 0 if all its docs were deleted)
+    """
+    doc_ids = [doc_id for doc_id, term_freq in heapq.merge(*(postings.iter_freqs() for postings in postings_lists))
+               for _ in range(term_freq if with_freqs else 1)]
+    if not with_freqs:
+        doc_ids = [doc_id for doc_id, _ in groupby(doc_ids)]
+    if deleted_docs:
+        doc_ids = deleted_docs.filter(doc_ids)
+
+    postings = PostingsList.from_doc_ids(doc_ids, with_freqs)
+    if postings.doc_freq > SKIP_INTERVAL:
+        postings.skip_doc_ids, postings.skip_offsets = build_skips(postings.data, with_freqs=with_freqs)
+    return postings
+
+
+def write_record(record, file_obj):
+    """
+    Function to append a record to a stream of pickled records
+    :param record: Object to save
+    :param file_obj: Binary file object to write to
+    :return: None
+    """
+    pickle.dump(obj=record, file=file_obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def iter_records(file_obj):
+    """
+    Generator over a stream of pickled records, loading one record at a time
+    :param file_obj: Binary file object to read from
+    :return: generator of records
+    """
+    while True:
+        try:
+            yield pickle.load(file_obj)
+        except EOFError:
+            return
+
+
+def index_exists(index_prefix):
+    """
+    Function to check if an on-disk index was saved with the prefix passed
+    :param index_prefix: Path of the index without extension
+    :return: True if the lexicon and postings files exist, False otherwise
+    """
+    return all(os.path.exists(index_prefix + extension) for extension in (LEXICON_EXT, POSTINGS_EXT, SKIPS_EXT))
+
+
+def remove_index(index_prefix):
+    """
+    Function to remove the files of an on-disk index. The files are unlinked, not truncated, so readers that
+    mapped them keep their data until they close the index.
+    :param index_prefix: Path of the index without extension
+    :return: None
+    """
+    for extension in (LEXICON_EXT, POSTINGS_EXT, SKIPS_EXT, DOC_LENGTHS_EXT, POSITIONS_EXT):
+        if os.path.exists(index_prefix + extension):
+            os.remove(index_prefix + extension)
+
+
+class DeletionBitmap:
+    """
+    Set of deleted doc ids saved as a bitmap (bit doc_id % 8 of byte doc_id // 8 is set when the doc is deleted).
+    Deleted docs are filtered out of the results until their postings are compacted away.
+    """
+
+    def __init__(self, bits=b""):
+        """
+        Constructor for a bitmap
+        :param bits: bytes-like object of the bitmap (empty if no doc is deleted)
+        """
+        self.bits = bytearray(bits)
+
+        # Set of the deleted doc ids, built on first use to filter many doc ids (membership is checked in C)
+        self.doc_id_set = None
+
+    def __len__(self):
+        return bin(int.from_bytes(self.bits, "little")).count("1")
+
+    def __bool__(self):
+        return any(self.bits)
+
+    def __contains__(self, doc_id):
+        byte_idx = doc_id >> 3
+        return byte_idx < len(self.bits) and self.bits[byte_idx] >> (doc_id & 7) & 1 == 1
+
+    def __iter__(self):
+        for byte_idx, byte in enumerate(self.bits):
+            while byte:
+                low_bit = byte & -byte
+                yield byte_idx << 3 | low_bit.bit_length() - 1
+                byte ^= low_bit
+
+    def add(self, doc_id):
+        """
+        Method to mark a doc as deleted
+        :param doc_id: Doc id
+        :return: None
+        """
+        byte_idx = doc_id >> 3
+        if byte_idx >= len(self.bits):
+            self.bits.extend(bytes(byte_idx + 1 - len(self.bits)))
+        self.bits[byte_idx] |= 1 << (doc_id & 7)
+        self.doc_id_set = None
+
+    def discard(self, doc_id):
+        """
+        Method to unmark a deleted doc
+        :param doc_id: Doc id
+        :return: None
+        """
+        if doc_id in self:
+            self.bits[doc_id >> 3] &= ~(1 << (doc_id & 7)) & 0xFF
+            self.doc_id_set = None
+
+    def as_set(self):
+        """
+        Method to get the deleted doc ids as a set
+        :return: frozenset of doc ids
+        """
+        if self.doc_id_set is None:
+            self.doc_id_set = frozenset(self)
+        return self.doc_id_set
+
+    def filter(self, doc_ids):
+        """
+        Method to remove the deleted docs from doc ids
+        :param doc_ids: Iterable of doc ids
+        :return: list of the doc ids not deleted, in the same order
+        """
+        deleted_doc_ids = self.as_set()
+        return [doc_id for doc_id in doc_ids if doc_id not in deleted_doc_ids]
+
+    @classmethod
+    def load(cls, index_prefix):
+        """
+        Method to load the deleted docs of an index
+        :param index_prefix: Path of the index without extension
+        :return: DeletionBitmap (empty if no doc was deleted)
+        """
+        try:
+            with open(index_prefix + DELETIONS_EXT, "rb") as deletions_file:
+                return cls(deletions_file.read())
+        except (IOError, OSError):
+            return cls()
+
+    def save(self, index_prefix):
+        """
+        Method to save the deleted docs of an index, replacing the previous bitmap atomically
+        (the bitmap file is removed if no doc is deleted)
+        :param index_prefix: Path of the index without extension
+        :return: None
+        """
+        deletions_path = index_prefix + DELETIONS_EXT
+        if not self:
+            if os.path.exists(deletions_path):
+                os.remove(deletions_path)
+            return
+
+        with open(deletions_path + TMP_EXT, "wb") as deletions_file:
+            deletions_file.write(bytes(self.bits.rstrip(b"\x00")))
+        os.replace(deletions_path + TMP_EXT, deletions_path)
+
+
+class DiskIndexWriter:
+    """
+    Class to write an inverted index to disk one term at a time, in sorted order of terms
+    """
+
+    def __init__(self, index_prefix, with_freqs=False, with_positions=False):
+        """
+        Constructor opening the postings file of the index
+        :param index_prefix: Path of the index without extension
+        :param with_freqs: True to save the term frequency of each doc in the postings
+        :param with_positions: True to save the positions of each term in each doc (needs term frequencies)
+        """
+        if with_positions and not with_freqs:
+            raise ValueError("Positions can only be saved with term frequencies")
+
+        self.index_prefix = index_prefix
+        self.with_freqs = with_freqs
+        self.with_positions = with_positions
+
+        self.terms = list()
+        self.offsets = array("Q", [0])
+        self.doc_freqs = array("I")
+
+        # Highest term frequency in the postings of each term
+        self.max_freqs = array("I")
+
+        # Length in tokens of each doc (saved only if set)
+        self.doc_lengths = None
+
+        # Offset of the skip pointers of each term, in no. of skip pointers
+        self.skips = array("Q", [0])
+
+        # Offset of the positions of each term (saved only with positions)
+        self.position_offsets = array("Q", [0])
+
+        # Files are written next to the ones of the index and replace them on close, as readers may have them mapped
+        self.saved_extensions = [POSTINGS_EXT, SKIPS_EXT] + ([POSITIONS_EXT] if with_positions else [])
+
+        self.postings_offset = 0
+        self.postings_file = open(index_prefix + POSTINGS_EXT + TMP_EXT, "wb")
+        self.skips_file = open(index_prefix + SKIPS_EXT + TMP_EXT, "wb")
+        self.positions_file = open(index_prefix + POSITIONS_EXT + TMP_EXT, "wb") if with_positions else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # The index is only replaced if all its terms were written
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def add_term(self, term, postings, positions=None):
+        """
+        Method to append the postings list of a term. Terms must be added in sorted order.
+        :param term: The term
+        :param postings: Sorted list of doc ids (repeated once per occurrence with term frequencies), or PostingsList
+        :param positions: With positions, the position of each occurrence in the list of doc ids,
+        or the positions compressed by encode_positions if the postings are a PostingsList
+        :return: None
+        """
+
+        if self.terms and term <= self.terms[-1]:
+            raise ValueError("Terms must be added in sorted order: %s after %s" % (term, self.terms[-1]))
+
+        if self.with_positions:
+            if positions is None:
+                raise ValueError("Positions of %s are missing" % term)
+            if not isinstance(postings, PostingsList):
+                positions = encode_positions(postings, positions)
+            self.positions_file.write(positions)
+            self.position_offsets.append(self.position_offsets[-1] + len(positions))
+
+        if not isinstance(postings, PostingsList):
+            postings = PostingsList.from_doc_ids(postings, self.with_freqs)
+        elif postings.with_freqs != self.with_freqs:
+            raise ValueError("Postings of %s do not match the term frequencies setting of the index" % term)
+        self.postings_file.write(postings.data)
+
+        self.postings_offset += len(postings.data)
+
+        # Doc ids of all the skip pointers of the term are saved before their byte offsets
+        skip_doc_ids, skip_offsets = build_skips(postings.data, with_freqs=self.with_freqs) \
+            if postings.doc_freq > SKIP_INTERVAL else (array(SKIP_TYPECODE), array(SKIP_TYPECODE))
+        skip_doc_ids.tofile(self.skips_file)
+        skip_offsets.tofile(self.skips_file)
+        self.skips.append(self.skips[-1] + len(skip_doc_ids))
+
+        self.terms.append(term)
+        self.offsets.append(self.postings_offset)
+        self.doc_freqs.append(postings.doc_freq)
+        self.max_freqs.append(max(term_freq for _, term_freq in postings.iter_freqs()) if self.with_freqs else 1)
+
+    def set_doc_lengths(self, doc_lengths):
+        """
+        Method to set the length of the docs, saved when the index is closed
+        :param doc_lengths: dict of doc id -> no. of tokens in the doc
+        :return: None
+        """
+        self.doc_lengths = doc_lengths
+
+    def close(self):
+        """
+        Method to close the postings file and save the lexicon. The files of the index are replaced atomically,
+        the lexicon last, so that readers keep the files they mapped and only see the new index once complete.
+        :return: None
+        """
+
+        if self.postings_file.closed:
+            return
+
+        try:
+            self.__write_lexicon()
+        except BaseException:
+            self.abort()
+            raise
+
+        for extension in self.saved_extensions + [LEXICON_EXT]:
+            os.replace(self.index_prefix + extension + TMP_EXT, self.index_prefix + extension)
+
+    def abort(self):
+        """
+        Method to close the files written without saving the index: they are removed, and the files of the index
+        are left as they were
+        :return: None
+        """
+        for file_obj in (self.postings_file, self.skips_file, self.positions_file):
+            if file_obj is not None:
+                file_obj.close()
+
+        for extension in (POSTINGS_EXT, SKIPS_EXT, POSITIONS_EXT, DOC_LENGTHS_EXT, LEXICON_EXT):
+            if os.path.exists(self.index_prefix + extension + TMP_EXT):
+                os.remove(self.index_prefix + extension + TMP_EXT)
+
+    def __write_lexicon(self):
+        """
+        Helper method to close the postings files and write the doc lengths and lexicon files next to the index
+        :return: None
+        """
+
+        self.postings_file.close()
+        self.skips_file.close()
+        if self.positions_file is not None:
+            self.positions_file.close()
+
+        header = {"version": INDEX_FORMAT_VERSION, "no_terms": len(self.terms), "postings_codec": POSTINGS_CODEC,
+                  "with_freqs": self.with_freqs, "doc_lengths": bool(self.doc_lengths),
+                  "with_positions": self.with_positions, "lexicon_block_terms": LEXICON_BLOCK_TERMS}
+
+        if self.doc_lengths:
+            lengths = array(DOC_LENGTH_TYPECODE, [0] * (max(self.doc_lengths) + 1))
+            for doc_id, doc_length in self.doc_lengths.items():
+                lengths[doc_id] = doc_length
+
+            with open(self.index_prefix + DOC_LENGTHS_EXT + TMP_EXT, "wb") as doc_lengths_file:
+                lengths.tofile(doc_lengths_file)
+            self.saved_extensions.append(DOC_LENGTHS_EXT)
+
+            header["no_docs"] = len(self.doc_lengths)
+            header["avg_doc_length"] = sum(self.doc_lengths.values()) / float(len(self.doc_lengths))
+            header["min_doc_length"] = min(self.doc_lengths.values())
+
+        with open(self.index_prefix + LEXICON_EXT + TMP_EXT, "wb") as lexicon_file:
+            write_record(header, lexicon_file)
+            for lexicon_record in encode_front_coded(self.terms):
+                write_record(lexicon_record, lexicon_file)
+            write_record(self.offsets, lexicon_file)
+            write_record(self.doc_freqs, lexicon_file)
+            write_record(self.skips, lexicon_file)
+            write_record(self.max_freqs, lexicon_file)
+            if self.with_positions:
+                write_record(self.position_offsets, lexicon_file)
+
+
+class DiskIndexReader:
+    """
+    Class to read an inverted index saved by DiskIndexWriter.
+    Only the lexicon is loaded in memory; the postings file is memory-mapped, so that many processes
+    opening the index share the page cache, and a term's postings are only decoded when iterated.
+    It behaves like a read-only dict of term -> postings list.
+    """
+
+    def __init__(self, index_prefix):
+        """
+        Constructor loading the lexicon and mapping the postings file
+        :param index_prefix: Path of the index without extension
+        """
+        self.index_prefix = index_prefix
+
+        with open(index_prefix + LEXICON_EXT, "rb") as lexicon_file:
+            records = iter_records(lexicon_file)
+            self.header = next(records)
+            if self.header.get("version") != INDEX_FORMAT_VERSION:
+                raise ValueError("Unsupported index format version: %s" % self.header.get("version"))
+
+            self.terms = FrontCodedLexicon(next(records), next(records), self.header["no_terms"],
+                                           self.header["lexicon_block_terms"])
+            self.offsets = next(records)
+            self.doc_freqs = next(records)
+            self.skips = next(records)
+            self.max_freqs = next(records)
+            self.position_offsets = next(records, None)
+
+        self.with_freqs = self.header.get("with_freqs", False)
+        self.with_positions = self.header.get("with_positions", False)
+
+        self.postings = self.__map_file(index_prefix + POSTINGS_EXT)
+        self.skip_pointers = memoryview(self.__map_file(index_prefix + SKIPS_EXT)).cast(SKIP_TYPECODE)
+
+        self.doc_lengths = None
+        if self.header.get("doc_lengths"):
+            self.doc_lengths = memoryview(self.__map_file(index_prefix + DOC_LENGTHS_EXT)).cast(DOC_LENGTH_TYPECODE)
+
+        self.positions = self.__map_file(index_prefix + POSITIONS_EXT) if self.with_positions else None
+
+        # K-gram index of the lexicon, built on the first wildcard lookup
+        self.kgram_index = None
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return self.term_idx(term) is not None
+
+    def __iter__(self):
+        return iter(self.terms)
+
+    def __getitem__(self, term):
+        term_idx = self.term_idx(term)
+        if term_idx is None:
+            raise KeyError(term)
+        return self.get_postings(term_idx)
+
+    def get(self, term, default=None):
+        """
+        Method to get the postings list of a term
+        :param term: Term to look up
+        :param default: Value returned if the term is not in the index
+        :return: Postings list of the term
+        """
+        term_idx = self.term_idx(term)
+        return self.get_postings(term_idx) if term_idx is not None else default
+
+    def keys(self):
+        return iter(self.terms)
+
+    def values(self):
+        return (self.get_postings(term_idx) for term_idx in range(len(self.terms)))
+
+    def items(self):
+        return ((term, self.get_postings(term_idx)) for term_idx, term in enumerate(self.terms))
+
+    def term_idx(self, term):
+        """
+        Method to find a term in the sorted lexicon with a binary search over the heads of its front-coded blocks
+        :param term: Term to look up
+        :return: Position of the term in the lexicon, None if not found
+        """
+        return self.terms.index(term)
+
+    def expand_wildcard(self, pattern):
+        """
+        Method to get the terms of the lexicon matching a wildcard pattern: a prefix pattern is a range scan of
+        the lexicon, other patterns are looked up in its k-gram index
+        :param pattern: Wildcard pattern (e.g. petro*, *ation)
+        :return: Sorted list of the terms matching the pattern
+        """
+        if self.kgram_index is None:
+            self.kgram_index = KGramIndex(self.terms)
+        return expand_wildcard(self.terms, pattern, self.kgram_index)
+
+    def doc_freq(self, term):
+        """
+        Method to get the no. of docs a term appears in without reading its postings
+        :param term: Term to look up
+        :return: Document frequency of the term (0 if not in the index)
+        """
+        term_idx = self.term_idx(term)
+        return self.doc_freqs[term_idx] if term_idx is not None else 0
+
+    def max_freq(self, term):
+        """
+        Method to get the highest term frequency of a term in a doc
+        :param term: Term to look up
+        :return: Highest term frequency of the term (0 if not in the index)
+        """
+        term_idx = self.term_idx(term)
+        return self.max_freqs[term_idx] if term_idx is not None else 0
+
+    def doc_length(self, doc_id):
+        """
+        Method to get the length of a doc
+        :param doc_id: Doc id
+        :return: No. of tokens of the doc (0 if unknown)
+        """
+        if self.doc_lengths is None or doc_id >= len(self.doc_lengths):
+            return 0
+        return self.doc_lengths[doc_id]
+
+    def get_postings(self, term_idx):
+        """
+        Method to get the postings list of the term at a position of the lexicon, without copying or decoding it
+        :param term_idx: Position of the term in the lexicon
+        :return: PostingsList mapped on the postings file
+        """
+        postings_data = memoryview(self.postings)[self.offsets[term_idx]:self.offsets[term_idx + 1]]
+
+        skips_start, skips_end = self.skips[term_idx], self.skips[term_idx + 1]
+        if skips_start == skips_end:
+            return PostingsList(postings_data, self.doc_freqs[term_idx], with_freqs=self.with_freqs)
+
+        no_skips = skips_end - skips_start
+        skip_doc_ids = self.skip_pointers[2 * skips_start:2 * skips_start + no_skips]
+        skip_offsets = self.skip_pointers[2 * skips_start + no_skips:2 * skips_end]
+        return PostingsList(postings_data, self.doc_freqs[term_idx], skip_doc_ids, skip_offsets, self.with_freqs)
+
+    def get_positions(self, term_idx):
+        """
+        Method to get the compressed positions of the term at a position of the lexicon, without copying them
+        :param term_idx: Position of the term in the lexicon
+        :return: memoryview of the positions of the term (None if the index has no positions)
+        """
+        if not self.with_positions:
+            return None
+        return memoryview(self.positions)[self.position_offsets[term_idx]:self.position_offsets[term_idx + 1]]
+
+    def iter_positions(self, term, doc_ids=None):
+        """
+        Method to decode the positions of a term in some of its docs only
+        :param term: Term to look up
+        :param doc_ids: Sorted doc ids whose positions are decoded (None for all the docs of the term)
+        :return: generator of (doc_id, list of positions) for the docs asked that hold the term
+        """
+        term_idx = self.term_idx(term)
+        if term_idx is None or not self.with_positions:
+            return iter(())
+        return iter_doc_positions(self.get_postings(term_idx).data, self.get_positions(term_idx), doc_ids,
+                                  self.with_freqs)
+
+    def close(self):
+        """
+        Method to unmap the postings file
+        :return: None
+        """
+        mapped_files = [self.postings, self.positions]
+        for mapped_view in (self.skip_pointers, self.doc_lengths):
+            if mapped_view is not None:
+                mapped_files.append(mapped_view.obj)
+                mapped_view.release()
+
+        for mapped_file in mapped_files:
+            if isinstance(mapped_file, mmap.mmap):
+                try:
+                    mapped_file.close()
+                except BufferError:
+                    # Postings of the file are still referenced (e.g. by the traceback of an error while
+                    # reading them): it is unmapped once they are released
+                    pass
+
+    @staticmethod
+    def __map_file(path):
+        """
+        Helper method to memory-map a file in read-only mode
+        :param path: Path of the file
+        :return: mmap of the file (empty bytes if the file is empty)
+        """
+        with open(path, "rb") as file_obj:
+            if os.fstat(file_obj.fileno()).st_size > 0:
+                return mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        return b""
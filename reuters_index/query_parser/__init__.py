@@ -0,0 +1,356 @@
+"""
+Script containing the boolean query language of the search engine and its planner.
+A query such as (oil OR crude) AND opec NOT iran is parsed into an expression tree of tuples:
+- ("and", children), ("or", children) and ("not", child) for the operators. NOT binds tighter than AND,
+  AND (written or implied between two operands) tighter than OR, and parentheses group operands
+- ("term", term) for a preprocessed word, and the ("phrase", terms), ("near", (first term, second term), k) and
+  ("wildcard", pattern) clauses of IndexSearcher for quoted phrases, NEAR/k and words with a wildcard
+The planner estimates the no. of docs of each node from the doc frequencies of its terms, orders the operands
+of AND from the cheapest, turns AND NOT into an ANDNOT of the docs matched, and drops the branches that cannot
+match any doc before any postings list is read.
+"""
+
+import re
+
+from ..doc_sets import SortedDocSet, doc_set, is_doc_set, union_doc_sets
+
+# Tokens of a boolean query: parentheses, quoted phrases, and words (operators included)
+EXPRESSION_TOKEN_REGEXP = re.compile(r'\(|\)|"[^"]*"|[^\s()"]+')
+
+# Operators of the boolean queries, only recognized in upper case (lower case "and", "or" and "not" are stop words)
+AND_OPERATOR = "AND"
+OR_OPERATOR = "OR"
+NOT_OPERATOR = "NOT"
+NEAR_OPERATOR_REGEXP = re.compile(r"NEAR/\d+$")
+
+# A query is a boolean expression when it holds an operator or a parenthesis
+BOOLEAN_QUERY_REGEXP = re.compile(r'(?<![^\s()"])(?:AND|OR|NOT)(?![^\s()"])|[()]')
+
+# Plan of a branch that cannot match any doc
+EMPTY_PLAN = ("empty",)
+
+
+class QuerySyntaxError(ValueError):
+    """
+    Error raised for a boolean query that cannot be parsed or planned
+    """
+    pass
+
+
+def is_boolean_query(query):
+    """
+    Function to check if a query is a boolean expression, to be parsed by BooleanQueryParser
+    :param query: The query text
+    :return: True if the query holds an AND, OR or NOT operator or a parenthesis, False otherwise
+    """
+    return BOOLEAN_QUERY_REGEXP.search(query) is not None
+
+
+class BooleanQueryParser:
+    """
+    Recursive descent parser of the boolean queries. Words, phrases and NEAR clauses are preprocessed
+    by the searcher as the other queries, and the words left without a term (stop words) are dropped.
+    """
+
+    def __init__(self, searcher):
+        """
+        Constructor for a parser
+        :param searcher: IndexSearcher preprocessing the words of the queries
+        """
+        self.searcher = searcher
+        self.tokens = list()
+        self.token_idx = 0
+
+    def parse(self, query):
+        """
+        Method to parse a boolean query into an expression tree
+        :param query: The query text
+        :return: Root node of the tree, None if no word of the query is left once preprocessed
+        :raise QuerySyntaxError: If an operator misses an operand or a parenthesis is not closed
+        """
+
+        self.tokens = EXPRESSION_TOKEN_REGEXP.findall(query)
+        self.token_idx = 0
+
+        node = self.__parse_or()
+        if self.token_idx < len(self.tokens):
+            raise QuerySyntaxError("Unexpected '%s'" % self.tokens[self.token_idx])
+        return node
+
+    def __peek(self):
+        """
+        Helper method to get the next token without consuming it
+        :return: The token, None at the end of the query
+        """
+        return self.tokens[self.token_idx] if self.token_idx < len(self.tokens) else None
+
+    def __next(self):
+        """
+        Helper method to consume the next token
+        :return: The token, None at the end of the query
+        """
+        token = self.__peek()
+        self.token_idx += 1
+        return token
+
+    def __parse_or(self):
+        """
+        Helper method to parse operands joined by OR
+        :return: Node, None if every operand was dropped
+        """
+        children = [self.__parse_and()]
+        while self.__peek() == OR_OPERATOR:
+            self.__next()
+            children.append(self.__parse_and())
+        return self.__join("or", children)
+
+    def __parse_and(self):
+        """
+        Helper method to parse operands joined by AND, written or implied by two operands one after the other
+        :return: Node, None if every operand was dropped
+        """
+        children = [self.__parse_not()]
+        while self.__peek() not in (None, OR_OPERATOR, ")"):
+            if self.__peek() == AND_OPERATOR:
+                self.__next()
+            children.append(self.__parse_not())
+        return self.__join("and", children)
+
+    def __parse_not(self):
+        """
+        Helper method to parse an operand preceded by any no. of NOT
+        :return: Node, None if the operand was dropped
+        """
+        if self.__peek() != NOT_OPERATOR:
+            return self.__parse_operand()
+
+        self.__next()
+        child = self.__parse_not()
+        if child is None:
+            return None
+        # NOT NOT x is x
+        return child[1] if child[0] == "not" else ("not", child)
+
+    def __parse_operand(self):
+        """
+        Helper method to parse a parenthesized expression, a phrase, a NEAR clause or a word
+        :return: Node, None if the operand was dropped
+        """
+
+        token = self.__next()
+        if token is None or token in (AND_OPERATOR, OR_OPERATOR, ")"):
+            raise QuerySyntaxError("Missing operand%s" % (" before '%s'" % token if token is not None else ""))
+
+        if token == "(":
+            node = self.__parse_or()
+            if self.__next() != ")":
+                raise QuerySyntaxError("Missing ')'")
+            return node
+
+        if token.startswith('"'):
+            clauses, _ = self.searcher.parse_positional_clauses(token)
+            return self.__clause_node(clauses[0]) if clauses else None
+
+        # word NEAR/k word
+        if self.__peek() is not None and NEAR_OPERATOR_REGEXP.match(self.__peek()):
+            near_operator = self.__next()
+            second_word = self.__next()
+            if second_word is None or second_word in (AND_OPERATOR, OR_OPERATOR, NOT_OPERATOR, "(", ")"):
+                raise QuerySyntaxError("Missing operand after '%s'" % near_operator)
+            clauses, _ = self.searcher.parse_positional_clauses("%s %s %s" % (token, near_operator, second_word))
+            return self.__clause_node(clauses[0]) if clauses else None
+
+        wildcard_clauses, _ = self.searcher.parse_wildcards(token)
+        if wildcard_clauses:
+            return wildcard_clauses[0]
+
+        return self.__join("and", [("term", term) for term in self.searcher.preprocess_query(token)])
+
+    @staticmethod
+    def __clause_node(clause):
+        """
+        Helper method to get the node of a positional clause (a phrase of one term is the term)
+        :param clause: Clause parsed by IndexSearcher.parse_positional_clauses
+        :return: Node
+        """
+        if clause[0] == "phrase" and len(clause[1]) == 1:
+            return "term", clause[1][0]
+        return clause
+
+    @staticmethod
+    def __join(operator, children):
+        """
+        Helper method to join the operands of an operator, without the dropped ones
+        :param operator: "and" or "or"
+        :param children: Nodes of the operands (None for a dropped one)
+        :return: Node of the operator, its operand if only one is left, None if none is left
+        """
+        children = tuple(child for child in children if child is not None)
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else (operator, children)
+
+
+class QueryPlanner:
+    """
+    Class to plan and execute the expression trees of the boolean queries on the doc sets of a searcher.
+    A plan is a tree of ("term", term), ("clause", clause), ("and", plans), ("or", plans),
+    ("andnot", plan, plans) and ("empty",) nodes, the operands of AND ordered from the fewest docs estimated.
+    """
+
+    def __init__(self, searcher):
+        """
+        Constructor for a planner
+        :param searcher: IndexSearcher whose postings lookups, doc sets and clause matching are used
+        """
+        self.searcher = searcher
+
+    def plan(self, node):
+        """
+        Method to plan an expression tree
+        :param node: Root node of the tree (see BooleanQueryParser)
+        :return: tuple of the plan and the estimated no. of docs it matches
+        :raise QuerySyntaxError: If a NOT is not the operand of an AND with another operand to subtract it from
+        """
+
+        kind = node[0]
+        if kind == "term":
+            doc_freq = self.searcher.doc_freq(node[1])
+            return (node, doc_freq) if doc_freq else (EMPTY_PLAN, 0)
+
+        if kind == "wildcard":
+            return self.plan(("or", tuple(("term", term) for term in self.searcher.expand_wildcard(node[1]))))
+
+        if kind in ("phrase", "near"):
+            # A clause matches at most the docs of its rarest term
+            doc_freq = min(self.searcher.doc_freq(term) for term in node[1])
+            return (("clause", node), doc_freq) if doc_freq else (EMPTY_PLAN, 0)
+
+        if kind == "not":
+            raise QuerySyntaxError("NOT needs another operand of an AND to subtract its docs from")
+
+        if kind == "or":
+            plans = list()
+            estimate = 0
+            for child_plan, child_estimate in map(self.plan, node[1]):
+                if child_plan == EMPTY_PLAN:
+                    continue
+                plans.extend(child_plan[1] if child_plan[0] == "or" else (child_plan,))
+                estimate += child_estimate
+            if not plans:
+                return EMPTY_PLAN, 0
+            return plans[0] if len(plans) == 1 else ("or", tuple(plans)), estimate
+
+        # AND: the docs of the NOT operands are subtracted from the intersection of the others. Nested ANDs are
+        # flattened before planning, so that each of their operands is ordered with its own estimate.
+        positive_plans = list()
+        negative_plans = list()
+        for child in self.__and_operands(node):
+            if child[0] == "not":
+                child_plan, estimate = self.plan(child[1])
+                if child_plan != EMPTY_PLAN:
+                    negative_plans.append((child_plan, estimate))
+                continue
+
+            child_plan, estimate = self.plan(child)
+            if child_plan == EMPTY_PLAN:
+                # No doc has all the operands
+                return EMPTY_PLAN, 0
+            positive_plans.append((child_plan, estimate))
+
+        if not positive_plans:
+            raise QuerySyntaxError("NOT needs another operand of an AND to subtract its docs from")
+
+        positive_plans.sort(key=lambda plan_estimate: plan_estimate[1])
+        estimate = positive_plans[0][1]
+        plan = positive_plans[0][0] if len(positive_plans) == 1 else \
+            ("and", tuple(plan for plan, _ in positive_plans))
+
+        if negative_plans:
+            # The larger doc sets are subtracted first, as they are the likeliest to empty the result
+            negative_plans.sort(key=lambda plan_estimate: -plan_estimate[1])
+            plan = ("andnot", plan, tuple(plan for plan, _ in negative_plans))
+        return plan, estimate
+
+    @staticmethod
+    def __and_operands(node):
+        """
+        Helper method to get the operands of an AND node, with the operands of its nested ANDs in their place
+        :param node: ("and", children) node
+        :return: list of nodes
+        """
+        operands = list()
+        for child in node[1]:
+            operands.extend(QueryPlanner.__and_operands(child) if child[0] == "and" else (child,))
+        return operands
+
+    def execute(self, plan):
+        """
+        Method to get the docs matched by a plan. The operands of an AND or an ANDNOT are only looked up
+        while the docs matched so far are not empty, and the terms of an AND that are not in the doc set cache
+        are intersected on their postings lists.
+        :param plan: Plan (see plan)
+        :return: Doc set, None if the plan has phrase or NEAR clauses and the index has no positions
+        """
+
+        kind = plan[0]
+        if kind == "empty":
+            return SortedDocSet()
+
+        if kind == "term":
+            return self.searcher.term_doc_set(plan[1])
+
+        if kind == "clause":
+            clause_docs = self.searcher.match_clause(plan[1])
+            return doc_set(clause_docs) if clause_docs is not None else None
+
+        if kind == "or":
+            doc_sets = [self.execute(child_plan) for child_plan in plan[1]]
+            return union_doc_sets(doc_sets) if None not in doc_sets else None
+
+        if kind == "and":
+            docs, operand_plans = self.__execute_and_operand(plan[1][0]), plan[1][1:]
+        else:
+            docs, operand_plans = self.execute(plan[1]), plan[2]
+
+        for operand_plan in operand_plans:
+            if docs is None or len(docs) == 0:
+                break
+            if kind == "and":
+                operand_docs = self.__execute_and_operand(operand_plan)
+                docs = self.searcher.intersect_docs(docs, operand_docs) if operand_docs is not None else None
+            else:
+                operand_docs = self.execute(operand_plan)
+                docs = docs - operand_docs if operand_docs is not None else None
+
+        if docs is not None and not is_doc_set(docs):
+            docs = doc_set(docs)
+        return docs
+
+    def __execute_and_operand(self, plan):
+        """
+        Helper method to get the docs matched by an operand of an AND. A term not in the doc set cache is left
+        as its postings list, intersected with a cursor instead of being decoded in full.
+        :param plan: Plan of the operand
+        :return: Doc set or postings list, None if the plan has phrase or NEAR clauses and the index has no positions
+        """
+        return self.searcher.term_docs(plan[1]) if plan[0] == "term" else self.execute(plan)
+
+    @staticmethod
+    def scored_terms(plan):
+        """
+        Method to get the terms of a plan that add to the score of the docs it matches (the terms of its
+        ANDNOT operands are left out)
+        :param plan: Plan (see plan)
+        :return: set of terms
+        """
+        kind = plan[0]
+        if kind == "term":
+            return {plan[1]}
+        if kind == "clause":
+            return set(plan[1][1])
+        if kind == "andnot":
+            return QueryPlanner.scored_terms(plan[1])
+        if kind in ("and", "or"):
+            return set().union(*map(QueryPlanner.scored_terms, plan[1]))
+        return set()
@@ -5,10 +5,18 @@ Script containing classes to parse an entire Reuters collection
 import json
 import re
 import os
-from bs4 import BeautifulSoup
+import nltk
+from bisect import bisect_right
+from collections import OrderedDict
+from html.entities import html5
 from nltk import tokenize
 from nltk.corpus import stopwords
-from ..reuters_parser.porter_stemmer import PorterStemmer
+from ..reuters_parser.porter_stemmer import STEM_CACHE
+from ..token_stream import TokenStreamWriter
+
+# Ranges of the doc ids (NEWID) saved in each reut2-NNN.sgm file
+DOC_FILE_MAPPING_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "reuters-data",
+                                     "doc_id_file_mapping.json")
 
 # 30 most frequent words in English vocabulary
 STOP_WORDS_30 = ["the", "of", "to", "and", "a", "in", "is", "it", "you", "that", "he", "was", "for", "on", "are",
@@ -35,6 +43,59 @@ STOP_WORDS_30_MORE = STOP_WORDS_30 + ["but", "some", "what", "there", "we", "can
                                       "same", "mean",
                                       "differ", "move", "right", "boy", "old", "too", "does", "tell"]
 
+# Stop words as sets, for constant-time lookups
+STOP_WORDS_30_SET = frozenset(STOP_WORDS_30)
+STOP_WORDS_30_MORE_SET = frozenset(STOP_WORDS_30_MORE)
+
+# Tokens made only of punctuation, unicode escapes or tags
+PUNCTUATION_REGEXP = re.compile(r"^[,.:;+/\\]+$|^(\\u\d*)$|^(<.*>)$")
+
+# Tokens starting with a letter
+NO_DIGIT_REGEXP = re.compile(r"[a-zA-Z]+")
+
+# Query tokenizer (nearly always the same terms as nltk.word_tokenize once preprocessed, without sentence splitting):
+# separators are spaces, brackets, quotes, punctuation marks, ellipses and dashes, commas and colons unless before a digit
+QUERY_SEPARATOR_REGEXP = re.compile(r"(?:[\s()\[\]{}<>\"`;!?]|\.{2,}|-{2,}|,(?!\d)|:(?!\d))+")
+
+# Period ending the query, before closing brackets and quotes
+QUERY_FINAL_PERIOD_REGEXP = re.compile(r"([^.])\.([\])}>\"']*)\s*$")
+
+# Opening quotes split from the word after them, unless they start a contraction
+QUERY_OPENING_QUOTE_REGEXP = re.compile(r"^'(?!re|ve|ll|m|t|s|d|n)(?=\w)", re.IGNORECASE)
+
+# Contractions and closing quotes split from the word before them, e.g. company's -> company 's, don't -> do n't,
+# cannot -> can not
+QUERY_CLITIC_REGEXP = re.compile(r"^(.+?)((?:'[sSmMdD]|'ll|'LL|'re|'RE|'ve|'VE|n't|N'T|'))$|^([cC]an)(not)$")
+
+# Reuters SGML: articles, tags of the article, character and entity references (as read by html.parser)
+REUTERS_START_REGEXP = re.compile(r"<reuters[\s>]", re.IGNORECASE)
+REUTERS_END_REGEXP = re.compile(r"</reuters\s*>", re.IGNORECASE)
+REUTERS_TAG_REGEXP = re.compile(r"<reuters\b([^>]*)>", re.IGNORECASE)
+NEWID_REGEXP = re.compile(r"\bnewid\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+))", re.IGNORECASE)
+TAG_REGEXP = re.compile(r"</?[a-zA-Z][^>]*>")
+REFERENCE_REGEXP = re.compile(r"&#(?:([0-9]+)|[xX]([0-9a-fA-F]+))(?:;|(?=[^0-9a-fA-F]))|"
+                              r"&([a-zA-Z][-.a-zA-Z0-9]*)(?:;|(?=[^a-zA-Z0-9]))")
+
+# Category fields of an article, each a list of <D> values
+CATEGORY_FIELDS = ("topics", "places", "people", "orgs", "exchanges")
+CATEGORY_VALUE_REGEXP = re.compile(r"<d>(.*?)</d>", re.IGNORECASE | re.DOTALL)
+
+
+def element_regexp(tag_name):
+    """
+    Function to compile the regex of an element of the Reuters SGML (its start tag, content and end tag)
+    :param tag_name: Name of the tag
+    :return: compiled regex with the content as first group
+    """
+    return re.compile(r"<%s(?:\s[^>]*)?>(.*?)</%s\s*>" % (tag_name, tag_name), re.IGNORECASE | re.DOTALL)
+
+
+TEXT_REGEXP = element_regexp("text")
+TITLE_REGEXP = element_regexp("title")
+BODY_REGEXP = element_regexp("body")
+DATE_REGEXP = element_regexp("date")
+CATEGORY_REGEXPS = dict((field, element_regexp(field)) for field in CATEGORY_FIELDS)
+
 
 class Parser:
     """
@@ -56,12 +117,174 @@ class Parser:
         else:
             return parsed_docs
 
-    def parse_documents(self, file_text):
+    def parse_documents(self, file_text, with_categories=False):
         """
         Method to parse the documents in a file
         :param file_text: The file text
+        :param with_categories: True to add the topics, places, people, orgs and exchanges of the docs
         :return: dict containing the doc id and the corresponding data
         """
+        return list(self.iter_documents(file_text.splitlines(True), with_categories=with_categories))
+
+    def iter_documents(self, lines, with_categories=False):
+        """
+        Generator parsing the documents of a Reuters SGML file one at a time: only the lines of the current
+        article are kept in memory
+        :param lines: Iterable of the lines of the file (str, or bytes decoded as UTF-8 or else Windows-1252),
+        e.g. a file object
+        :param with_categories: True to add the topics, places, people, orgs and exchanges of the docs
+        :return: generator of dicts containing the doc id and the corresponding data
+        """
+
+        article_lines = None
+        for line in lines:
+            if isinstance(line, bytes):
+                try:
+                    line = line.decode("utf-8")
+                except UnicodeDecodeError:
+                    line = line.decode("windows-1252", "replace")
+
+            if article_lines is None:
+                article_start = REUTERS_START_REGEXP.search(line)
+                if not article_start:
+                    continue
+                article_lines = []
+                line = line[article_start.start():]
+
+            article_lines.append(line)
+            if REUTERS_END_REGEXP.search(line):
+                doc_info = self.parse_article("".join(article_lines), with_categories)
+                article_lines = None
+                if doc_info is not None:
+                    yield doc_info
+
+    def parse_article(self, article_text, with_categories=False):
+        """
+        Method to parse one article of the collection
+        :param article_text: SGML of the article, from its <REUTERS> start tag to its end tag
+        :param with_categories: True to add the topics, places, people, orgs and exchanges of the doc
+        :return: dict containing the doc id and the corresponding data, None if the article has no NEWID
+        """
+
+        doc_info = {}
+
+        # Get doc id
+        reuters_tag = REUTERS_TAG_REGEXP.match(article_text)
+        newid = NEWID_REGEXP.search(reuters_tag.group(1)) if reuters_tag else None
+        if newid and any(newid.groups()):
+            doc_info["id"] = self.__decode_text(next(value for value in newid.groups() if value is not None))
+        else:
+            return None
+
+        # Check if text is present for document
+        doc_text = TEXT_REGEXP.search(article_text)
+        if doc_text:
+            text_content = doc_text.group(1)
+
+            # Get title
+            find_title = TITLE_REGEXP.search(text_content)
+            if find_title:
+
+                doc_info["title"] = self.__stripped_text(find_title.group(1))
+
+                # Get body
+                find_body = BODY_REGEXP.search(text_content)
+                if find_body:
+                    doc_info["body"] = self.__stripped_text(find_body.group(1))
+
+            elif self.__single_string(text_content) is not None:
+                doc_info["body"] = self.__stripped_text(text_content)
+            else:
+                doc_info["title"] = doc_info["body"] = None
+
+        else:
+            doc_info["body"] = None
+
+        # Get doc date
+        doc_date = DATE_REGEXP.search(article_text)
+        if doc_date:
+            doc_info["date"] = self.__single_string(doc_date.group(1))
+
+        if with_categories:
+            for field in CATEGORY_FIELDS:
+                categories = CATEGORY_REGEXPS[field].search(article_text)
+                doc_info[field] = [self.__decode_text(value) for value in
+                                   CATEGORY_VALUE_REGEXP.findall(categories.group(1))] if categories else []
+
+        return doc_info
+
+    @staticmethod
+    def __decode_text(text):
+        """
+        Helper method to replace the character and entity references of a text as html.parser does
+        (character references below 256 are read as Windows-1252, unknown entities are kept as is)
+        :param text: Text without tags
+        :return: decoded text
+        """
+
+        def decode_reference(reference):
+            decimal_code, hex_code, entity_name = reference.groups()
+            if entity_name is not None:
+                character = html5.get(entity_name + ";")
+                return character if character is not None else "&" + entity_name
+
+            code = int(decimal_code) if decimal_code is not None else int(hex_code, 16)
+            character = None
+            if code < 256:
+                try:
+                    character = bytes([code]).decode("windows-1252")
+                except UnicodeDecodeError:
+                    pass
+            if not character:
+                try:
+                    character = chr(code)
+                except (ValueError, OverflowError):
+                    character = "\N{REPLACEMENT CHARACTER}"
+            return character
+
+        return REFERENCE_REGEXP.sub(decode_reference, text) if "&" in text else text
+
+    @staticmethod
+    def __stripped_text(content):
+        """
+        Helper method to join the stripped strings of an element, as ' '.join(element.stripped_strings)
+        :param content: SGML content of the element
+        :return: text of the element
+        """
+        stripped_strings = (Parser.__decode_text(string).strip() for string in TAG_REGEXP.split(content))
+        return ' '.join(string for string in stripped_strings if string)
+
+    @staticmethod
+    def __single_string(content):
+        """
+        Helper method to get the string of an element made of a single string, possibly inside nested elements
+        (as element.string)
+        :param content: SGML content of the element
+        :return: the string, None if the element has no string or many children
+        """
+
+        while True:
+            first_tag = TAG_REGEXP.search(content)
+            if first_tag is None:
+                return Parser.__decode_text(content) if content else None
+
+            # Only child element
+            if first_tag.start() > 0 or first_tag.group().startswith("</"):
+                return None
+            tag_name = re.match(r"<([a-zA-Z][^\s/>]*)", first_tag.group()).group(1)
+            only_child = element_regexp(re.escape(tag_name)).match(content)
+            if only_child is None or only_child.end() != len(content):
+                return None
+            content = only_child.group(1)
+
+    def parse_documents_soup(self, file_text):
+        """
+        Method to parse the documents in a file with BeautifulSoup (reference for parse_documents, which gives the
+        same docs without building the tree of the whole file)
+        :param file_text: The file text
+        :return: dict containing the doc id and the corresponding data
+        """
+        from bs4 import BeautifulSoup
 
         parsed_text = BeautifulSoup(file_text, "html.parser")
 
@@ -104,7 +327,8 @@ class Parser:
             # Get doc date
             doc_date = doc.find("date")
             if doc_date:
-                doc_info["date"] = doc_date.string
+                # Plain string, a NavigableString would hold on to the whole parse tree
+                doc_info["date"] = str(doc_date.string) if doc_date.string is not None else None
 
             docs.append(doc_info)
 
@@ -117,105 +341,221 @@ class Parser:
         :param process_settings: The settings for preprocessing
         :return: list of dict with doc ids and tokens
         """
+        return [{"id": doc.get("id"), "tokens": self.tokenize_doc(doc, process_settings)} for doc in parsed_docs]
+
+    @staticmethod
+    def tokenize_doc(doc, process_settings):
+        """
+        Method to tokenize and preprocess (based on passed settings) the title and body of a single parsed doc
+        :param doc: Doc parsed (dict)
+        :param process_settings: The settings for preprocessing
+        :return: list of tokens
+        """
 
-        docs_tokens_list = []
-        for doc in parsed_docs:
-            # tokenizer = tokenize.TweetTokenizer()
+        # tokenizer = tokenize.TweetTokenizer()
 
-            import nltk
-            title_tokens = nltk.word_tokenize(doc.get("title")) if doc.get("title") else []
-            body_tokens = nltk.word_tokenize(doc.get("body")) if doc.get("body") else []
+        title_tokens = nltk.word_tokenize(doc.get("title")) if doc.get("title") else []
+        body_tokens = nltk.word_tokenize(doc.get("body")) if doc.get("body") else []
 
-            doc_tokens = title_tokens + body_tokens
+        return Parser.preprocess_tokens(title_tokens + body_tokens, downcase=process_settings.get("downcase"),
+                                        no_digits=process_settings.get("no_digits"),
+                                        rule_of_thirty=process_settings.get("rule_of_thirty"),
+                                        stop_words_150=process_settings.get("stop_words_150"),
+                                        stemming=process_settings.get("stemming"),
+                                        min_no_char=process_settings.get("min_no_char", 2))
+
+    @staticmethod
+    def tokenize_query(query):
+        """
+        Method to tokenize a query without nltk: the period ending the query is split from the last word, the query
+        is split on separators in a single regex pass, then quotes and contractions are split from the words
+        :param query: The query text
+        :return: list of the query tokens
+        """
 
-            doc_tokens = Parser.preprocess_tokens(doc_tokens, downcase=process_settings.get("downcase"),
-                                                  no_digits=process_settings.get("no_digits"),
-                                                  rule_of_thirty=process_settings.get("rule_of_thirty"),
-                                                  stop_words_150=process_settings.get("stop_words_150"),
-                                                  stemming=process_settings.get("stemming"),
-                                                  min_no_char=process_settings.get("min_no_char", 2))
+        tokens = []
+        for token in QUERY_SEPARATOR_REGEXP.split(QUERY_FINAL_PERIOD_REGEXP.sub(r"\1 . \2", query)):
+            if not token:
+                continue
 
-            docs_tokens_list.append({"id": doc.get("id"), "tokens": doc_tokens})
+            if QUERY_OPENING_QUOTE_REGEXP.match(token):
+                tokens.append("'")
+                token = token[1:]
 
-        return docs_tokens_list
+            clitic_match = QUERY_CLITIC_REGEXP.match(token)
+            if clitic_match:
+                tokens.extend(part for part in clitic_match.groups() if part is not None)
+            else:
+                tokens.append(token)
+
+        return tokens
 
     @staticmethod
     def preprocess_tokens(tokens, downcase=True, no_digits=True, rule_of_thirty=True, stop_words_150=False,
                           stemming=True, min_no_char=2):
+        """
+        Method to preprocess tokens with the options passed
+        :param tokens: Iterable of tokens
+        :param downcase: True to downcase the tokens
+        :param no_digits: True to remove the tokens not starting with a letter
+        :param rule_of_thirty: True to remove the 30 most frequent words
+        :param stop_words_150: True to remove the 150 most frequent words
+        :param stemming: True to stem the tokens with the Porter stemmer (memoized in the shared stem cache)
+        :param min_no_char: Tokens must be longer than this no. of characters (0 to keep all)
+        :return: list of tokens
+        """
+        return list(Parser.iter_preprocessed_tokens(tokens, downcase=downcase, no_digits=no_digits,
+                                                    rule_of_thirty=rule_of_thirty, stop_words_150=stop_words_150,
+                                                    stemming=stemming, min_no_char=min_no_char))
+
+    @staticmethod
+    def iter_preprocessed_tokens(tokens, downcase=True, no_digits=True, rule_of_thirty=True, stop_words_150=False,
+                                 stemming=True, min_no_char=2):
+        """
+        Generator preprocessing tokens in a single pass: each enabled option is applied to a token in turn
+        (same options and results as preprocess_tokens)
+        :param tokens: Iterable of tokens
+        :return: generator of tokens
+        """
+
+        punctuation_match = PUNCTUATION_REGEXP.match
+        no_digit_match = NO_DIGIT_REGEXP.match
 
-        final_tokens = tokens
+        # The 150 stop words include the 30 ones
+        stop_words = STOP_WORDS_30_MORE_SET if stop_words_150 else STOP_WORDS_30_SET if rule_of_thirty else None
 
-        # Remove punctuation
-        punctuation_regexp = re.compile(r"^[,.:;+/\\]+$|^(\\u\d*)$|^(<.*>)$")
-        final_tokens = list(filter(lambda token: not punctuation_regexp.match(token), final_tokens))
+        stem = STEM_CACHE.stem if stemming else None
 
-        # Downcase tokens
-        if downcase:
-            final_tokens = list(map(lambda token: token.lower(), final_tokens))
+        for token in tokens:
 
-        # Remove digits
-        if no_digits:
-            no_digit_regexp = re.compile(r"[a-zA-Z]+")
-            final_tokens = list(filter(lambda token: no_digit_regexp.match(token), final_tokens))
+            # Remove punctuation
+            if punctuation_match(token):
+                continue
+
+            # Downcase tokens
+            if downcase:
+                token = token.lower()
 
-        # Remove 30 stop words
-        if rule_of_thirty:
-            final_tokens = [token for token in final_tokens if token not in STOP_WORDS_30]
+            # Remove digits
+            if no_digits and not no_digit_match(token):
+                continue
 
-        # Remove 150 stop words
-        if stop_words_150:
-            final_tokens = [token for token in final_tokens if token not in STOP_WORDS_30_MORE]
+            # Remove stop words
+            if stop_words is not None and token in stop_words:
+                continue
 
-        # Stemming
-        if stemming:
-            stemmer = PorterStemmer()
-            final_tokens = list(map(lambda token: stemmer.stem(token, 0, len(token) - 1), final_tokens))
+            # Stemming
+            if stem is not None:
+                token = stem(token)
 
-        # More than one character
-        if min_no_char > 0:
-            final_tokens = list(filter(lambda token: len(token) > min_no_char, final_tokens))
+            # More than one character
+            if min_no_char > 0 and len(token) <= min_no_char:
+                continue
 
-        return final_tokens
+            yield token
 
 
 class CollectionParser:
-    def __init__(self, process_settings=None):
+    def __init__(self, process_settings=None, keep_docs=False, with_categories=False):
         self.doc_count = 0
         self.token_count = 0
         self.collection_doc_tokens = []
         self.process_settings = process_settings if process_settings is not None else dict()
 
-    def parse_collection(self, token_stream_path, no_docs=2):
+        # Parsed docs (id, title, body, date) of the files, kept to build the doc store, with their topics, places,
+        # people, orgs and exchanges if asked (to build the facet index)
+        self.keep_docs = keep_docs
+        self.with_categories = with_categories
+        self.collection_docs = []
+
+    def parse_collection(self, token_stream_path=None, no_docs=2, save_collection=False):
+        """
+        Generator parsing the first collection files and yielding their <term, doc_id> pairs lazily.
+        The token stream is saved in the binary format of TokenStreamWriter as the pairs are yielded, if asked.
+        The collection.json debug dump is only written if asked, once all the pairs were consumed, as it needs
+        the tokens of every doc to be kept in memory.
+        :param token_stream_path: Path where to save the token stream, without extension (None to skip it)
+        :param no_docs: No. of collection files to parse
+        :param save_collection: True to save the tokens of each doc to dict_parsed/collection.json
+        :return: generator of <term, doc_id> tuples
+        """
+
+        token_stream = self.iter_token_stream(range(no_docs), keep_tokens=save_collection)
+        if token_stream_path is None:
+            for token_pair in token_stream:
+                yield token_pair
+        else:
+            try:
+                token_stream_writer = TokenStreamWriter(token_stream_path, self.process_settings)
+            except (OSError, IOError):
+                print("Unable to write token stream to disk")
+                exit(1)
+
+            with token_stream_writer:
+                for token_pair in token_stream_writer.tee(token_stream):
+                    yield token_pair
+
+        print("Total no. of docs parsed: %d" % self.doc_count)
+        print("Total no. of tokens: %d" % self.token_count)
+
+        if save_collection:
+            self.write_collec_disk()
+
+    def parse_files(self, file_nos):
+        """
+        Method to parse a subset of the collection files and keep the tokens of their docs (and the docs if asked)
+        :param file_nos: Nos. of the reut2-NNN.sgm files to parse
+        :return: None
+        """
+        self.collection_doc_tokens += self.iter_doc_tokens(file_nos)
+
+    def iter_token_stream(self, file_nos, keep_tokens=False):
+        """
+        Generator of the <term, doc_id> pairs of a subset of the collection files, parsed and tokenized one doc
+        at a time so that memory does not grow with the no. of files (unless the docs or tokens are kept)
+        :param file_nos: Nos. of the reut2-NNN.sgm files to parse
+        :param keep_tokens: True to also keep the tokens of each doc in collection_doc_tokens
+        :return: generator of <term, doc_id> tuples
+        """
+        for doc_tokens in self.iter_doc_tokens(file_nos):
+            if keep_tokens:
+                self.collection_doc_tokens.append(doc_tokens)
+
+            doc_id = doc_tokens.get("id")
+            for token in doc_tokens.get("tokens"):
+                yield token, doc_id
+
+    def iter_doc_tokens(self, file_nos):
+        """
+        Generator of the tokens of each doc of a subset of the collection files, the files being read line by line.
+        The no. of docs and tokens are counted as the docs are yielded (and the docs kept if asked).
+        :param file_nos: Nos. of the reut2-NNN.sgm files to parse
+        :return: generator of dict with doc id and tokens
+        """
 
         collection_path = os.path.join(os.path.abspath(os.path.dirname(__file__)), "reuters-data",
                                        "reut2-%03d.sgm")
 
         parser = Parser()
 
-        for i in range(no_docs):
+        for i in file_nos:
 
             try:
-                with open(collection_path % i, "r") as reuters_file:
-                    file_tokens = parser.parse_file(reuters_file.read(), process_settings=self.process_settings)
+                reuters_file = open(collection_path % i, "rb")
             except (OSError, IOError):
                 print("Unable to open collection files no. %d" % i)
                 exit(1)
-            else:
-                self.doc_count += len(file_tokens)
-
-                for doc in file_tokens:
-                    self.token_count += len(doc.get("tokens"))
 
-                self.collection_doc_tokens += file_tokens
+            with reuters_file:
+                for doc in parser.iter_documents(reuters_file, with_categories=self.with_categories):
+                    if self.keep_docs:
+                        self.collection_docs.append(doc)
 
-        self.write_collec_disk()
-
-        print("Total no. of docs parsed: %d" % self.doc_count)
-        print("Total no. of tokens: %d" % self.token_count)
+                    doc_tokens = parser.tokenize_doc(doc, self.process_settings)
+                    self.doc_count += 1
+                    self.token_count += len(doc_tokens)
 
-        token_stream = self.get_token_stream()
-        self.save_token_stream(token_stream, token_stream_path)
-        return token_stream
+                    yield {"id": doc.get("id"), "tokens": doc_tokens}
 
     def write_collec_disk(self):
 
@@ -238,10 +578,74 @@ class CollectionParser:
         return token_stream
 
     def save_token_stream(self, token_stream, path):
+        """
+        Method to save a token stream in the binary format of TokenStreamWriter, pair by pair
+        :param token_stream: Iterable of <term, doc_id> pairs
+        :param path: Path of the token stream, without extension
+        :return: None
+        """
 
         try:
-            with open(path, "w+") as reuters_file:
-                reuters_file.writelines(str(token_stream))
+            with TokenStreamWriter(path, self.process_settings) as token_stream_writer:
+                token_stream_writer.add_pairs(token_stream)
         except (OSError, IOError):
             print("Unable to write token stream to disk")
             exit(1)
+
+
+class DocFileMapping:
+    """
+    Class mapping doc ids to the no. of the collection file they are saved in.
+    The ranges of doc ids are loaded once and kept sorted, so that a doc id is resolved with a binary search.
+    """
+
+    def __init__(self, mapping_path=DOC_FILE_MAPPING_PATH):
+        """
+        Constructor loading the ranges of doc ids of the files
+        :param mapping_path: Path to the JSON list of {"range": [first doc id, last doc id], "file_no": file no.}
+        """
+        self.range_starts = []
+        self.range_ends = []
+        self.file_nos = []
+
+        try:
+            with open(mapping_path, "r") as mapping_file:
+                doc_map = json.load(mapping_file)
+        except (OSError, IOError):
+            print("Unable to load doc id to file mapping")
+            return
+
+        for mapping in sorted(doc_map, key=lambda file_mapping: file_mapping.get("range")[0]):
+            range_doc = mapping.get("range")
+            self.range_starts.append(range_doc[0])
+            self.range_ends.append(range_doc[len(range_doc) - 1])
+            self.file_nos.append(mapping.get("file_no"))
+
+    def get_file_no(self, doc_id):
+        """
+        Method to get the file no. of a doc
+        :param doc_id: Doc id
+        :return: The file no., None if the doc id is in no range (both ends of a range included)
+        """
+        range_idx = bisect_right(self.range_starts, doc_id) - 1
+        if range_idx >= 0 and doc_id <= self.range_ends[range_idx]:
+            return self.file_nos[range_idx]
+        return None
+
+    def group_by_file(self, doc_ids):
+        """
+        Method to group a list of doc ids by file in a single pass
+        :param doc_ids: Doc ids to group
+        :return: OrderedDict of file no. -> list of its doc ids, in order of first appearance in the list passed
+        """
+        doc_id_file_no = OrderedDict()
+        for doc_id in doc_ids:
+            file_no = self.get_file_no(doc_id)
+            if file_no is None:
+                continue
+
+            if file_no in doc_id_file_no:
+                doc_id_file_no[file_no].append(doc_id)
+            else:
+                doc_id_file_no[file_no] = [doc_id]
+        return doc_id_file_no
@@ -27,6 +27,13 @@ to:
 release 2: July 2008
 """
 
+import os
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
 
 class PorterStemmer:
 
@@ -340,3 +347,85 @@ class PorterStemmer:
         self.step5()
         return self.b[self.k0:self.k+1]
 
+
+# Extension of the stem table saved next to the index
+STEM_TABLE_EXT = ".stems"
+
+# Max no. of surface forms kept in a stem cache
+STEM_CACHE_SIZE = 200000
+
+
+class StemCache:
+    """
+    Memo table of the Porter stems of surface forms. Once full, the oldest surface forms are evicted first.
+    The table can be saved next to the index so that stemming a query is a dictionary lookup. A word missing
+    from the table is stemmed on demand, to the same stem it was indexed with.
+    """
+
+    def __init__(self, max_entries=STEM_CACHE_SIZE):
+        """
+        Constructor for an empty stem cache
+        :param max_entries: Max no. of surface forms kept
+        """
+        self.max_entries = max_entries
+        self.stemmer = PorterStemmer()
+        self.stems = dict()
+
+    def __len__(self):
+        return len(self.stems)
+
+    def stem(self, word):
+        """
+        Method to get the stem of a lower case word
+        :param word: The word
+        :return: The stem of the word
+        """
+        word_stem = self.stems.get(word)
+        if word_stem is None:
+            word_stem = self.stemmer.stem(word, 0, len(word) - 1)
+            if len(self.stems) >= self.max_entries:
+                del self.stems[next(iter(self.stems))]
+            self.stems[word] = word_stem
+        return word_stem
+
+    def update(self, stems):
+        """
+        Method to add a table of stems to the cache (e.g. learned by another process). The cache grows to hold
+        all of them, so that the table saved after merging the stems of many processes covers their vocabulary.
+        :param stems: dict of surface form -> stem
+        :return: None
+        """
+        for word, word_stem in stems.items():
+            self.stems.setdefault(word, word_stem)
+        self.max_entries = max(self.max_entries, len(self.stems))
+
+    def save(self, path):
+        """
+        Method to save the stem table, replacing the previous one atomically
+        :param path: Path of the stem table
+        :return: True if the table was saved, False otherwise
+        """
+        try:
+            with open(path + ".tmp", "wb") as stems_file:
+                pickle.dump(obj=self.stems, file=stems_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + ".tmp", path)
+        except (IOError, OSError):
+            return False
+        return True
+
+    def load(self, path):
+        """
+        Method to add a saved stem table to the cache
+        :param path: Path of the stem table
+        :return: True if the table was loaded, False otherwise
+        """
+        try:
+            with open(path, "rb") as stems_file:
+                self.update(pickle.load(stems_file))
+        except (IOError, OSError):
+            return False
+        return True
+
+
+# Stem cache shared by all the docs and batches parsed by a process
+STEM_CACHE = StemCache()
@@ -0,0 +1,208 @@
+"""
+Script containing the binary format of a token stream, so that the index can be built again (e.g. with another
+block size) without parsing the collection files again.
+The token stream is saved as files sharing the same prefix:
+- <prefix>.tok: the (term id, doc id) records of the pairs one after the other, as native unsigned ints,
+  appended as the pairs are written and memory-mapped to read them back
+- <prefix>.tdict: the term dictionary (term of each term id, in order of first appearance) with the
+  preprocessing settings of the tokens and the no. of records, pickled once all the pairs were written
+"""
+
+import mmap
+import os
+from array import array
+
+try:
+    import cPickle as pickle
+except:
+    import pickle
+
+# Extensions of the records and term dictionary files
+TOKEN_RECORDS_EXT = ".tok"
+TOKEN_DICT_EXT = ".tdict"
+
+# Version of the token stream format, saved in the term dictionary
+TOKEN_STREAM_FORMAT_VERSION = 1
+
+# Term ids and doc ids are saved as native unsigned ints of this type code
+TOKEN_RECORD_TYPECODE = "I"
+
+# No. of pairs buffered before being appended to the records file
+TOKEN_BUFFER_PAIRS = 65536
+
+
+def token_stream_exists(token_stream_prefix):
+    """
+    Function to check if a token stream was saved with the prefix passed
+    :param token_stream_prefix: Path of the token stream without extension
+    :return: True if the records and term dictionary files exist, False otherwise
+    """
+    return all(os.path.exists(token_stream_prefix + extension) for extension in (TOKEN_RECORDS_EXT, TOKEN_DICT_EXT))
+
+
+class TokenStreamWriter:
+    """
+    Class to write a token stream incrementally: terms get an id the first time they are seen and each pair is
+    saved as a fixed-size (term id, doc id) record
+    """
+
+    def __init__(self, token_stream_prefix, process_settings=None):
+        """
+        Constructor opening the records file of the token stream
+        :param token_stream_prefix: Path of the token stream without extension
+        :param process_settings: Settings the tokens were preprocessed with, saved with the term dictionary
+        """
+        self.token_stream_prefix = token_stream_prefix
+        self.process_settings = dict(process_settings) if process_settings is not None else dict()
+        self.records_file = open(token_stream_prefix + TOKEN_RECORDS_EXT, "wb")
+
+        # Term -> term id, and term of each term id
+        self.term_ids = dict()
+        self.terms = list()
+
+        self.buffer = array(TOKEN_RECORD_TYPECODE)
+        self.no_records = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # The term dictionary is only saved if all the pairs were written
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def add_pair(self, term, doc_id):
+        """
+        Method to append a <term, doc_id> pair
+        :param term: Term
+        :param doc_id: Doc id (int or string of an int)
+        :return: None
+        """
+
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.terms)
+            self.terms.append(term)
+
+        self.buffer.append(term_id)
+        self.buffer.append(int(doc_id))
+        self.no_records += 1
+
+        if len(self.buffer) >= 2 * TOKEN_BUFFER_PAIRS:
+            self.__flush()
+
+    def add_pairs(self, token_pairs):
+        """
+        Method to append many pairs
+        :param token_pairs: Iterable of <term, doc_id> pairs
+        :return: None
+        """
+        for term, doc_id in token_pairs:
+            self.add_pair(term, doc_id)
+
+    def tee(self, token_pairs):
+        """
+        Generator appending the pairs passed as they are consumed, to save a token stream while it is inverted
+        :param token_pairs: Iterable of <term, doc_id> pairs
+        :return: generator of the same pairs
+        """
+        for token_pair in token_pairs:
+            self.add_pair(token_pair[0], token_pair[1])
+            yield token_pair
+
+    def close(self):
+        """
+        Method to append the buffered records, close the records file and save the term dictionary
+        :return: None
+        """
+
+        if self.records_file.closed:
+            return
+
+        self.__flush()
+        self.records_file.close()
+
+        token_dict = {"version": TOKEN_STREAM_FORMAT_VERSION, "process_settings": self.process_settings,
+                      "no_records": self.no_records, "terms": self.terms}
+        with open(self.token_stream_prefix + TOKEN_DICT_EXT, "wb") as dict_file:
+            pickle.dump(token_dict, dict_file, pickle.HIGHEST_PROTOCOL)
+
+    def abort(self):
+        """
+        Method to close the records file without saving the term dictionary: the partial token stream is removed,
+        so that it is not read back as a complete one
+        :return: None
+        """
+        if self.records_file.closed:
+            return
+
+        self.records_file.close()
+        for extension in (TOKEN_RECORDS_EXT, TOKEN_DICT_EXT):
+            if os.path.exists(self.token_stream_prefix + extension):
+                os.remove(self.token_stream_prefix + extension)
+
+    def __flush(self):
+        """
+        Helper method to append the buffered records to the records file
+        :return: None
+        """
+        self.buffer.tofile(self.records_file)
+        del self.buffer[:]
+
+
+class TokenStreamReader:
+    """
+    Class to read a token stream back: the records are memory-mapped and the pairs are rebuilt lazily when iterated,
+    so that the reader can be passed as the token stream of IndexConstructor (as many times as needed)
+    """
+
+    def __init__(self, token_stream_prefix):
+        """
+        Constructor loading the term dictionary and mapping the records of the token stream
+        :param token_stream_prefix: Path of the token stream without extension
+        """
+        self.token_stream_prefix = token_stream_prefix
+
+        with open(token_stream_prefix + TOKEN_DICT_EXT, "rb") as dict_file:
+            token_dict = pickle.load(dict_file)
+
+        if token_dict.get("version") != TOKEN_STREAM_FORMAT_VERSION:
+            raise ValueError("Unsupported token stream format version: %s" % token_dict.get("version"))
+
+        self.terms = token_dict.get("terms")
+        self.process_settings = token_dict.get("process_settings")
+
+        self.records = memoryview(self.__map_file(token_stream_prefix + TOKEN_RECORDS_EXT)).cast(TOKEN_RECORD_TYPECODE)
+        if len(self.records) != 2 * token_dict.get("no_records"):
+            raise ValueError("Token stream records file is truncated")
+
+    def __len__(self):
+        return len(self.records) // 2
+
+    def __iter__(self):
+        return zip(map(self.terms.__getitem__, self.records[::2]), self.records[1::2])
+
+    def close(self):
+        """
+        Method to unmap the records file
+        :return: None
+        """
+        records_file = self.records.obj
+        self.records.release()
+
+        if isinstance(records_file, mmap.mmap):
+            records_file.close()
+
+    @staticmethod
+    def __map_file(path):
+        """
+        Helper method to memory-map a file in read-only mode
+        :param path: Path of the file
+        :return: mmap of the file (empty bytes if the file is empty)
+        """
+        with open(path, "rb") as file_obj:
+            if os.fstat(file_obj.fileno()).st_size > 0:
+                return mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        return b""
@@ -0,0 +1,131 @@
+"""
+Script containing the wildcard matching of the terms of a lexicon.
+A '*' in a query term matches any no. of characters: "petro*" is a range of the sorted lexicon, found with
+a prefix scan, while other patterns ("*ation", "ch*ck") are looked up in a k-gram index of the lexicon.
+The k-grams of the pattern (with '$' marking the start and end of the term) give the candidate terms, and the
+candidates are then checked against the whole pattern, as some of them only hold its k-grams in another order.
+"""
+
+import re
+from array import array
+from collections import defaultdict
+
+# Character matching any no. of characters in a query term
+WILDCARD = "*"
+
+# Length of the k-grams indexed, and character marking the start and end of a term in its k-grams
+KGRAM_LENGTH = 2
+KGRAM_BOUNDARY = "$"
+
+# Term ids of the postings of a k-gram are saved as native unsigned ints of this type code
+KGRAM_POSTINGS_TYPECODE = "I"
+
+
+def is_wildcard(term):
+    """
+    Function to check if a query term is a wildcard pattern
+    :param term: Query term
+    :return: True if the term holds a wildcard, False otherwise
+    """
+    return WILDCARD in term
+
+
+def wildcard_regexp(pattern):
+    """
+    Function to compile a wildcard pattern into a regex, to be matched against whole terms with fullmatch
+    :param pattern: Wildcard pattern
+    :return: Compiled regex
+    """
+    return re.compile(".*".join(re.escape(piece) for piece in pattern.split(WILDCARD)), re.DOTALL)
+
+
+def term_kgrams(term, k=KGRAM_LENGTH):
+    """
+    Function to get the k-grams of a term, with its start and end marked
+    :param term: The term
+    :param k: Length of the k-grams
+    :return: set of k-grams
+    """
+    term = KGRAM_BOUNDARY + term + KGRAM_BOUNDARY
+    return set(term[start:start + k] for start in range(len(term) - k + 1))
+
+
+def pattern_kgrams(pattern, k=KGRAM_LENGTH):
+    """
+    Function to get the k-grams every term matching a wildcard pattern holds: the k-grams of the parts
+    of the pattern between its wildcards
+    :param pattern: Wildcard pattern
+    :return: set of k-grams (empty if the parts of the pattern are all shorter than k)
+    """
+    kgrams = set()
+    for piece in (KGRAM_BOUNDARY + pattern + KGRAM_BOUNDARY).split(WILDCARD):
+        kgrams.update(piece[start:start + k] for start in range(len(piece) - k + 1))
+    return kgrams
+
+
+class KGramIndex:
+    """
+    Class holding the k-gram index of a lexicon: the sorted positions in the lexicon of the terms holding each k-gram
+    """
+
+    def __init__(self, terms, k=KGRAM_LENGTH):
+        """
+        Constructor indexing the k-grams of the terms of a lexicon
+        :param terms: Sorted iterable of the terms of the lexicon
+        :param k: Length of the k-grams
+        """
+        self.k = k
+
+        kgram_postings = defaultdict(lambda: array(KGRAM_POSTINGS_TYPECODE))
+        for term_idx, term in enumerate(terms):
+            for kgram in term_kgrams(term, k):
+                kgram_postings[kgram].append(term_idx)
+        self.kgram_postings = dict(kgram_postings)
+
+    def __len__(self):
+        return len(self.kgram_postings)
+
+    def candidates(self, pattern):
+        """
+        Method to get the terms holding all the k-grams of a wildcard pattern, intersecting the shortest lists first
+        :param pattern: Wildcard pattern
+        :return: Sorted positions in the lexicon of the candidate terms, None if the pattern has no k-gram
+        (every term is a candidate)
+        """
+
+        kgrams = pattern_kgrams(pattern, self.k)
+        if not kgrams:
+            return None
+
+        kgrams_postings = sorted((self.kgram_postings.get(kgram, ()) for kgram in kgrams), key=len)
+        term_idxs = set(kgrams_postings[0])
+        for postings in kgrams_postings[1:]:
+            if not term_idxs:
+                break
+            term_idxs.intersection_update(postings)
+        return sorted(term_idxs)
+
+
+def expand_wildcard(lexicon, pattern, kgram_index=None):
+    """
+    Function to get the terms of a lexicon matching a wildcard pattern
+    :param lexicon: FrontCodedLexicon of the terms
+    :param pattern: Wildcard pattern
+    :param kgram_index: KGramIndex of the lexicon (None to scan the terms sharing the prefix of the pattern)
+    :return: Sorted list of the terms matching the pattern
+    """
+
+    prefix = pattern.split(WILDCARD, 1)[0]
+    prefix_start, prefix_end = lexicon.prefix_range(prefix)
+
+    # A trailing wildcard matches the whole range of the prefix
+    if pattern.index(WILDCARD) == len(pattern) - 1:
+        return [term for _, term in lexicon.iter_range(prefix_start, prefix_end)]
+
+    regexp = wildcard_regexp(pattern)
+    candidates = kgram_index.candidates(pattern) if kgram_index is not None else None
+    if candidates is None:
+        terms = (term for _, term in lexicon.iter_range(prefix_start, prefix_end))
+    else:
+        terms = lexicon.iter_terms(term_idx for term_idx in candidates if prefix_start <= term_idx < prefix_end)
+    return [term for term in terms if regexp.fullmatch(term)]